@@ -1,16 +1,24 @@
 from app.base_classes.manager import BaseManager
+import asyncio
 import time
 import cv2
 from queue import Empty, Queue
 import threading
 
 from model_logic.base_classes.model_manager import ModelManager
+from model_logic.inference.replica_pool import ResultReorderer
 
 from utils.data_package.yolo_det_data_package import YoloDetectionDataPackage
 from mqtt_logic.mqtt_manager import MQTTManager
+from mqtt_logic.async_batcher import AsyncMqttBatcher
+from pipeline.async_engine import AsyncPipelineEngine
+from pipeline.engine import PipelineEngine, DEFAULT_STAGES
 from stream.stream_manager import StreamManager
 from utils.configs.config_manager import ConfigManager
-from utils.data_package.data_package_base import DataPackage
+from utils.data_package.change_filter import DetectionChangeFilter
+from utils.data_package.window_aggregator import WindowAggregator
+from utils.metrics.exporter import MetricsServer, StatsPublisher
+from utils.metrics.registry import REGISTRY
 from utils.configs.all_configs import AppManagerConfig, ModelManagerConfig, StreamManagerConfig, \
     MqttManagerConfig
 
@@ -38,6 +46,30 @@ class AppManager(BaseManager):
         self.mqtt_manager = MQTTManager()
         self.mqtt_manager_config = MqttManagerConfig()
 
+        # suppresses packages whose detections did not change, enabled with change_filter in the config
+        self.change_filter = None
+        # per class window summaries, enabled with aggregation in the config
+        self.aggregator = None
+        self.summary_topic = None
+        self.publish_packages = True
+        # packages captured more than max_package_age seconds ago are dropped before they are encoded and batched
+        self.max_package_age = None
+        self.dropped_stale = 0
+
+        # staged pipeline, replaces the stream/output threads when `pipeline` is set in the config
+        self.pipeline = None
+        # `runtime: asyncio` runs the pipeline, MQTT batching and the MQTT network loops on one event loop
+        self.runtime = "threads"
+        self.async_pipeline = None
+        self.async_batcher = None
+        self.event_loop = None
+        self.loop_thread = None
+        self._async_stop = None
+
+        # Prometheus endpoint and periodic MQTT stats, enabled with metrics in the config
+        self.metrics_server = None
+        self.stats_publisher = None
+
         self.inference_running = False
         self.detection_queue = Queue(maxsize=10)
         self.stream_thread = None
@@ -46,13 +78,27 @@ class AppManager(BaseManager):
     def run(self):
         # starts inference thread
             # self.start_threads()
-        self.start_inference()
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        if self.stats_publisher is not None:
+            self.stats_publisher.start()
+        if self.async_pipeline is not None:
+            self.inference_running = True
+            # the loop and the stop event exist before the thread starts so stop() can always signal them
+            self.event_loop = asyncio.new_event_loop()
+            self._async_stop = asyncio.Event()
+            self.loop_thread = threading.Thread(target=self._run_event_loop, daemon=True)
+            self.loop_thread.start()
+            return
+        if self.pipeline is not None:
+            self.inference_running = True
+            self.pipeline.start()
+        else:
+            self.start_inference()
         # starts mqtt client thread
         self.mqtt_manager.run()
-        # starts the mqtt pakcage send
-        self.mqtt_manager.start_batching(batch_size=10,
-                                         batch_interval=5,
-                                         get_data_fn=self.get_inference_data)
+        # starts the mqtt pakcage send, the batcher drains the detection queue directly
+        self.mqtt_manager.start_batching(self.detection_queue)
 
     def initialize(self, config_path):
         """
@@ -66,6 +112,76 @@ class AppManager(BaseManager):
         self.model_manager.initialize(self.model_manager_config)
         self.stream_manager.initialize(self.stream_manager_config)
         self.mqtt_manager.initialize(self.mqtt_manager_config, client_type='MqttSender')
+        self.max_package_age = self.config.get('max_package_age', self.max_package_age)
+        filter_config = self.config.get('change_filter')
+        if filter_config and filter_config.get('enabled', True):
+            self.change_filter = DetectionChangeFilter()
+            self.change_filter.populate_with_config(filter_config)
+        aggregation_config = self.config.get('aggregation')
+        if aggregation_config and aggregation_config.get('enabled', True):
+            self.aggregator = WindowAggregator(labels=self.model_manager.postprocessor.class_labels)
+            self.aggregator.populate_with_config(aggregation_config)
+            self.summary_topic = aggregation_config.get('topic')
+            # summaries can replace the per frame packages entirely
+            self.publish_packages = aggregation_config.get('publish_packages', self.publish_packages)
+        pipeline_config = self.config.get('pipeline') or {}
+        self.runtime = self.config.get('runtime', self.runtime)
+        if self.runtime == 'asyncio':
+            # see pipeline/async_engine.py, the pipeline stages default to DEFAULT_STAGES
+            self.async_pipeline = AsyncPipelineEngine(self, pipeline_config.get('stages') or DEFAULT_STAGES,
+                                                      executor_workers=pipeline_config.get('executor_workers'))
+        elif self.runtime != 'threads':
+            raise ValueError(f"Unsupported runtime: {self.runtime}")
+        elif pipeline_config and pipeline_config.get('enabled', True):
+            # see pipeline/engine.py for the stages and their settings
+            self.pipeline = PipelineEngine(self, pipeline_config.get('stages'))
+        metrics_config = self.config.get('metrics')
+        if metrics_config and metrics_config.get('enabled', True):
+            self.register_metrics()
+            self.metrics_server = MetricsServer(host=metrics_config.get('host', '127.0.0.1'),
+                                                port=metrics_config.get('port', 9108))
+            if metrics_config.get('stats_topic'):
+                self.stats_publisher = StatsPublisher(
+                    self.get_stats,
+                    lambda stats: self.mqtt_manager.publish_summary(stats, topic=metrics_config.get('stats_topic')),
+                    interval=metrics_config.get('stats_interval', 10.0))
+
+    def register_metrics(self, registry=REGISTRY):
+        """
+        Queue depth gauges and drop counters, read from the managers whenever the metrics are collected. The
+        stage latency histograms are recorded by the stages themselves.
+        """
+        def gauge(function, **labels):
+            registry.callback("queue_depth", function, help_text="Items waiting in a queue", **labels)
+
+        def dropped(function, **labels):
+            registry.callback("dropped_total", function, kind="counter",
+                              help_text="Frames and packages dropped before they were published", **labels)
+
+        stream_manager = self.stream_manager
+        gauge(stream_manager.output_queue.qsize, queue="stream_output")
+        gauge(self.detection_queue.qsize, queue="detection")
+        dropped(lambda: stream_manager.dropped_output, where="stream_output", reason="queue_full")
+        dropped(lambda: stream_manager.dropped_stale, where="stream", reason="stale")
+        dropped(lambda: self.dropped_stale, where="output", reason="stale")
+        for stream_source in stream_manager.sources:
+            source = f"source:{stream_source.source_id}"
+            gauge(lambda s=stream_source: s.get_stats().get("queue_depth", 0), queue=source)
+            dropped(lambda s=stream_source: s.get_stats().get("dropped", 0), where=source, reason="queue_full")
+        pipeline = self.pipeline or self.async_pipeline
+        for runner in pipeline.runners if pipeline is not None else []:
+            gauge(runner.queue_depth, queue=f"stage:{runner.name}")
+            dropped(lambda r=runner: r.dropped, where=f"stage:{runner.name}", reason="queue_full")
+            dropped(lambda r=runner: r.stale, where=f"stage:{runner.name}", reason="stale")
+            dropped(lambda r=runner: r.errors, where=f"stage:{runner.name}", reason="error")
+        mqtt_manager = self.mqtt_manager
+        dropped(lambda: mqtt_manager.batcher.dropped_items if mqtt_manager.batcher else 0,
+                where="mqtt_batcher", reason="backpressure")
+        dropped(lambda: getattr(mqtt_manager.batcher or self.async_batcher, "failed_items", 0),
+                where="mqtt_batcher", reason="publish_failed")
+        for name, mqtt_client in mqtt_manager.mqtt_clients.items():
+            dropped(lambda c=mqtt_client: c.tracker.dropped, where=f"mqtt:{name}", reason="refused")
+            dropped(lambda c=mqtt_client: c.tracker.timed_out, where=f"mqtt:{name}", reason="ack_timeout")
 
     def create_and_check_config_objects(self, config_path):
         """
@@ -105,17 +221,93 @@ class AppManager(BaseManager):
         """
         Process frames from the StreamManager and send to the output queue.
         """
+        frame_encoder = self.mqtt_manager.frame_encoder
+        # frames are encoded in the encoder's thread pool, packages are handed on in their original order
+        encoded = ResultReorderer()
         while self.running:
             try:
                 # Get annotated frames or data packages from the stream's output queue
-                data_package = self.stream_manager.output_queue.get(timeout=1)
-                # Push to the output queue for AppManager
-                self.detection_queue.put(data_package)
-
+                data_package = self.stream_manager.output_queue.get(timeout=1 if not len(encoded) else 0.01)
+                if self.aggregator is not None:
+                    # windows follow the capture time so queueing delays do not shift frames between windows
+                    self._publish_summaries(self.aggregator.add(data_package, now=data_package.capture_time))
+                # stale packages still count in the windows but are not worth encoding and sending
+                stale = self._is_stale(data_package)
+                self.dropped_stale += stale
+                # unchanged scenes are dropped before they are encoded or batched
+                publish = self.publish_packages and not stale and \
+                    (self.change_filter is None or self.change_filter.should_publish(data_package))
+                if publish and frame_encoder is None:
+                    # Push to the output queue for AppManager
+                    self.detection_queue.put(data_package)
+                elif publish:
+                    encoded.push(frame_encoder.submit(data_package))
             except Empty:
-                print("Output queue is empty.")
+                if self.aggregator is not None:
+                    # windows close on time even when no frames arrive
+                    self._publish_summaries(self.aggregator.advance())
+                if not len(encoded):
+                    print("Output queue is empty.")
             except Exception as e:
                 print(f"Error processing output: {e}")
+            for future, _, _ in encoded.pop_ready():
+                if future.exception() is not None:
+                    print(f"Error encoding frame: {future.exception()}")
+                    continue
+                self.detection_queue.put(future.result())
+
+    def _is_stale(self, data_package):
+        """
+        :return: True if the package was captured more than max_package_age seconds ago
+        """
+        if self.max_package_age is None:
+            return False
+        age = data_package.age()
+        return age is not None and age > self.max_package_age
+
+    def _run_event_loop(self):
+        asyncio.set_event_loop(self.event_loop)
+        try:
+            self.event_loop.run_until_complete(self.run_async())
+        finally:
+            self.event_loop.close()
+
+    async def run_async(self):
+        """
+        asyncio runtime: the pipeline stages, the MQTT batcher and the MQTT network loops share one event loop,
+        blocking stages run in the pipeline's thread pool. Runs until `stop` is called.
+        """
+        loop = asyncio.get_running_loop()
+        self.event_loop = loop
+        if self._async_stop is None:
+            self._async_stop = asyncio.Event()
+        await self.mqtt_manager.run_async(loop)
+        self.async_batcher = AsyncMqttBatcher(self.mqtt_manager.publish_routed,
+                                              max_items=self.mqtt_manager.batch_size,
+                                              max_bytes=self.mqtt_manager.max_batch_bytes,
+                                              max_delay_s=self.mqtt_manager.batch_interval)
+        self.async_batcher.start()
+        self.async_pipeline.start(loop)
+        window_task = loop.create_task(self._close_windows()) if self.aggregator is not None else None
+
+        await self._async_stop.wait()
+        if window_task:
+            window_task.cancel()
+        await self.async_pipeline.stop()
+        await self.async_batcher.stop()
+        await self.mqtt_manager.stop_async()
+
+    async def _close_windows(self):
+        """
+        Close aggregation windows on time, waking up once per window slide.
+        """
+        while True:
+            await asyncio.sleep(self.aggregator.slide - time.time() % self.aggregator.slide + 0.01)
+            self._publish_summaries(self.aggregator.advance())
+
+    def _publish_summaries(self, summaries):
+        for summary in summaries:
+            self.mqtt_manager.publish_summary(summary, topic=self.summary_topic)
 
     def stop(self):
         """
@@ -123,21 +315,45 @@ class AppManager(BaseManager):
         """
         self.running = False
         self.stream_manager.running = False
-        if self.stream_thread.is_alive():
+        if self.stats_publisher is not None:
+            self.stats_publisher.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.loop_thread is not None:
+            try:
+                self.event_loop.call_soon_threadsafe(self._async_stop.set)
+            except RuntimeError:
+                # run_async already returned, e.g. it failed on startup, and the loop is closed
+                pass
+            self.loop_thread.join()
+        self.loop_thread = None
+        self._async_stop = None
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        if self.stream_thread and self.stream_thread.is_alive():
             self.stream_thread.join()
-        if self.output_thread.is_alive():
+        if self.output_thread and self.output_thread.is_alive():
             self.output_thread.join()
+        self.model_manager.stop()
+        self.mqtt_manager.stop_batching()
 
-    def get_inference_data(self):
-        try:
-            data_package = self.detection_queue.get(timeout=1)
-            data_package = data_package.to_dict()
-            # just sending detections obejct for testing now
-            return data_package['detections']
-        except Empty:
-            print("Empty inference queue..")
-        return DataPackage.empty().to_dict()
-
+    def get_stats(self):
+        """
+        :return: stream, stage latency, pipeline, change filter, aggregation and MQTT metrics
+        """
+        stats = {"stream": self.stream_manager.get_stats(), "mqtt": self.mqtt_manager.get_stats(),
+                 "dropped_stale": self.dropped_stale,
+                 "stage_latency_s": REGISTRY.snapshot().get("stage_seconds", {})}
+        if self.pipeline is not None:
+            stats["pipeline"] = self.pipeline.get_stats()
+        if self.async_pipeline is not None:
+            stats["pipeline"] = self.async_pipeline.get_stats()
+            stats["mqtt"]["async_batcher"] = self.async_batcher.get_stats() if self.async_batcher else {}
+        if self.aggregator is not None:
+            stats["aggregation"] = self.aggregator.get_stats()
+        if self.change_filter is not None:
+            stats["change_filter"] = self.change_filter.get_stats()
+        return stats
 
     def display_stream(self):
         """
@@ -153,7 +369,7 @@ class AppManager(BaseManager):
                 # Use the test frame if provided
                 frame = self.detection_queue.get(timeout=1)
                 if isinstance(frame, YoloDetectionDataPackage):
-                    frame = frame.frame
+                    frame = frame.get_annotated_frame()
 
                 if frame is None:
                     print("Frame read failed, skipping frame.")
@@ -0,0 +1,100 @@
+"""
+Micro-benchmark of the NumPy NMS in model_logic.yolo.postprocessing.nms against the ultralytics NMS.
+
+Usage:
+    python -m benchmarks.nms_benchmark [recorded_output.npy ...]
+
+Each .npy file is a raw YOLO head output, e.g. saved with np.save from YoloNcnnNativeModel.predict.
+Without files a synthetic yolo11n sized head (84 x 8400) is used. The ultralytics comparison is skipped
+when ultralytics/torch are not installed.
+"""
+import sys
+import time
+
+import numpy as np
+
+from model_logic.yolo.postprocessing.nms import postprocess_yolo_head
+
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.45
+MAX_DETECTIONS = 300
+REPEATS = 50
+
+
+def synthetic_output(num_classes=80, num_anchors=8400, num_objects=30, seed=0):
+    """Raw head with a few clusters of overlapping boxes on top of low scoring noise."""
+    rng = np.random.default_rng(seed)
+    output = np.zeros((4 + num_classes, num_anchors), dtype=np.float32)
+    output[0:2] = rng.uniform(0, 640, (2, num_anchors))
+    output[2:4] = rng.uniform(8, 200, (2, num_anchors))
+    output[4:] = rng.uniform(0, 0.1, (num_classes, num_anchors))
+    for anchor_start in rng.choice(num_anchors - 20, num_objects, replace=False):
+        cluster = slice(anchor_start, anchor_start + 20)
+        output[0:4, cluster] = output[0:4, anchor_start:anchor_start + 1] + rng.normal(0, 4, (4, 20))
+        output[4 + rng.integers(num_classes), cluster] = rng.uniform(0.3, 0.95, 20)
+    return output[np.newaxis]
+
+
+def time_call(function, repeats=REPEATS):
+    function()
+    started = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return (time.perf_counter() - started) / repeats * 1000, result
+
+
+def run_numpy(output):
+    return postprocess_yolo_head(output, CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD,
+                                 max_detections=MAX_DETECTIONS)
+
+
+def load_ultralytics_nms():
+    try:
+        import torch
+        from ultralytics.utils.ops import non_max_suppression
+    except ImportError:
+        return None
+
+    def run_ultralytics(output):
+        detections = non_max_suppression(torch.from_numpy(output), conf_thres=CONF_THRESHOLD,
+                                         iou_thres=IOU_THRESHOLD, max_det=MAX_DETECTIONS)[0].numpy()
+        return detections[:, :4], detections[:, 4], detections[:, 5].astype(np.int64)
+
+    return run_ultralytics
+
+
+def compare(numpy_result, ultralytics_result):
+    """
+    :return: (same detections, max box difference) matching boxes by class and score order
+    """
+    numpy_boxes, numpy_scores, numpy_classes = numpy_result
+    ultra_boxes, ultra_scores, ultra_classes = ultralytics_result
+    if len(numpy_scores) != len(ultra_scores):
+        return False, float("inf")
+    numpy_order = np.lexsort((-numpy_scores, numpy_classes))
+    ultra_order = np.lexsort((-ultra_scores, ultra_classes))
+    same_classes = np.array_equal(numpy_classes[numpy_order], ultra_classes[ultra_order])
+    box_difference = float(np.abs(numpy_boxes[numpy_order] - ultra_boxes[ultra_order]).max(initial=0.0))
+    return same_classes and box_difference < 1e-2, box_difference
+
+
+def main(paths):
+    outputs = {path: np.load(path).astype(np.float32) for path in paths} or {"synthetic": synthetic_output()}
+    run_ultralytics = load_ultralytics_nms()
+    if run_ultralytics is None:
+        print("ultralytics/torch not installed, timing the NumPy NMS only.")
+
+    for name, output in outputs.items():
+        numpy_ms, numpy_result = time_call(lambda: run_numpy(output))
+        line = f"{name}: numpy {numpy_ms:.3f} ms, {len(numpy_result[1])} detections"
+        if run_ultralytics is not None:
+            ultra_ms, ultra_result = time_call(lambda: run_ultralytics(output))
+            same, box_difference = compare(numpy_result, ultra_result)
+            line += (f" | ultralytics {ultra_ms:.3f} ms, {len(ultra_result[1])} detections"
+                     f" | speedup {ultra_ms / numpy_ms:.2f}x | same results: {same}"
+                     f" (max box diff {box_difference:.4f})")
+        print(line)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
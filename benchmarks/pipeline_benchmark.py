@@ -0,0 +1,537 @@
+"""
+Offline benchmark of every processing stage in isolation and of the full AppManager pipeline.
+
+Usage:
+    python -m benchmarks.pipeline_benchmark [--output results.json] [--baseline baseline.json]
+        [--groups preprocess,model,postprocess,annotate,serialize,publish,app] [--frames image_or_video ...]
+        [--model-config model.yaml ...] [--app-config model_manager.yaml] [--repeats 50]
+    python -m benchmarks.pipeline_benchmark --results results.json --baseline baseline.json
+
+Stages run on synthetic frames and on recorded frames (model_logic/yolo/bus.jpg plus --frames) at every
+resolution in RESOLUTIONS; stages that get detections run at every density in DETECTION_DENSITIES. Model
+backends are loaded from the model configs (assets/configs/models/*.yaml by default), MQTT publishing and the
+AppManager run go through an in-process FakeBroker, the AppManager reads a video file written from the
+recorded frames.
+
+The output is JSON with p50/p95/p99/mean latency in ms, throughput per second and the peak RSS of the process
+after every case. Cases whose backend, model files or dependencies are missing are listed under `skipped`.
+With --baseline, cases whose p50 or p95 grew or whose throughput fell by more than --threshold are printed and
+the exit code is 1.
+"""
+import argparse
+import glob
+import importlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import supervision as sv
+import yaml
+
+from benchmarks.nms_benchmark import synthetic_output
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUS_IMAGE = os.path.join(REPO_ROOT, "model_logic", "yolo", "bus.jpg")
+MODEL_CONFIGS = os.path.join(REPO_ROOT, "assets", "configs", "models", "*.yaml")
+APP_MODEL_CONFIG = os.path.join(REPO_ROOT, "assets", "configs", "ultra_model_manager.yaml")
+
+GROUPS = ("preprocess", "model", "postprocess", "annotate", "serialize", "publish", "app")
+# name -> (height, width)
+RESOLUTIONS = {"480p": (480, 640), "720p": (720, 1280), "1080p": (1080, 1920)}
+DETECTION_DENSITIES = (0, 10, 100)
+REPEATS = 50
+WARMUP = 3
+BATCH_SIZE = 10
+NUM_CLASSES = 80
+
+# mirror ProcessorFactory and ModelFactory, imported one by one so a missing backend only skips its own cases
+PREPROCESSORS = {
+    # name -> (class path, argument of initialize)
+    "LetterboxPreprocessor": ("model_logic.yolo.preprocessing.letterbox_preprocessor.LetterboxPreprocessor",
+                              (640, 640)),
+    "YOLOPreprocessor": ("model_logic.yolo.preprocessing.yolo_preprocessor.YOLOPreprocessor", (1, 640, 640, 3)),
+}
+POSTPROCESSORS = {
+    # name -> (class path, kind of model output it decodes)
+    "YoloRawPostprocessor": ("model_logic.yolo.postprocessing.yolo_raw_postprocessor.YoloRawPostprocessor",
+                             "raw_head"),
+    "YOLOPostprocessor": ("model_logic.yolo.postprocessing.yolo_postprocessor.YOLOPostprocessor", "nms_rows"),
+}
+MODELS = {
+    "YoloModel": "model_logic.yolo.model.yolo_model.YOLOModel",
+    "YoloNCNNModel": "model_logic.yolo.model.yolo_ncnn_model.YoloNcnnModel",
+    "YoloNCNNNativeModel": "model_logic.yolo.model.yolo_ncnn_native_model.YoloNcnnNativeModel",
+}
+
+
+class Skipped(Exception):
+    """A case that can't run in this environment, the message says why."""
+
+
+def import_class(path):
+    module_path, class_name = path.rsplit(".", 1)
+    try:
+        return getattr(importlib.import_module(module_path), class_name)
+    except ImportError as e:
+        raise Skipped(f"import failed: {e}")
+
+
+def peak_rss_mb():
+    """
+    :return: peak resident set size of the process in MB, None where the resource module is missing
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(latencies_s, throughput, **extra):
+    latencies_ms = np.asarray(latencies_s, dtype=np.float64) * 1000
+    result = {
+        "iterations": int(len(latencies_ms)),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "mean_ms": float(latencies_ms.mean()),
+        "throughput_per_s": float(throughput),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    result.update(extra)
+    return result
+
+
+def measure(function, repeats=REPEATS, warmup=WARMUP):
+    """
+    Time `function` `repeats` times after `warmup` untimed calls.
+    :return: result dict, see summarize
+    """
+    for _ in range(warmup):
+        function()
+    samples = np.empty(repeats)
+    started = time.perf_counter()
+    for index in range(repeats):
+        start = time.perf_counter()
+        function()
+        samples[index] = time.perf_counter() - start
+    return summarize(samples, repeats / (time.perf_counter() - started))
+
+
+# inputs
+
+def synthetic_frame(shape, seed=0):
+    """Gradient background with filled rectangles, compresses more like a camera frame than noise does."""
+    rng = np.random.default_rng(seed)
+    height, width = shape
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[...] = np.linspace(40, 200, width, dtype=np.uint8)[np.newaxis, :, np.newaxis]
+    for _ in range(20):
+        x, y = int(rng.integers(0, width - 40)), int(rng.integers(0, height - 40))
+        color = tuple(int(value) for value in rng.integers(0, 255, 3))
+        cv2.rectangle(frame, (x, y), (x + int(rng.integers(20, 200)), y + int(rng.integers(20, 200))), color, -1)
+    return frame
+
+
+def load_recorded(paths):
+    """
+    :param paths: image or video files, the first frame of a video is used
+    :return: dict of name -> BGR frame
+    """
+    recorded = {}
+    for path in [BUS_IMAGE] + list(paths):
+        frame = cv2.imread(path)
+        if frame is None:
+            capture = cv2.VideoCapture(path)
+            ok, frame = capture.read()
+            capture.release()
+            if not ok:
+                print(f"Skipping unreadable frame source {path}", file=sys.stderr)
+                continue
+        recorded[os.path.splitext(os.path.basename(path))[0]] = frame
+    return recorded
+
+
+def frame_sets(recorded):
+    """
+    :return: list of (name, frame) with the synthetic and every recorded frame at every resolution
+    """
+    frames = []
+    for resolution, (height, width) in RESOLUTIONS.items():
+        frames.append((f"synthetic/{resolution}", synthetic_frame((height, width))))
+        for name, frame in recorded.items():
+            frames.append((f"{name}/{resolution}", cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)))
+    return frames
+
+
+def synthetic_detections(count, shape, seed=0):
+    rng = np.random.default_rng(seed)
+    height, width = shape
+    top_left = rng.uniform(0, 1, (count, 2)) * [width - 50, height - 50]
+    size = rng.uniform(20, 200, (count, 2))
+    xyxy = np.hstack([top_left, np.minimum(top_left + size, [width, height])]).astype(np.float32)
+    class_id = rng.integers(0, NUM_CLASSES, count)
+    return sv.Detections(xyxy=xyxy, confidence=rng.uniform(0.3, 0.95, count).astype(np.float32),
+                         class_id=class_id, tracker_id=np.arange(count),
+                         data={"class_name": np.array([f"class_{index}" for index in class_id])})
+
+
+def nms_rows(count, num_rows=300, seed=0):
+    """Output of an export with NMS built in, (1, rows, 6) normalized xyxy, confidence and class id."""
+    rng = np.random.default_rng(seed)
+    rows = np.zeros((1, num_rows, 6), dtype=np.float32)
+    top_left = rng.uniform(0, 0.8, (num_rows, 2))
+    rows[0, :, 0:2] = top_left
+    rows[0, :, 2:4] = top_left + rng.uniform(0.02, 0.2, (num_rows, 2))
+    rows[0, :, 4] = rng.uniform(0, 0.1, num_rows)
+    rows[0, :count, 4] = rng.uniform(0.3, 0.95, count)
+    rows[0, :, 5] = rng.integers(0, NUM_CLASSES, num_rows)
+    return [rows]
+
+
+# stage groups, each yields (case name, result dict) and raises Skipped for cases that can't run
+
+def bench_preprocess(frames, repeats):
+    for name, (path, input_shape) in PREPROCESSORS.items():
+        try:
+            preprocessor = import_class(path)()
+        except Skipped as e:
+            yield f"preprocess/{name}", e
+            continue
+        preprocessor.populate_with_config({})
+        preprocessor.initialize(input_shape) if input_shape is not None else preprocessor.initialize()
+        for frame_name, frame in frames:
+            yield f"preprocess/{name}/{frame_name}", measure(lambda: preprocessor.preprocess_image(frame), repeats)
+
+
+def bench_model(model_configs, repeats):
+    from utils.configs.config_manager import ConfigManager
+    frame = cv2.imread(BUS_IMAGE)
+    for config_path in model_configs:
+        case = f"model/{os.path.splitext(os.path.basename(config_path))[0]}"
+        try:
+            config = ConfigManager().create_config_object(config_path=config_path)
+            model_type = config.get("type")
+            if model_type not in MODELS:
+                raise Skipped(f"unknown model type {model_type}")
+            model = import_class(MODELS[model_type])()
+            preprocessor_name = config.get("preprocessor")
+            if preprocessor_name not in PREPROCESSORS:
+                raise Skipped(f"unknown preprocessor {preprocessor_name}")
+            preprocessor = import_class(PREPROCESSORS[preprocessor_name][0])()
+            preprocessor.populate_with_config(config)
+            model.initialize(config=config)
+            preprocessor.initialize()
+            model_input = preprocessor.preprocess_image(frame)
+            model_input = model_input[0] if isinstance(model_input, tuple) else model_input
+        except Skipped as e:
+            yield case, e
+            continue
+        except Exception as e:
+            yield case, Skipped(f"model did not load: {e}")
+            continue
+        yield f"{case}/{model_type}", measure(lambda: model.predict(model_input), repeats)
+
+
+def bench_postprocess(repeats):
+    from model_logic.yolo.preprocessing.letterbox_preprocessor import LetterboxPreprocessor
+    labels = [f"class_{index}" for index in range(NUM_CLASSES)]
+    letterbox = LetterboxPreprocessor()
+    letterbox.initialize((640, 640))
+    for name, (path, output_kind) in POSTPROCESSORS.items():
+        try:
+            postprocessor = import_class(path)()
+        except Skipped as e:
+            yield f"postprocess/{name}", e
+            continue
+        postprocessor.populate_with_config({})
+        postprocessor.initialize(labels)
+        for resolution, shape in RESOLUTIONS.items():
+            _, params = letterbox.preprocess_image(np.zeros(shape + (3,), dtype=np.uint8))
+            for density in DETECTION_DENSITIES:
+                if output_kind == "raw_head":
+                    output = synthetic_output(num_classes=NUM_CLASSES, num_objects=density)
+                    function = lambda: postprocessor.postprocess(output, params)
+                else:
+                    output = nms_rows(density)
+                    function = lambda: postprocessor.postprocess(output, (shape[1], shape[0]))
+                yield f"postprocess/{name}/{resolution}/{density}_objects", measure(function, repeats)
+
+
+def bench_annotate(frames, repeats):
+    from utils.factories.annotator_factory import AnnotatorFactory
+    for name, annotator_class in AnnotatorFactory().annotators.items():
+        annotator = annotator_class()
+        annotator.initialize()
+        for frame_name, frame in frames:
+            for density in DETECTION_DENSITIES:
+                detections = synthetic_detections(density, frame.shape[:2])
+                labels = list(detections.data["class_name"])
+                # the data package annotates a copy so the raw frame stays untouched
+                function = lambda: annotator.annotate_frame(scene=frame.copy(), detections=detections, labels=labels)
+                yield f"annotate/{name}/{frame_name}/{density}_objects", measure(function, repeats)
+
+
+def make_batch(frame, density, size=BATCH_SIZE):
+    from utils.data_package.yolo_det_data_package import YoloDetectionDataPackage
+    detections = synthetic_detections(density, frame.shape[:2])
+    batch = []
+    for seq in range(size):
+        data_package = YoloDetectionDataPackage(frame=frame, detections=detections, source_id="bench")
+        data_package.stamp(seq, time.time())
+        batch.append(data_package)
+    return batch
+
+
+def bench_serialize(frames, repeats):
+    from utils.factories.serializer_factory import SerializerFactory
+    recorded = [(frame_name, frame) for frame_name, frame in frames if frame_name.endswith("/720p")]
+    for frame_name, frame in recorded:
+        for density in DETECTION_DENSITIES:
+            suffix = f"{frame_name}/{density}_objects"
+            # fresh packages per call, the JPEG bytes are cached on the package
+            yield f"serialize/encode_jpeg/{suffix}", measure(
+                lambda: make_batch(frame, density, 1)[0].encode_frame_jpeg(), repeats)
+            yield f"serialize/to_dict/{suffix}", measure(lambda: make_batch(frame, density, 1)[0].to_dict(), repeats)
+            for format_name, serializer_class in SerializerFactory().serializers.items():
+                for include_frame in (False, True):
+                    try:
+                        serializer = serializer_class(include_frame=include_frame)
+                    except ImportError as e:
+                        yield f"serialize/{format_name}", Skipped(str(e))
+                        continue
+                    frame_suffix = "with_frame" if include_frame else "detections"
+                    function = lambda: serializer.serialize(make_batch(frame, density))
+                    yield f"serialize/{format_name}/{frame_suffix}/{suffix}", measure(function, repeats)
+
+
+def bench_publish(repeats):
+    from mqtt_logic.fake_broker import FakeBroker
+    from utils.configs.config_manager import ConfigManager
+    from utils.factories.mqtt_client_factory import MqttClientFactory
+    broker = FakeBroker().start()
+    frame = synthetic_frame(RESOLUTIONS["720p"])
+    try:
+        for payload_format in ("json", "binary"):
+            for qos in (0, 1):
+                config = ConfigManager().create_config_object(config_dict={
+                    "keys": {"host": "127.0.0.1", "port": broker.port, "topic": "bench/detections",
+                             "payload_format": payload_format, "qos": qos},
+                    "type": "MqttSender"})
+                mqtt_client = MqttClientFactory().clients["MqttSender"]()
+                mqtt_client.initialize(config)
+                mqtt_client.connect()
+                mqtt_client.loop_start()
+                batch = make_batch(frame, 10)
+                # publish until paho reports the message written (QoS 0) or acked (QoS 1)
+                result = measure(lambda: mqtt_client.publish(batch).result(timeout=5), repeats)
+                yield f"publish/{payload_format}/qos{qos}/batch_{BATCH_SIZE}", result
+                mqtt_client.disconnect()
+                mqtt_client.loop_stop()
+    finally:
+        broker.stop()
+
+
+def write_video(frame, path, frames=100, fps=30):
+    height, width = RESOLUTIONS["720p"]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    frame = cv2.resize(frame, (width, height))
+    for index in range(frames):
+        # shift the frame a little so consecutive frames differ
+        writer.write(np.roll(frame, index * 4, axis=1))
+    writer.release()
+
+
+def bench_app(app_model_config, recorded, timeout=120.0, idle_timeout=5.0, frames=100):
+    """
+    Run the AppManager on a video file until every frame was published, end to end latency is the capture to
+    publish age of the packages. Throughput counts the published frames only, dropped frames are reported.
+    """
+    from mqtt_logic.fake_broker import FakeBroker
+    from utils.metrics.registry import REGISTRY
+    try:
+        from app.app_manager import AppManager
+    except ImportError as e:
+        yield "app", Skipped(f"import failed: {e}")
+        return
+    if not os.path.isfile(app_model_config):
+        yield "app", Skipped(f"model manager config {app_model_config} not found")
+        return
+
+    broker = FakeBroker().start()
+    with tempfile.TemporaryDirectory() as directory:
+        video = os.path.join(directory, "bench.mp4")
+        write_video(next(iter(recorded.values())), video, frames=frames)
+        configs = {
+            "sender": {"keys": {"host": "127.0.0.1", "port": broker.port, "topic": "bench/detections",
+                                "payload_format": "binary"}, "type": "MqttSender"},
+            "stream": {"keys": {"stream_type": "file", "source": video, "latest_frame": False},
+                       "type": "StreamManager"},
+        }
+        paths = {}
+        for name, config in configs.items():
+            paths[name] = os.path.join(directory, f"{name}.yaml")
+            with open(paths[name], "w") as f:
+                yaml.safe_dump(config, f)
+        paths["mqtt"] = os.path.join(directory, "mqtt.yaml")
+        with open(paths["mqtt"], "w") as f:
+            yaml.safe_dump({"keys": {"sender": paths["sender"], "batch_size": BATCH_SIZE, "batch_interval": 0.5},
+                            "type": "MqttManager"}, f)
+        paths["app"] = os.path.join(directory, "app.yaml")
+        with open(paths["app"], "w") as f:
+            yaml.safe_dump({"keys": {"MqttManager": paths["mqtt"], "ModelManager": app_model_config,
+                                     "StreamManager": paths["stream"]}, "type": "AppManager"}, f)
+
+        try:
+            app_manager = AppManager()
+            app_manager.initialize(paths["app"])
+        except Exception as e:
+            broker.stop()
+            yield "app", Skipped(f"AppManager did not initialize: {e}")
+            return
+        REGISTRY.reset()
+        started = time.perf_counter()
+        app_manager.run()
+        age = app_manager.mqtt_manager.mqtt_client.package_age
+        try:
+            # frames dropped on a full queue never show up, stop once nothing was published for idle_timeout
+            deadline = time.monotonic() + timeout
+            published, last_change = 0, time.monotonic()
+            while published < frames and time.monotonic() < deadline and \
+                    time.monotonic() - last_change < idle_timeout:
+                time.sleep(0.1)
+                if age.count != published:
+                    published, last_change = age.count, time.monotonic()
+            elapsed = time.perf_counter() - started
+        finally:
+            app_manager.stop()
+            app_manager.mqtt_manager.stop()
+            broker.stop()
+
+    stages = REGISTRY.snapshot().get("stage_seconds", {})
+    if not age.count:
+        yield "app", Skipped("no package was published before the timeout")
+        return
+    result = {
+        "iterations": age.count,
+        "p50_ms": age.percentile(50) * 1000,
+        "p95_ms": age.percentile(95) * 1000,
+        "p99_ms": age.percentile(99) * 1000,
+        "mean_ms": age.mean * 1000,
+        "throughput_per_s": age.count / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "frames_dropped": frames - age.count,
+        "stages_ms": {stage: {key: value * 1000 if isinstance(value, float) else value
+                              for key, value in snapshot.items()}
+                      for stage, snapshot in stages.items() if snapshot["count"]},
+    }
+    yield f"app/file_720p/{frames}_frames", result
+
+
+def run(args):
+    recorded = load_recorded(args.frames)
+    frames = frame_sets(recorded)
+    benches = {
+        "preprocess": lambda: bench_preprocess(frames, args.repeats),
+        "model": lambda: bench_model(args.model_config or sorted(glob.glob(MODEL_CONFIGS)), args.repeats),
+        "postprocess": lambda: bench_postprocess(args.repeats),
+        "annotate": lambda: bench_annotate(frames, args.repeats),
+        "serialize": lambda: bench_serialize(frames, args.repeats),
+        "publish": lambda: bench_publish(args.repeats),
+        "app": lambda: bench_app(args.app_config, recorded),
+    }
+    results, skipped = {}, {}
+    for group in args.groups:
+        for case, result in benches[group]():
+            if isinstance(result, Skipped):
+                skipped[case] = str(result)
+                print(f"{case}: skipped, {result}", file=sys.stderr)
+                continue
+            results[case] = result
+            print(f"{case}: p50 {result['p50_ms']:.3f} ms, p99 {result['p99_ms']:.3f} ms, "
+                  f"{result['throughput_per_s']:.1f}/s", file=sys.stderr)
+    return {
+        "meta": {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "machine": platform.machine(), "numpy": np.__version__,
+                 "opencv": cv2.__version__, "repeats": args.repeats, "peak_rss_mb": peak_rss_mb()},
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    :param threshold: allowed relative change, 0.1 for 10%
+    :return: list of (case, metric, baseline value, current value) that regressed
+    """
+    regressions = []
+    for case, current in results["results"].items():
+        previous = baseline["results"].get(case)
+        if previous is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if previous[metric] and current[metric] > previous[metric] * (1 + threshold):
+                regressions.append((case, metric, previous[metric], current[metric]))
+        if previous["throughput_per_s"] and \
+                current["throughput_per_s"] < previous["throughput_per_s"] * (1 - threshold):
+            regressions.append((case, "throughput_per_s", previous["throughput_per_s"], current["throughput_per_s"]))
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", help="write the results JSON here instead of stdout")
+    parser.add_argument("--groups", default=",".join(GROUPS),
+                        type=lambda value: [group for group in value.split(",") if group],
+                        help=f"comma separated subset of {','.join(GROUPS)}")
+    parser.add_argument("--frames", nargs="*", default=[], help="recorded images or videos used next to bus.jpg")
+    parser.add_argument("--model-config", nargs="*", help="model configs to benchmark, default all in "
+                                                          "assets/configs/models")
+    parser.add_argument("--app-config", default=APP_MODEL_CONFIG, help="model manager config of the AppManager run")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="timed calls per case")
+    parser.add_argument("--results", help="compare an existing results JSON instead of running the benchmark")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args(argv)
+    unknown = set(args.groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.results:
+        with open(args.results) as f:
+            results = json.load(f)
+    else:
+        results = run(args)
+        output = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output)
+        else:
+            print(output)
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for case, metric, previous, current in regressions:
+        print(f"REGRESSION {case} {metric}: {previous:.3f} -> {current:.3f} "
+              f"({(current - previous) / previous * 100:+.1f}%)", file=sys.stderr)
+    compared = len(set(results["results"]) & set(baseline["results"]))
+    print(f"{compared} cases compared, {len(regressions)} regressions over {args.threshold * 100:.0f}%",
+          file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
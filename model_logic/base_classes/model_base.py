@@ -16,4 +16,13 @@ class ModelBase(ABC):
         :param image: Path to an image file or a NumPy array representing the image.
         :return: Predictions in human-readable format.
         """
-        pass
\ No newline at end of file
+        pass
+
+    def predict_batch(self, images):
+        """
+        Perform inference on a batch of preprocessed inputs. Models with native batch support should override
+        this, the default runs `predict` once per input.
+        :param images: batch array or list of model inputs.
+        :return: list with one raw result per input.
+        """
+        return [self.predict(images[index:index + 1])[0] for index in range(len(images))]
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from app.base_classes.manager import BaseManager
 from utils.configs.config_base import Config
 import numpy as np
@@ -5,6 +7,15 @@ import numpy as np
 from utils.data_package.yolo_det_data_package import YoloDetectionDataPackage
 from utils.factories.model_factory import ModelFactory
 from utils.factories.processor_factory import ProcessorFactory
+from model_logic.inference.micro_batcher import MicroBatcher
+from model_logic.inference.replica_pool import ReplicaPool
+from utils.metrics.registry import stage_timer
+
+PREPROCESS_TIME = stage_timer("preprocess")
+PREDICT_TIME = stage_timer("predict")
+POSTPROCESS_TIME = stage_timer("postprocess")
+PREPROCESS_BATCH_TIME = stage_timer("preprocess_batch")
+PREDICT_BATCH_TIME = stage_timer("predict_batch")
 
 
 class ModelManager(BaseManager):
@@ -14,12 +25,24 @@ class ModelManager(BaseManager):
         self.preprocessor = None
         self.postprocessor = None
         self.annotator = None
+        # annotation is rendered lazily by the data package, False skips creating the annotator entirely
+        self.annotate = True
         self.model_factory = ModelFactory()
         self.processor_factory = ProcessorFactory()
         self.model_config = None
         self.confidence_threshold = None
         self.model = None
         self.model_config_path = None
+        # micro batching, enabled when max_batch > 1
+        self.max_batch = 1
+        self.max_wait_ms = 5.0
+        self.batcher = None
+        # replica pool, enabled when replicas > 1
+        self.replicas = 1
+        self.replica_mode = "thread"
+        self.intra_op_threads = None
+        self.reorder_window = None
+        self.pool = None
 
     def initialize(self, config: Config):
         """
@@ -28,50 +51,174 @@ class ModelManager(BaseManager):
         :return:
         """
         self.apply_config(config)
+        if self.pool_enabled:
+            # the replicas load their own models, this manager only dispatches frames
+            self.pool = ReplicaPool(config.to_dict(), replicas=self.replicas,
+                                    replica_threads=self.intra_op_threads or 1, mode=self.replica_mode)
+            self.pool.start()
+            # labels only, read by the app's window aggregator
+            self.postprocessor.initialize(self.model_config.get("class_labels"))
+            return
         self.model.initialize(config=self.model_config)
         self.preprocessor.initialize()
         self.postprocessor.initialize(self.model_config.get("class_labels"))
-        self.annotator.initialize()
+        if self.annotator is not None:
+            self.annotator.initialize()
+        if self.batching_enabled:
+            self.batcher = MicroBatcher(self.run_batch, max_batch=self.max_batch, max_wait_ms=self.max_wait_ms)
+            self.batcher.start()
 
 
     def apply_config(self, config: Config):
         self.model_config_path = config.get("model_config_path")
+        self.max_batch = config.get("max_batch", self.max_batch)
+        self.max_wait_ms = config.get("max_wait_ms", self.max_wait_ms)
+        self.replicas = config.get("replicas", self.replicas)
+        self.replica_mode = config.get("replica_mode", self.replica_mode)
+        self.intra_op_threads = config.get("replica_threads", self.intra_op_threads)
+        self.reorder_window = config.get("reorder_window", self.reorder_window)
         # Creating Config object to be passed into our model object
         self.model_config = self.config_manager.create_config_object(config_path=self.model_config_path)
+        if self.intra_op_threads:
+            # models that support it (e.g. the native ncnn model) read their thread count from num_threads
+            self.model_config.set("num_threads", self.intra_op_threads)
         # Getting type of model from config
         self.model = self.model_factory.models[self.model_config.get("type")]()
         # setting pre and post processors
         # For now the prepocessing is handled by ultralytics. Delete if we don't need or only working with ultra
         self.preprocessor = self.processor_factory.processors[self.model_config.get("preprocessor")]()
+        self.preprocessor.populate_with_config(self.model_config)
         self.postprocessor = self.processor_factory.processors[self.model_config.get("postprocessor")]()
-        # setting annotator
-        self.annotator = self.annotator_factory.annotators[self.model_config.get("annotator")]()
+        self.postprocessor.populate_with_config(self.model_config)
+        # setting annotator, headless deployments can turn it off with `annotate: false` in the model config
+        self.annotate = self.model_config.get("annotate", self.annotate)
+        annotator_type = self.model_config.get("annotator")
+        self.annotator = self.annotator_factory.annotators[annotator_type]() \
+            if self.annotate and annotator_type else None
 
     def set_name(self):
         self.name = "ModelManager"
 
-    def run(self, frame: np.ndarray):
+    @property
+    def batching_enabled(self):
+        return self.max_batch > 1 and not self.pool_enabled
+
+    @property
+    def pool_enabled(self):
+        return self.replicas > 1
+
+    @property
+    def async_enabled(self):
+        """True if frames should go through `submit` instead of `run`."""
+        return self.pool_enabled or self.batching_enabled
+
+    @property
+    def max_in_flight(self):
+        """Number of submitted frames a caller should allow before waiting on results."""
+        if self.pool_enabled:
+            return self.replicas * 2
+        return self.max_batch * 2
+
+    @staticmethod
+    def split_preprocessed(preprocessed):
+        """
+        Preprocessors return either the model input or a tuple of (model input, params for the postprocessor).
+        :return: (model input, params or None)
+        """
+        if isinstance(preprocessed, tuple):
+            return preprocessed
+        return preprocessed, None
+
+    def run(self, frame: np.ndarray, source_id=None, timestamp=None):
         """
         Main thread logic for processing frames.
+        :param frame: frame to run inference on
+        :param source_id: id of the stream source the frame came from, attached to the data package
+        :param timestamp: capture time of the frame (epoch seconds), stored on the detections
         """
+        if self.pool is not None:
+            return self.pool.submit(frame, source_id, timestamp).result()
         try:
             # preprocess frame
-            preprocessed_frame = self.preprocessor.preprocess_image(frame)
+            with PREPROCESS_TIME.time():
+                preprocessed_frame, preprocess_params = self.split_preprocessed(
+                    self.preprocessor.preprocess_image(frame))
             #run inference
-            results = self.model.predict(preprocessed_frame)
-            #annotate frame
-            # postprocess Frame
-            detections = self.postprocessor.postprocess(results[0])
-            # if no detections just the orig frame is returned
-            annotated_frame = self.annotator.annotate_frame(scene=frame,
-                                                            detections=detections,
-                                                            labels=self.model.labels)
-
-            #create data package
-            data_package = YoloDetectionDataPackage(detections=detections,
-                                       frame=annotated_frame)
-
-            return data_package
+            with PREDICT_TIME.time():
+                results = self.model.predict(preprocessed_frame)
+            return self.create_data_package(frame, results[0], preprocess_params, source_id, timestamp)
         except Exception as e:
             print(f"ModelManager error: {e}")
 
+    def run_batch(self, frames, source_ids=None, timestamps=None):
+        """
+        Run one batched preprocess -> predict -> postprocess over several frames.
+        :param frames: list of frames
+        :param source_ids: list of source ids, one per frame
+        :param timestamps: list of capture times, one per frame
+        :return: list of data packages in the order of `frames`, None for frames that failed
+        """
+        if source_ids is None:
+            source_ids = [None] * len(frames)
+        if timestamps is None:
+            timestamps = [None] * len(frames)
+        try:
+            with PREPROCESS_BATCH_TIME.time():
+                batch_input, batch_params = self.preprocessor.preprocess_batch(frames)
+            with PREDICT_BATCH_TIME.time():
+                results = self.model.predict_batch(batch_input)
+            return [self.create_data_package(frame, result, params, source_id, timestamp)
+                    for frame, result, params, source_id, timestamp
+                    in zip(frames, results, batch_params, source_ids, timestamps)]
+        except Exception as e:
+            print(f"ModelManager batch error: {e}")
+            return [None] * len(frames)
+
+    def submit(self, frame: np.ndarray, source_id=None, timestamp=None):
+        """
+        Queue a frame on the replica pool or the micro batcher.
+        :return: Future resolving to the frame's data package
+        """
+        if self.pool is not None:
+            return self.pool.submit(frame, source_id, timestamp)
+        if self.batcher is None:
+            raise RuntimeError("Neither batching nor replicas are enabled, set max_batch or replicas > 1 "
+                               "in the ModelManager config.")
+        return self.batcher.submit(frame, source_id, timestamp)
+
+    def create_data_package(self, frame, result, preprocess_params, source_id, timestamp=None):
+        """
+        Postprocess the model output of one frame and wrap it in a data package. The frame is not drawn on
+        here, the package renders the annotated frame only when a consumer asks for it.
+        :param timestamp: capture time of the frame (epoch seconds), postprocess time if unknown
+        """
+        timestamp = datetime.fromtimestamp(timestamp).isoformat() if timestamp is not None else None
+        # postprocess Frame, preprocessors that resize pass the params needed to map boxes back
+        with POSTPROCESS_TIME.time():
+            if preprocess_params is None:
+                detections = self.postprocessor.postprocess(result, timestamp=timestamp)
+            else:
+                detections = self.postprocessor.postprocess(result, preprocess_params, timestamp=timestamp)
+        #create data package
+        return YoloDetectionDataPackage(detections=detections,
+                                        frame=frame,
+                                        source_id=source_id,
+                                        annotator=self.annotator,
+                                        labels=self.model.labels)
+
+    def get_stats(self):
+        """
+        :return: replica pool or micro batcher metrics, empty if neither is enabled
+        """
+        if self.pool:
+            return self.pool.get_stats()
+        return self.batcher.get_stats() if self.batcher else {}
+
+    def stop(self):
+        if self.batcher:
+            self.batcher.stop()
+            self.batcher = None
+        if self.pool:
+            self.pool.stop()
+            self.pool = None
+
@@ -36,6 +36,12 @@ class PostprocessorBase(ABC):
         :return: List of predictions (label, confidence).
         """
         pass
+    def populate_with_config(self, config):
+        """
+        Optional hook to read postprocessing options from the model config before `initialize`.
+        :param config: model Config object
+        """
+        self.conf_threshold = config.get("confidence_threshold", self.conf_threshold)
     def annotate_frame(self, frame, detections, annotator):
         raise NotImplementedError("Must implement annotate frame in postprocessor.")
     def initialize(self, class_labels):
@@ -1,11 +1,23 @@
 from abc import ABC, abstractmethod
 
-from tensorflow.python.distribute.multi_process_runner import NotInitializedError
+
+class NotInitializedError(RuntimeError):
+    pass
 
 
 class PreprocessorBase(ABC):
+    # True when preprocess_image returns a buffer that the next call overwrites, callers that keep the input
+    # around (the pipeline's preprocess stage) copy it then
+    reuses_buffers = False
+
     def __init__(self):
         self.input_shape = None
+    def populate_with_config(self, config):
+        """
+        Optional hook to read preprocessing options from the model config before `initialize`.
+        :param config: model Config object
+        """
+        pass
     def initialize(self):
         pass
     def is_initialized(self):
@@ -20,6 +32,24 @@ class PreprocessorBase(ABC):
         """
         pass
 
+    def preprocess_batch(self, images):
+        """
+        Preprocess several images for one batched predict. Subclasses that can fill a batch tensor directly
+        should override this.
+        :param images: list of file paths or NumPy arrays.
+        :return: (list of model inputs, list of postprocessor params or None per image)
+        """
+        inputs, params = [], []
+        for image in images:
+            preprocessed = self.preprocess_image(image)
+            if isinstance(preprocessed, tuple):
+                inputs.append(preprocessed[0])
+                params.append(preprocessed[1])
+            else:
+                inputs.append(preprocessed)
+                params.append(None)
+        return inputs, params
+
     @abstractmethod
     def preprocess_image(self, image):
         """
@@ -0,0 +1,127 @@
+from concurrent.futures import Future
+from queue import Queue, Empty
+import threading
+import time
+
+from utils.metrics.histogram import Histogram
+
+
+class MicroBatcher:
+    """
+    Collects frames from one or many callers into batches for `ModelManager.run_batch`.
+
+    A batch is closed once it holds `max_batch` frames or `max_wait_ms` has passed since its first frame was
+    submitted, whichever comes first. Each caller gets a Future that resolves to its own data package, and
+    batches are executed in submission order.
+    """
+
+    def __init__(self, run_batch_fn, max_batch=8, max_wait_ms=5.0, max_queue=64):
+        """
+        :param run_batch_fn: callable(frames, source_ids, timestamps) -> list of data packages in the same order
+        :param max_batch: maximum number of frames per batch
+        :param max_wait_ms: maximum time the first frame of a batch waits for more frames
+        :param max_queue: number of pending frames before `submit` blocks the caller
+        """
+        self.run_batch_fn = run_batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = Queue(maxsize=max_queue)
+        self.running = threading.Event()
+        self.thread = None
+
+        # metrics
+        self.batch_sizes = Histogram(lowest=1, highest=max(max_batch, 2), precision=0.01)
+        self.queue_wait = Histogram()
+        self.batch_latency = Histogram()
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        if self.thread:
+            self.thread.join(timeout=2)
+            self.thread = None
+        # requests the batching thread never picked up
+        self._fail_queued()
+
+    def _fail_queued(self):
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except Empty:
+                return
+            request[3].set_exception(RuntimeError("micro batcher is stopped"))
+
+    def submit(self, frame, source_id=None, timestamp=None) -> Future:
+        """
+        Queue a frame for batched inference. Blocks while the request queue is full.
+        :param timestamp: capture time of the frame, handed to run_batch_fn
+        :return: Future resolving to the frame's data package, failed with RuntimeError once the batcher is stopped
+        """
+        future = Future()
+        self.requests.put((frame, source_id, timestamp, future, time.monotonic()))
+        if not self.running.is_set():
+            # stopped while the request was queued, nothing will run it
+            self._fail_queued()
+        return future
+
+    def _collect(self):
+        """
+        Wait for the first request, then keep adding requests until the batch is full or its deadline passed.
+        """
+        try:
+            first = self.requests.get(timeout=0.5)
+        except Empty:
+            return []
+        batch = [first]
+        deadline = first[4] + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self.requests.get_nowait())
+                else:
+                    batch.append(self.requests.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        while self.running.is_set():
+            batch = self._collect()
+            if batch:
+                self._execute(batch)
+
+    def _execute(self, batch):
+        started = time.monotonic()
+        for _, _, _, _, submitted in batch:
+            self.queue_wait.record(started - submitted)
+        frames = [request[0] for request in batch]
+        source_ids = [request[1] for request in batch]
+        timestamps = [request[2] for request in batch]
+        try:
+            results = self.run_batch_fn(frames, source_ids, timestamps)
+        except Exception as e:
+            for _, _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+        self.batch_latency.record(time.monotonic() - started)
+        self.batch_sizes.record(len(batch))
+        for (_, _, _, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+    def get_stats(self):
+        """
+        :return: dict with batch size, queue wait and per batch latency histograms and the queue depth
+        """
+        return {
+            "queue_depth": self.requests.qsize(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_s": self.queue_wait.snapshot(),
+            "batch_latency_s": self.batch_latency.snapshot(),
+        }
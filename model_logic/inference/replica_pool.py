@@ -0,0 +1,326 @@
+from concurrent.futures import Future, wait
+from queue import Queue, Empty
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+
+
+class ReplicaError(RuntimeError):
+    """A frame's replica failed to load, crashed, or the pool was stopped before the frame was run."""
+
+
+def create_replica(config_dict, replica_threads):
+    """
+    Build a single-frame ModelManager replica from the pool's ModelManager config.
+    :param config_dict: ModelManager config as a dict
+    :param replica_threads: intra-op thread count for the replica's model
+    """
+    # imported here so a replica process only pulls in the model stack once it starts
+    from model_logic.base_classes.model_manager import ModelManager
+    from utils.configs.all_configs import ModelManagerConfig
+
+    replica_config = ModelManagerConfig(**config_dict)
+    # replicas run one frame at a time, pool and micro batching are handled by the parent
+    replica_config.set("replicas", 1)
+    replica_config.set("max_batch", 1)
+    replica = ModelManager()
+    replica.intra_op_threads = replica_threads
+    replica.initialize(replica_config)
+    return replica
+
+
+def replica_process_main(config_dict, replica_threads, index, task_queue, result_queue):
+    """
+    Entry point of a replica process. Pins the thread pools of the common runtimes before the model is loaded,
+    then runs frames from `task_queue` until it receives None.
+    """
+    for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[variable] = str(replica_threads)
+    try:
+        replica = create_replica(config_dict, replica_threads)
+    except Exception as e:
+        # exceptions of the model stack may not pickle, send the message
+        result_queue.put((None, index, ReplicaError(f"replica {index} failed to load: {e}"), 0.0))
+        return
+    result_queue.put((None, index, "ready", 0.0))
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, frame, source_id, timestamp = task
+        started = time.monotonic()
+        try:
+            data_package = replica.run(frame, source_id=source_id, timestamp=timestamp)
+        except Exception as e:
+            data_package = ReplicaError(f"replica {index} failed: {e}")
+        result_queue.put((task_id, index, data_package, time.monotonic() - started))
+    replica.stop()
+
+
+class ReplicaStats:
+    """Busy time bookkeeping for one replica."""
+
+    def __init__(self):
+        self.frames = 0
+        self.busy_time = 0.0
+        self.started = time.monotonic()
+
+    def record(self, busy_time):
+        self.frames += 1
+        self.busy_time += busy_time
+
+    def snapshot(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "frames": self.frames,
+            "busy_s": self.busy_time,
+            "utilisation": min(self.busy_time / elapsed, 1.0),
+        }
+
+
+class ReplicaPool:
+    """
+    Runs N model replicas, each in its own thread or process with a pinned intra-op thread count.
+
+    Frames are handed to whichever replica is free through a shared task queue and every `submit` returns a
+    Future, so callers reassemble results in capture order with a ResultReorderer. Thread replicas suit
+    backends that release the GIL during inference (ncnn, TFLite), process replicas sidestep the GIL
+    entirely at the cost of pickling frames across the process boundary.
+
+    A replica that fails to load or whose process dies fails the frames in flight with ReplicaError, the other
+    replicas keep going. Once no replica is left, and after `stop`, `submit` returns failed futures.
+    """
+
+    def __init__(self, config_dict, replicas=2, replica_threads=1, mode="thread", max_queue=None):
+        """
+        :param config_dict: ModelManager config as a dict, each replica builds its own ModelManager from it
+        :param replicas: number of replicas
+        :param replica_threads: intra-op threads per replica
+        :param mode: 'thread' or 'process'
+        :param max_queue: pending frames before `submit` blocks, defaults to 2 per replica
+        """
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unsupported replica mode: {mode}")
+        self.config_dict = config_dict
+        self.replicas = replicas
+        self.replica_threads = replica_threads
+        self.mode = mode
+        self.max_queue = max_queue or replicas * 2
+        self.running = threading.Event()
+        self.workers = []
+        self.replica_stats = [ReplicaStats() for _ in range(replicas)]
+
+        self._task_ids = itertools.count()
+        self._futures = {}
+        self._futures_lock = threading.Lock()
+        self._slots = threading.Semaphore(self.max_queue)
+        # indices of replicas that failed to load or died, guarded by _futures_lock
+        self._failed_replicas = set()
+        self.error = None
+        self.task_queue = None
+        self.result_queue = None
+        self.collector_thread = None
+
+    def start(self):
+        self.running.set()
+        if self.mode == "thread":
+            self.task_queue = Queue()
+            for index in range(self.replicas):
+                worker = threading.Thread(target=self._thread_worker, args=(index,), daemon=True)
+                worker.start()
+                self.workers.append(worker)
+            return
+
+        self.task_queue = multiprocessing.Queue()
+        self.result_queue = multiprocessing.Queue()
+        for index in range(self.replicas):
+            worker = multiprocessing.Process(
+                target=replica_process_main,
+                args=(self.config_dict, self.replica_threads, index, self.task_queue, self.result_queue),
+                daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        self.collector_thread = threading.Thread(target=self._collect_results, daemon=True)
+        self.collector_thread.start()
+
+    def _thread_worker(self, index):
+        try:
+            replica = create_replica(self.config_dict, self.replica_threads)
+        except Exception as e:
+            self._replica_failed(index, ReplicaError(f"replica {index} failed to load: {e}"), fail_in_flight=False)
+            return
+        while self.running.is_set():
+            try:
+                task = self.task_queue.get(timeout=0.5)
+            except Empty:
+                continue
+            if task is None:
+                break
+            task_id, frame, source_id, timestamp = task
+            started = time.monotonic()
+            try:
+                data_package = replica.run(frame, source_id=source_id, timestamp=timestamp)
+            except Exception as e:
+                data_package = ReplicaError(f"replica {index} failed: {e}")
+            self._resolve(task_id, index, data_package, time.monotonic() - started)
+        replica.stop()
+
+    def _collect_results(self):
+        """Resolve futures from the results sent back by replica processes and watch for dead processes."""
+        while self.running.is_set():
+            try:
+                task_id, index, data_package, busy_time = self.result_queue.get(timeout=0.5)
+            except Empty:
+                self._check_processes()
+                continue
+            if task_id is not None:
+                self._resolve(task_id, index, data_package, busy_time)
+            elif isinstance(data_package, ReplicaError):
+                # it never took a task, the others pick up the queued frames
+                self._replica_failed(index, data_package, fail_in_flight=False)
+            else:
+                print(f"ReplicaPool: replica {index} ready.")
+
+    def _check_processes(self):
+        for index, worker in enumerate(self.workers):
+            if not worker.is_alive() and self.running.is_set():
+                # the frames it took are lost, there is no telling which ones they were
+                self._replica_failed(index, ReplicaError(
+                    f"replica {index} exited with code {worker.exitcode}"), fail_in_flight=True)
+
+    def _replica_failed(self, index, error, fail_in_flight):
+        """
+        :param fail_in_flight: fail every frame in flight, needed when the replica may have taken some of them
+        """
+        with self._futures_lock:
+            if index in self._failed_replicas:
+                return
+            self._failed_replicas.add(index)
+            last_replica = len(self._failed_replicas) == self.replicas
+            if last_replica:
+                self.error = error
+        print(f"ReplicaPool: {error}")
+        if fail_in_flight or last_replica:
+            self._fail_pending(error)
+
+    def _fail_pending(self, error):
+        with self._futures_lock:
+            futures = list(self._futures.values())
+            self._futures.clear()
+        for future in futures:
+            self._slots.release()
+            future.set_exception(error)
+
+    def _resolve(self, task_id, index, data_package, busy_time):
+        self.replica_stats[index].record(busy_time)
+        with self._futures_lock:
+            future = self._futures.pop(task_id, None)
+        if future is None:
+            # already failed by _fail_pending, which released its slot
+            return
+        self._slots.release()
+        if isinstance(data_package, ReplicaError):
+            future.set_exception(data_package)
+        else:
+            future.set_result(data_package)
+
+    def submit(self, frame, source_id=None, timestamp=None) -> Future:
+        """
+        Queue a frame for the next free replica. Blocks while `max_queue` frames are in flight.
+        :param timestamp: capture time of the frame, passed to the replica's `run`
+        :return: Future resolving to the frame's data package, failed with ReplicaError when no replica is left
+            or the pool is stopped
+        """
+        future = Future()
+        self._slots.acquire()
+        with self._futures_lock:
+            error = self.error or (None if self.running.is_set() else ReplicaError("replica pool is stopped"))
+            if error is None:
+                task_id = next(self._task_ids)
+                self._futures[task_id] = future
+        if error is not None:
+            self._slots.release()
+            future.set_exception(error)
+            return future
+        self.task_queue.put((task_id, frame, source_id, timestamp))
+        return future
+
+    def stop(self):
+        self.running.clear()
+        for _ in self.workers:
+            self.task_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout=3)
+            if self.mode == "process" and worker.is_alive():
+                worker.terminate()
+        self.workers = []
+        if self.collector_thread:
+            self.collector_thread.join(timeout=1)
+            self.collector_thread = None
+        # frames still queued or whose result never came back
+        self._fail_pending(ReplicaError("replica pool stopped"))
+
+    def get_stats(self):
+        """
+        :return: dict with per replica frame count, busy time and utilisation
+        """
+        return {
+            "mode": self.mode,
+            "in_flight": len(self._futures),
+            "replicas": {index: stats.snapshot() for index, stats in enumerate(self.replica_stats)},
+        }
+
+
+class ResultReorderer:
+    """
+    Hands out Future results in submission order.
+
+    With `max_out_of_order` set, a result that is still missing once more than that many later results are
+    ready is given up on and skipped (its result is dropped when it arrives), so one slow frame can't hold
+    back the whole stream.
+    """
+
+    def __init__(self, max_out_of_order=None):
+        self.max_out_of_order = max_out_of_order
+        self.pending = []
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def push(self, future, context=None):
+        """
+        :param future: Future of a submitted frame
+        :param context: anything the caller needs back alongside the result
+        """
+        self.pending.append((future, context))
+
+    def _should_skip_head(self):
+        if self.max_out_of_order is None or not self.pending:
+            return False
+        done_after_head = sum(1 for future, _ in self.pending[1:] if future.done())
+        return done_after_head > self.max_out_of_order
+
+    def pop_ready(self, block=False):
+        """
+        :param block: wait for the oldest result if nothing is ready
+        :return: list of (future, context, skipped) in submission order. Skipped entries were given up on,
+            their future is not done yet.
+        """
+        ready = []
+        while self.pending:
+            future, context = self.pending[0]
+            if future.done():
+                ready.append((future, context, False))
+            elif self._should_skip_head():
+                self.dropped += 1
+                ready.append((future, context, True))
+            elif block and not ready:
+                wait([future])
+                continue
+            else:
+                break
+            self.pending.pop(0)
+        return ready
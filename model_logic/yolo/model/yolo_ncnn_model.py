@@ -1,6 +1,5 @@
 from model_logic.base_classes.model_base import ModelBase
 from utils.configs.config_base import Config
-from ultralytics import YOLO
 
 class YoloNcnnModel(ModelBase):
 
@@ -13,10 +12,15 @@ class YoloNcnnModel(ModelBase):
         self.labels = config.get("labels")
         self.task = config.get("task")
         self.confidence_threshold = config.get("confidence_threshold")
+        # imported here so other models don't pull in torch/ultralytics through the model factory
+        from ultralytics import YOLO
         self.model = YOLO(self.model_path, task=self.task)
     def predict(self, image):
         results = self.model(image, verbose=False)
         return results
+    def predict_batch(self, images):
+        # ultralytics takes a list of frames and returns one Results object per frame
+        return self.model(list(images), verbose=False)
 
 
 
@@ -0,0 +1,134 @@
+import os
+import threading
+
+import numpy as np
+
+from model_logic.base_classes.model_base import ModelBase
+from utils.configs.config_base import Config
+
+
+class YoloNcnnNativeModel(ModelBase):
+    """
+    YOLO model exported to ncnn, run through `ncnn.Net` directly.
+
+    Unlike YoloNcnnModel this doesn't go through ultralytics, so torch is never imported and preprocessing
+    is left to the configured preprocessor (LetterboxPreprocessor). `predict` returns the raw head output,
+    decode it with YoloRawPostprocessor. Runtime options (threads, light mode, fp16, packing layout) come
+    from the model YAML.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.net = None
+        self.input_name = "in0"
+        self.output_name = "out0"
+        self.num_threads = 4
+        self.light_mode = True
+        self.use_fp16 = False
+        self.use_packing_layout = True
+        self.ncnn = None
+        # pooled blob/workspace allocators per calling thread, reused by every extractor
+        self._local = threading.local()
+
+    def initialize(self, config: Config):
+        """
+        Load the ncnn param/bin pair and apply the runtime options.
+        :param config: model config with model_path (export directory or .param path), num_threads,
+            light_mode, use_fp16, use_packing_layout, input_name and output_name
+        """
+        try:
+            import ncnn
+        except ImportError as e:
+            raise ImportError("YoloNCNNNativeModel needs the ncnn package, pip install ncnn") from e
+        self.ncnn = ncnn
+        self.config = config
+        self.model_path = config.get("model_path")
+        self.labels = self.load_labels(config.get("labels") or config.get("class_labels"))
+        self.confidence_threshold = config.get("confidence_threshold")
+        self.input_name = config.get("input_name", self.input_name)
+        self.output_name = config.get("output_name", self.output_name)
+        self.num_threads = config.get("num_threads", self.num_threads)
+        self.light_mode = config.get("light_mode", self.light_mode)
+        self.use_fp16 = config.get("use_fp16", self.use_fp16)
+        self.use_packing_layout = config.get("use_packing_layout", self.use_packing_layout)
+
+        param_path, bin_path = self.resolve_model_files(self.model_path)
+
+        self.net = self.ncnn.Net()
+        # options must be set before the model is loaded
+        self.net.opt.num_threads = self.num_threads
+        self.net.opt.lightmode = self.light_mode
+        self.net.opt.use_packing_layout = self.use_packing_layout
+        self.net.opt.use_fp16_packed = self.use_fp16
+        self.net.opt.use_fp16_storage = self.use_fp16
+        self.net.opt.use_fp16_arithmetic = self.use_fp16
+        self.net.opt.use_vulkan_compute = config.get("use_vulkan", False)
+
+        if self.net.load_param(param_path) != 0:
+            raise ValueError(f"Failed to load ncnn param file: {param_path}")
+        if self.net.load_model(bin_path) != 0:
+            raise ValueError(f"Failed to load ncnn model file: {bin_path}")
+
+    @staticmethod
+    def load_labels(source):
+        """
+        :param source: list of class labels or the path of a .txt file with one label per line
+        :return: list of class labels, None without a source
+        """
+        if isinstance(source, str):
+            with open(source, "r") as f:
+                return [line.strip() for line in f.readlines()]
+        return list(source) if source is not None else None
+
+    @staticmethod
+    def resolve_model_files(model_path):
+        """
+        Accept either the ultralytics export directory or the path of the .param file.
+        :return: (param path, bin path)
+        """
+        if os.path.isdir(model_path):
+            param_path = os.path.join(model_path, "model.ncnn.param")
+            bin_path = os.path.join(model_path, "model.ncnn.bin")
+        else:
+            param_path = model_path
+            bin_path = os.path.splitext(model_path)[0] + ".bin"
+        for path in (param_path, bin_path):
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"ncnn model file not found: {path}")
+        return param_path, bin_path
+
+    def _create_extractor(self):
+        """
+        Create an extractor backed by this thread's pooled allocators. An ncnn extractor caches the blobs of
+        one inference and can't be reset for the next frame, so a new one is created per call, but the blob
+        and workspace memory is recycled through the pools instead of being allocated every frame.
+        """
+        if getattr(self._local, "blob_allocator", None) is None:
+            self._local.blob_allocator = self.ncnn.UnlockedPoolAllocator()
+            self._local.workspace_allocator = self.ncnn.UnlockedPoolAllocator()
+        extractor = self.net.create_extractor()
+        extractor.set_light_mode(self.light_mode)
+        extractor.set_blob_allocator(self._local.blob_allocator)
+        extractor.set_workspace_allocator(self._local.workspace_allocator)
+        return extractor
+
+    def predict(self, image: np.ndarray):
+        """
+        Run the network on a preprocessed input.
+        :param image: float32 tensor of shape (1, 3, H, W) from LetterboxPreprocessor (NCHW layout)
+        :return: list with the raw output of shape (1, 4 + num_classes, num_anchors)
+        """
+        if self.net is None:
+            raise ValueError("Net is not initialized. Call `initialize` first.")
+        if image.ndim == 4:
+            image = image[0]
+        extractor = self._create_extractor()
+        # the Mat wraps the input tensor without copying it
+        extractor.input(self.input_name, self.ncnn.Mat(np.ascontiguousarray(image)))
+        ret, output = extractor.extract(self.output_name)
+        if ret != 0:
+            raise RuntimeError(f"ncnn extract of '{self.output_name}' failed with code {ret}")
+        # copy out of the pooled blob memory before the extractor is released
+        result = np.array(output)[np.newaxis]
+        del output, extractor
+        return [result]
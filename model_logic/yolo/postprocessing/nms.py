@@ -0,0 +1,99 @@
+import numpy as np
+
+# Offset between classes for class-aware NMS, larger than any box coordinate in model input pixels
+CLASS_OFFSET = 7680.0
+
+
+def build_class_thresholds(num_classes, default_threshold, class_thresholds=None, class_labels=None):
+    """
+    Build a per-class confidence threshold array.
+    :param num_classes: number of classes of the model
+    :param default_threshold: threshold for classes without their own entry
+    :param class_thresholds: dict mapping class id or class label to a threshold
+    :param class_labels: list of class labels, needed when `class_thresholds` is keyed by label
+    :return: float32 array of shape (num_classes,)
+    """
+    thresholds = np.full(num_classes, default_threshold, dtype=np.float32)
+    for key, threshold in (class_thresholds or {}).items():
+        if isinstance(key, str):
+            if class_labels is None or key not in class_labels:
+                raise ValueError(f"Unknown class label in class thresholds: {key}")
+            key = list(class_labels).index(key)
+        thresholds[int(key)] = threshold
+    return thresholds
+
+
+def decode_yolo_head(output, thresholds, top_k=None, normalized_boxes=False, input_shape=None):
+    """
+    Decode a raw YOLO detection head into candidate boxes.
+    :param output: head output of shape (4 + num_classes, num_anchors), a leading batch axis of 1 and the
+        transposed (num_anchors, 4 + num_classes) layout some TFLite exports use are accepted as well
+    :param thresholds: scalar or per-class array of confidence thresholds
+    :param top_k: keep only the k highest scoring candidates before NMS
+    :param normalized_boxes: boxes are in [0, 1] instead of model input pixels (TFLite exports)
+    :param input_shape: (height, width) of the model input, needed with `normalized_boxes`
+    :return: (xyxy float32 (N, 4), scores float32 (N,), class_ids int64 (N,))
+    """
+    predictions = np.asarray(output, dtype=np.float32)
+    if predictions.ndim == 3:
+        predictions = predictions[0]
+    if predictions.shape[0] > predictions.shape[1]:
+        predictions = predictions.T
+
+    # prefilter on the best score against the lowest threshold, argmax only runs on the few survivors
+    class_scores = predictions[4:]
+    scores = class_scores.max(axis=0)
+    candidates = np.flatnonzero(scores > np.min(thresholds))
+    class_ids = class_scores[:, candidates].argmax(axis=0)
+    scores = scores[candidates]
+    keep = scores > (thresholds[class_ids] if np.ndim(thresholds) else thresholds)
+    candidates, scores, class_ids = candidates[keep], scores[keep], class_ids[keep]
+    if top_k is not None and len(scores) > top_k:
+        best = np.argpartition(-scores, top_k)[:top_k]
+        candidates, scores, class_ids = candidates[best], scores[best], class_ids[best]
+
+    cx, cy, w, h = predictions[:4, candidates]
+    xyxy = np.stack((cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2), axis=1)
+    if normalized_boxes:
+        input_height, input_width = input_shape
+        xyxy *= np.array([input_width, input_height, input_width, input_height], dtype=np.float32)
+    return xyxy, scores, class_ids.astype(np.int64)
+
+
+def non_max_suppression(xyxy, scores, class_ids, iou_threshold=0.45, max_detections=300, class_agnostic=False):
+    """
+    Greedy NMS with vectorized IoU. Boxes of different classes are shifted apart by CLASS_OFFSET so a single
+    pass suppresses only within each class.
+    :return: int64 indices of the kept boxes, highest score first
+    """
+    if len(scores) == 0:
+        return np.empty(0, dtype=np.int64)
+    boxes = xyxy if class_agnostic else xyxy + (class_ids * CLASS_OFFSET)[:, np.newaxis].astype(np.float32)
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    order = np.argsort(-scores, kind="stable")
+
+    keep = []
+    while order.size and len(keep) < max_detections:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        inter_w = (np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest])).clip(0)
+        inter_h = (np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest])).clip(0)
+        inter = inter_w * inter_h
+        iou = inter / (areas[best] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def postprocess_yolo_head(output, thresholds, iou_threshold=0.45, top_k=30000, max_detections=300,
+                          class_agnostic=False, normalized_boxes=False, input_shape=None):
+    """
+    Decode a raw YOLO head and run NMS in one call.
+    :return: (xyxy, scores, class_ids) of the kept boxes in model input pixels
+    """
+    xyxy, scores, class_ids = decode_yolo_head(output, thresholds, top_k=top_k,
+                                               normalized_boxes=normalized_boxes, input_shape=input_shape)
+    keep = non_max_suppression(xyxy, scores, class_ids, iou_threshold=iou_threshold,
+                               max_detections=max_detections, class_agnostic=class_agnostic)
+    return xyxy[keep], scores[keep], class_ids[keep]
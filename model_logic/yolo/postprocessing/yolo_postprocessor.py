@@ -13,6 +13,7 @@ class YOLOPostprocessor(PostprocessorBase):
         super().__init__(class_labels, conf_threshold)
         self.class_labels = class_labels
         self.conf_threshold = conf_threshold
+        self.label_array = np.array(class_labels) if class_labels else None
 
     def load_class_labels(self, source):
         """
@@ -31,86 +32,45 @@ class YOLOPostprocessor(PostprocessorBase):
             raise ValueError("Source must be a file path (str) or a list of labels.")
 
         self.class_labels = class_labels
+        # label lookups are done by indexing this array with all class ids at once
+        self.label_array = np.array(class_labels)
 
-    def postprocess(self, output_data, original_dims) -> sv.Detections:
+    def postprocess(self, output_data, original_dims, timestamp=None) -> sv.Detections:
         """
         Process the model's raw output into human-readable predictions with bounding boxes.
+        Rows are (x_min, y_min, x_max, y_max, confidence, class_id) with normalized coordinates, all rows
+        are filtered and scaled at once.
         :param output_data: data from model
         :param original_dims: org dims of image
+        :param timestamp: capture time of the frame, defaults to now. One timestamp is stored per frame.
         :return: sv.detections, returns empty detections if no detections are found
         """
         if not self.class_labels:
             raise ValueError("Class labels are not initialized. Please provide or load class labels.")
-        output_tensor = output_data[0]
-        detections = {
-            'bboxes': [],
-            'labels': [],
-            'class_ids': [],
-            'conf': [],
-            'timestamp': []
-        }
-        original_width, original_height = original_dims
-
-        for i in range(output_tensor.shape[1]):
-            box = output_tensor[0, i, :4]
-            confidence = output_tensor[0, i, 4]
-            class_id = int(output_tensor[0, i, 5])
-
-            if confidence > self.conf_threshold:
-                self.populate_detections(detections=detections,
-                                         original_height=original_height,
-                                         original_width=original_width,
-                                         class_id=class_id,
-                                         box=box,
-                                         confidence=confidence)
-        #cast detections to numpy
-        detections = self.finalize_detections(detections=detections)
-
-        return detections
-    @staticmethod
-    def normalize_box(box, original_width, original_height):
-        """
-        Normalize the bounding box coordinates based on the original image dimensions.
-        """
-        x_min = int(box[0] * original_width)
-        y_min = int(box[1] * original_height)
-        x_max = int(box[2] * original_width)
-        y_max = int(box[3] * original_height)
-        return [x_min, y_min, x_max, y_max]
+        output_tensor = np.asarray(output_data[0])[0]
+        # apply the confidence mask once over all rows
+        rows = output_tensor[output_tensor[:, 4] > self.conf_threshold]
+        if not len(rows):
+            return sv.Detections.empty()
 
-    def populate_detections(self, detections, box, original_width, original_height, class_id, confidence):
-        """
-        Populate the detections dictionary with normalized bounding box and other details.
-        """
-        # Normalize the bounding box
-        normalized_box = self.normalize_box(box, original_width, original_height)
+        original_width, original_height = original_dims
+        xyxy = self.normalize_boxes(rows[:, :4], original_width, original_height)
+        class_ids = rows[:, 5].astype(np.int64)
+        if timestamp is None:
+            timestamp = datetime.now().isoformat()
 
-        # Add detection details to the dictionary
-        detections['bboxes'].append(normalized_box)
-        detections['labels'].append(self.class_labels[class_id])
-        detections['class_ids'].append(class_id)
-        detections['conf'].append(confidence)
-        detections['timestamp'].append(datetime.now().isoformat())
+        # Note labels are added in the detections object during post processing
+        return sv.Detections(xyxy=xyxy,
+                             class_id=class_ids,
+                             confidence=rows[:, 4].astype(np.float32),
+                             metadata={'labels': self.label_array[class_ids],
+                                       'timestamp': timestamp})
 
-        return detections
     @staticmethod
-    def finalize_detections(detections):
+    def normalize_boxes(boxes, original_width, original_height):
         """
-        Cast lists in the detections dictionary to numpy arrays and converts to SV detecions
-        returns empty detections if no detections are found.
+        Scale normalized (N, 4) xyxy boxes to pixel coordinates of the original image with one
+        broadcasted multiply. Coordinates are truncated to whole pixels.
         """
-        if detections['bboxes']:
-            detections['bboxes'] = np.array(detections['bboxes'])
-            detections['class_ids'] = np.array(detections['class_ids'])
-            detections['conf'] = np.array(detections['conf'])
-            # Note labels are added in the detections object during post processing
-            sv_detections = sv.Detections(xyxy=detections['bboxes'],
-                                          class_id=detections['class_ids'],
-                                          confidence=detections['conf'],
-                                          metadata={'labels': detections['labels'],
-                                                    'timestamp': detections['timestamp']},)
-            return sv_detections
-        else:
-            return sv.Detections.empty()
-
-
+        scale = np.array([original_width, original_height, original_width, original_height], dtype=np.float32)
+        return (boxes * scale).astype(np.int64)
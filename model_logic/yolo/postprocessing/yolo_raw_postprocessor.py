@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import numpy as np
+import supervision as sv
+
+from model_logic.base_classes.postprocessor import PostprocessorBase
+from model_logic.yolo.postprocessing.nms import build_class_thresholds, postprocess_yolo_head
+
+
+class YoloRawPostprocessor(PostprocessorBase):
+    """
+    Decodes the raw YOLO detection head, (4 + num_classes, num_anchors) with cx, cy, w, h followed by the
+    class scores, and runs class-aware NMS. Used with YoloNcnnNativeModel, which returns the head without any
+    decoding, and with TFLite exports that keep the raw head (set normalized_boxes for those).
+    """
+
+    def __init__(self, class_labels=None, conf_threshold=0.25, iou_threshold=0.45, max_detections=300):
+        """
+        :param class_labels: List of class labels or None if using a file to load labels.
+        :param conf_threshold: Minimum class score for a candidate box.
+        :param iou_threshold: IoU above which overlapping boxes of the same class are suppressed.
+        :param max_detections: Maximum number of boxes kept per frame.
+        """
+        super().__init__(class_labels, conf_threshold)
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+        self.top_k = 30000
+        self.class_agnostic = False
+        self.class_thresholds = None
+        self.normalized_boxes = False
+        self.input_shape = None
+        self.thresholds = None
+        self.label_array = None
+
+    def populate_with_config(self, config):
+        """
+        Reads iou_threshold, max_detections, top_k (candidates kept before NMS), class_agnostic,
+        class_confidence_thresholds (dict of class id or label to threshold), normalized_boxes and input_size.
+        """
+        super().populate_with_config(config)
+        self.iou_threshold = config.get("iou_threshold", self.iou_threshold)
+        self.max_detections = config.get("max_detections", self.max_detections)
+        self.top_k = config.get("top_k", self.top_k)
+        self.class_agnostic = config.get("class_agnostic", self.class_agnostic)
+        self.class_thresholds = config.get("class_confidence_thresholds", self.class_thresholds)
+        self.normalized_boxes = config.get("normalized_boxes", self.normalized_boxes)
+        input_size = config.get("input_size", 640)
+        self.input_shape = (input_size, input_size) if isinstance(input_size, int) else tuple(input_size)
+
+    def initialize(self, class_labels):
+        super().initialize(class_labels)
+        self.label_array = np.array(self.class_labels)
+        self.thresholds = build_class_thresholds(len(self.class_labels), self.conf_threshold,
+                                                 self.class_thresholds, self.class_labels)
+
+    def postprocess(self, output, letterbox_params=None, timestamp=None) -> sv.Detections:
+        """
+        :param output: raw head output of shape (1, 4 + num_classes, num_anchors) or without the batch axis
+        :param letterbox_params: LetterboxParams used to map boxes back onto the original frame
+        :param timestamp: capture time of the frame, defaults to now
+        :return: sv.Detections, empty if nothing passed the threshold
+        """
+        if self.label_array is None:
+            raise ValueError("Class labels are not initialized. Please provide or load class labels.")
+        xyxy, confidences, class_ids = postprocess_yolo_head(output, self.thresholds,
+                                                             iou_threshold=self.iou_threshold,
+                                                             top_k=self.top_k,
+                                                             max_detections=self.max_detections,
+                                                             class_agnostic=self.class_agnostic,
+                                                             normalized_boxes=self.normalized_boxes,
+                                                             input_shape=self.input_shape)
+        if not len(class_ids):
+            return sv.Detections.empty()
+        if letterbox_params is not None:
+            xyxy = letterbox_params.to_original(xyxy)
+
+        return sv.Detections(xyxy=xyxy.astype(np.float32),
+                             class_id=class_ids,
+                             confidence=confidences.astype(np.float32),
+                             metadata={'labels': self.label_array[class_ids],
+                                       'timestamp': timestamp or datetime.now().isoformat()})
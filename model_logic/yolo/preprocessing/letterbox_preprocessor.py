@@ -0,0 +1,189 @@
+import threading
+
+import cv2
+import numpy as np
+from model_logic.base_classes.preprocessor import PreprocessorBase
+
+
+class LetterboxParams:
+    """
+    Scale and padding applied by the letterbox, needed to map boxes back onto the original frame.
+    """
+
+    def __init__(self, scale, pad_x, pad_y, original_shape):
+        """
+        :param scale: resize factor applied to the original frame
+        :param pad_x: padding added to the left of the resized frame
+        :param pad_y: padding added to the top of the resized frame
+        :param original_shape: (height, width) of the original frame
+        """
+        self.scale = scale
+        self.pad_x = pad_x
+        self.pad_y = pad_y
+        self.original_shape = original_shape
+        self._offset = np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)
+        self._clip_max = np.array([original_shape[1], original_shape[0]] * 2, dtype=np.float32)
+
+    def to_original(self, xyxy: np.ndarray) -> np.ndarray:
+        """
+        Map xyxy boxes from model input coordinates to original frame coordinates.
+        :param xyxy: (N, 4) array of boxes in model input pixels
+        :return: (N, 4) float32 array of boxes in original frame pixels
+        """
+        boxes = (np.asarray(xyxy, dtype=np.float32) - self._offset) / self.scale
+        return np.clip(boxes, 0, self._clip_max, out=boxes)
+
+    def __repr__(self):
+        return (f"LetterboxParams(scale={self.scale}, pad_x={self.pad_x}, pad_y={self.pad_y}, "
+                f"original_shape={self.original_shape})")
+
+
+class LetterboxPreprocessor(PreprocessorBase):
+    """
+    Aspect ratio preserving resize with padding, done with cv2/NumPy on preallocated buffers.
+
+    The frame is resized straight into a padded canvas that is kept per input shape, and the BGR->RGB swap,
+    uint8->float32 scaling and HWC->NCHW/NHWC layout change happen in a single pass into a preallocated
+    input tensor. The returned tensor is reused on the next call from the same thread, the buffers are kept per
+    thread so several pipeline workers can share one preprocessor.
+    """
+    reuses_buffers = True
+
+    def __init__(self):
+        super().__init__()
+        self.input_shape = None
+        self.layout = "NCHW"
+        self.swap_rb = True
+        self.pad_value = 114
+        self.scale_up = True
+        self._buffers = threading.local()
+
+    def populate_with_config(self, config):
+        """
+        Read the letterbox options from the model config.
+        input_size: int or [height, width] of the model input, input_layout: NCHW or NHWC,
+        swap_rb: convert BGR frames to RGB, pad_value: grey level of the padding,
+        scale_up: allow frames smaller than the input to be upscaled.
+        """
+        input_size = config.get("input_size", 640)
+        if isinstance(input_size, int):
+            input_size = (input_size, input_size)
+        self.input_shape = tuple(input_size)
+        self.layout = config.get("input_layout", self.layout).upper()
+        self.swap_rb = config.get("swap_rb", self.swap_rb)
+        self.pad_value = config.get("pad_value", self.pad_value)
+        self.scale_up = config.get("scale_up", self.scale_up)
+        if self.layout not in ("NCHW", "NHWC"):
+            raise ValueError(f"Unsupported input layout: {self.layout}")
+
+    def initialize(self, input_shape=None):
+        """
+        :param input_shape: optional (height, width) overriding the config
+        """
+        if input_shape is not None:
+            self.input_shape = tuple(input_shape)
+        if self.input_shape is None:
+            self.input_shape = (640, 640)
+        self._buffers = threading.local()
+
+    def _thread_buffers(self):
+        """
+        :return: (canvases, input tensors) of the calling thread
+        """
+        buffers = self._buffers
+        if not hasattr(buffers, "canvases"):
+            buffers.canvases = {}
+            buffers.input_tensors = {}
+        return buffers.canvases, buffers.input_tensors
+
+    def load_image(self, image):
+        """
+        Load an image from a file path or pass a NumPy array through.
+        :param image: Path to an image file or a NumPy array.
+        :return: BGR NumPy array.
+        """
+        if isinstance(image, str):
+            loaded = cv2.imread(image)
+            if loaded is None:
+                raise ValueError(f"Unable to load image: {image}")
+            return loaded
+        if isinstance(image, np.ndarray):
+            return image
+        raise ValueError("Input must be a file path (str) or a NumPy array.")
+
+    def _get_canvas(self, frame_shape):
+        """
+        Return the padded canvas and letterbox params for a frame shape, allocating them on first use.
+        """
+        canvases, _ = self._thread_buffers()
+        key = frame_shape[:2]
+        if key not in canvases:
+            height, width = key
+            input_height, input_width = self.input_shape
+            scale = min(input_height / height, input_width / width)
+            if not self.scale_up:
+                scale = min(scale, 1.0)
+            new_width, new_height = int(round(width * scale)), int(round(height * scale))
+            pad_x = (input_width - new_width) // 2
+            pad_y = (input_height - new_height) // 2
+
+            canvas = np.full((input_height, input_width, 3), self.pad_value, dtype=np.uint8)
+            roi = canvas[pad_y:pad_y + new_height, pad_x:pad_x + new_width]
+            params = LetterboxParams(scale, pad_x, pad_y, (height, width))
+            canvases[key] = (canvas, roi, params)
+        return canvases[key]
+
+    def _get_input_tensor(self, batch_size):
+        _, input_tensors = self._thread_buffers()
+        if batch_size not in input_tensors:
+            input_height, input_width = self.input_shape
+            shape = (batch_size, 3, input_height, input_width) if self.layout == "NCHW" \
+                else (batch_size, input_height, input_width, 3)
+            input_tensors[batch_size] = np.empty(shape, dtype=np.float32)
+        return input_tensors[batch_size]
+
+    def letterbox(self, frame: np.ndarray, out: np.ndarray):
+        """
+        Letterbox a single frame into `out` (one (3, H, W) or (H, W, 3) slice of the input tensor).
+        :return: LetterboxParams
+        """
+        if frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        elif frame.shape[-1] != 3:
+            raise ValueError("Input image must have 3 color channels.")
+
+        canvas, roi, params = self._get_canvas(frame.shape)
+        resized = cv2.resize(frame, (roi.shape[1], roi.shape[0]), dst=roi, interpolation=cv2.INTER_LINEAR)
+        if not np.shares_memory(resized, canvas):
+            # older OpenCV builds may not write into the ROI view
+            roi[...] = resized
+
+        source = canvas[..., ::-1] if self.swap_rb else canvas
+        if self.layout == "NCHW":
+            source = source.transpose(2, 0, 1)
+        np.multiply(source, np.float32(1.0 / 255.0), out=out, casting="unsafe")
+        return params
+
+    def preprocess_image(self, image):
+        """
+        Letterbox the input image into the model input tensor.
+        :param image: Path to an image file or a NumPy array (BGR).
+        :return: (input tensor of shape (1, ...), LetterboxParams)
+        """
+        self.is_initialized()
+        frame = self.load_image(image)
+        input_tensor = self._get_input_tensor(1)
+        params = self.letterbox(frame, input_tensor[0])
+        return input_tensor, params
+
+    def preprocess_batch(self, images):
+        """
+        Letterbox several images into one (B, ...) input tensor.
+        :param images: list of file paths or NumPy arrays (BGR).
+        :return: (input tensor, list of LetterboxParams)
+        """
+        self.is_initialized()
+        input_tensor = self._get_input_tensor(len(images))
+        params = [self.letterbox(self.load_image(image), input_tensor[index])
+                  for index, image in enumerate(images)]
+        return input_tensor, params
@@ -0,0 +1,133 @@
+import asyncio
+from collections import Counter
+import time
+
+from mqtt_logic.mqtt_batcher import estimate_package_bytes, on_publish_failed
+from utils.metrics.histogram import Histogram
+
+
+class AsyncMqttBatcher:
+    """
+    asyncio counterpart of MqttBatcher for the asyncio runtime.
+
+    Packages are awaited from an asyncio.Queue, a batch is flushed on `max_items`, `max_bytes` or `max_delay_s`
+    after its first package. The batcher sleeps on the queue while nothing arrives instead of polling.
+    Serializing and publishing run in an executor so the event loop never blocks on them. A full queue
+    pushes back on the publish stage.
+    """
+
+    def __init__(self, publish_fn, max_items=10, max_bytes=None, max_delay_s=5.0, max_queue=100,
+                 size_fn=estimate_package_bytes, executor=None):
+        """
+        :param publish_fn: callable(batch) serializing and publishing a list of data packages, run in the executor
+        :param max_items: packages per batch
+        :param max_bytes: estimated payload bytes per batch, None for no byte limit
+        :param max_delay_s: maximum time the first package of a batch waits before the batch is flushed
+        :param max_queue: packages waiting for a batch before `put` waits
+        :param size_fn: callable(data_package) -> estimated bytes
+        :param executor: concurrent.futures executor for publish_fn, None for the loop's default executor
+        """
+        self.publish_fn = publish_fn
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay_s
+        self.size_fn = size_fn
+        self.executor = executor
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.task = None
+
+        # metrics
+        self.flush_reasons = Counter()
+        self.batches = 0
+        self.items = 0
+        self.publish_errors = 0
+        # packages of batches whose publish raised or whose publish handle failed later (those are in items too)
+        self.failed_items = 0
+        self.publish_latency = Histogram()
+
+    async def put(self, data_package):
+        await self.queue.put(data_package)
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """
+        Flush what is queued and stop.
+        """
+        if self.task is None:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self.queue.get()
+            if first is None:
+                return
+            batch, batch_bytes = [first], self.size_fn(first)
+            deadline = time.monotonic() + self.max_delay
+            reason = "deadline"
+            while True:
+                if len(batch) >= self.max_items:
+                    reason = "size"
+                    break
+                if self.max_bytes is not None and batch_bytes >= self.max_bytes:
+                    reason = "bytes"
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    data_package = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if data_package is None:
+                    stopping, reason = True, "stop"
+                    break
+                batch.append(data_package)
+                batch_bytes += self.size_fn(data_package)
+            await self._publish(batch, reason)
+
+    async def _publish(self, batch, reason):
+        self.flush_reasons[reason] += 1
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor, self.publish_fn, batch)
+        except Exception as e:
+            self._record_failure(len(batch))
+            print(f"AsyncMqttBatcher: failed to publish batch: {e}")
+            return
+        self.publish_latency.record(time.monotonic() - started)
+        self.batches += 1
+        self.items += len(batch)
+        on_publish_failed(result, lambda error, size=len(batch): self._failed_later(loop, size))
+
+    def _failed_later(self, loop, size):
+        # handles fail on paho's or the ack tracker's thread, count on the loop
+        try:
+            loop.call_soon_threadsafe(self._record_failure, size)
+        except RuntimeError:
+            # the loop is closed, the runtime stopped before the ack timed out
+            pass
+
+    def _record_failure(self, size):
+        self.publish_errors += 1
+        self.failed_items += size
+
+    def get_stats(self):
+        """
+        :return: dict with queue depth, batch and item counts, flush reasons, errors and publish latency
+        """
+        return {
+            "queue_depth": self.queue.qsize(),
+            "batches": self.batches,
+            "items": self.items,
+            "flush_reasons": dict(self.flush_reasons),
+            "publish_errors": self.publish_errors,
+            "failed_items": self.failed_items,
+            "publish_latency_s": self.publish_latency.snapshot(),
+        }
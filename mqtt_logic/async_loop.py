@@ -0,0 +1,118 @@
+"""
+Drives a paho client from an asyncio event loop instead of paho's loop thread.
+
+paho reports its socket through the on_socket_* callbacks. The socket is watched with add_reader/add_writer,
+so the client only wakes up when there is traffic. loop_misc (keepalive pings, reconnects) runs once a
+second. Publishing from executor threads is fine: the write interest is handed to the loop thread with
+call_soon_threadsafe.
+"""
+import asyncio
+import threading
+
+
+class AsyncioMqttLoop:
+
+    def __init__(self, loop, mqtt_client, reconnect_min_delay=1.0, reconnect_max_delay=30.0):
+        """
+        :param loop: running asyncio event loop
+        :param mqtt_client: BaseMQTTClient, its paho client is driven by the loop
+        :param reconnect_min_delay: first reconnect delay in seconds, doubled up to reconnect_max_delay
+        """
+        self.loop = loop
+        self.mqtt_client = mqtt_client
+        self.client = mqtt_client.client
+        self.reconnect_min_delay = reconnect_min_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self._reconnect_delay = reconnect_min_delay
+        self._misc_task = None
+        self._sock = None
+        self._stopping = False
+        self._loop_thread = None
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def _in_loop(self, function, *args):
+        # paho calls these from the loop thread (loop_read/loop_write) or from executor threads (connect, publish)
+        if self._loop_thread == threading.get_ident():
+            function(*args)
+        else:
+            self.loop.call_soon_threadsafe(function, *args)
+
+    def on_socket_open(self, client, userdata, sock):
+        self._sock = sock
+        self._in_loop(self.loop.add_reader, sock.fileno(), self.client.loop_read)
+
+    def on_socket_close(self, client, userdata, sock):
+        self._sock = None
+        self._in_loop(self._forget, sock.fileno())
+
+    def _forget(self, fd):
+        # the socket may already be closed by the time this runs in the loop thread
+        for remove in (self.loop.remove_writer, self.loop.remove_reader):
+            try:
+                remove(fd)
+            except (OSError, ValueError):
+                pass
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self._in_loop(self.loop.add_writer, sock.fileno(), self.client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self._in_loop(self.loop.remove_writer, sock.fileno())
+
+    async def connect(self):
+        """
+        Connect without blocking the event loop. Without a spool a failed first connect raises, with a spool
+        the misc task keeps retrying like paho's own loop would.
+        """
+        self._loop_thread = threading.get_ident()
+        self.mqtt_client.attach_callbacks()
+        try:
+            await self.loop.run_in_executor(None, self.client.connect, self.mqtt_client.host,
+                                            self.mqtt_client.port, 60)
+        except OSError:
+            if self.mqtt_client.spool is None:
+                raise
+            print(f"Broker at {self.mqtt_client.host}:{self.mqtt_client.port} unreachable, retrying")
+        if self.mqtt_client.forwarder:
+            self.mqtt_client.forwarder.start()
+        self._misc_task = self.loop.create_task(self._misc_loop())
+
+    async def _misc_loop(self):
+        while not self._stopping:
+            if self._sock is not None:
+                self.client.loop_misc()
+                self._reconnect_delay = self.reconnect_min_delay
+                await asyncio.sleep(1)
+                continue
+            # connection lost (or never made), paho's loop thread would reconnect here
+            await asyncio.sleep(self._reconnect_delay)
+            self._reconnect_delay = min(self._reconnect_delay * 2, self.reconnect_max_delay)
+            try:
+                await self.loop.run_in_executor(None, self.client.reconnect)
+            except OSError as e:
+                print(f"Reconnect to {self.mqtt_client.host}:{self.mqtt_client.port} failed: {e}")
+
+    async def disconnect(self):
+        """
+        Stop the frame encoder and spool like BaseMQTTClient.disconnect and let the DISCONNECT packet go out.
+        """
+        self._stopping = True
+        self.mqtt_client.disconnect()
+        # give the loop a moment to write the DISCONNECT packet and see the socket close
+        for _ in range(20):
+            if self._sock is None:
+                break
+            await asyncio.sleep(0.05)
+        if self._misc_task:
+            self._misc_task.cancel()
+            self._misc_task = None
+        if self._sock is not None:
+            self._forget(self._sock.fileno())
+            self._sock = None
+
+    @property
+    def is_connected(self):
+        return self.client.is_connected()
@@ -0,0 +1,202 @@
+"""
+Optional zstd/zlib compression of MQTT payloads, with dictionaries trained offline from recorded payloads.
+
+Train a dictionary from payload files or MQTT spool directories:
+    python -m mqtt_logic.compression train detections.dict recorded_payloads/ /var/lib/objectdetect/mqtt_spool
+then point `compression_dictionary` in the MQTT client YAML at it. Sender and receiver need the same
+dictionary, the dictionary id is sent along so a mismatch is detected instead of decoding garbage.
+"""
+import os
+import sys
+import threading
+import zlib
+
+CODECS = ("none", "zlib", "zstd")
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ENCODING_PROPERTY = "content-encoding"
+DICTIONARY_PROPERTY = "dictionary-id"
+
+
+def _import_zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("compression 'zstd' needs the zstandard package, pip install zstandard") from e
+    return zstandard
+
+
+def dictionary_id(codec, dictionary):
+    """
+    :return: id of a dictionary as sent in the user properties, None without dictionary
+    """
+    if dictionary is None:
+        return None
+    if codec == "zstd":
+        return _import_zstd().ZstdCompressionDict(dictionary).dict_id()
+    return zlib.adler32(dictionary)
+
+
+class PayloadCompressor:
+    """
+    Compresses and decompresses payloads with one codec, level and optional dictionary. Compressor objects
+    are reused between payloads, a lock keeps them safe when several threads publish through one client.
+    """
+
+    def __init__(self, codec="none", level=3, dictionary=None):
+        """
+        :param codec: 'none', 'zlib' or 'zstd'
+        :param level: compression level of the codec
+        :param dictionary: bytes of a trained dictionary or None
+        """
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported compression: {codec}")
+        self.codec = codec
+        self.level = level
+        self.dictionary = dictionary
+        self.dictionary_id = dictionary_id(codec, dictionary)
+        self._lock = threading.Lock()
+        self._compressor = None
+        self._decompressor = None
+        if codec == "zstd":
+            zstandard = _import_zstd()
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            self._compressor = zstandard.ZstdCompressor(level=level, dict_data=dict_data)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+
+        # metrics
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build from compression, compression_level and compression_dictionary (path) in a client config.
+        """
+        dictionary = None
+        dictionary_path = config.get("compression_dictionary")
+        if dictionary_path:
+            with open(dictionary_path, "rb") as dictionary_file:
+                dictionary = dictionary_file.read()
+        return cls(codec=config.get("compression", "none"),
+                   level=config.get("compression_level", 3),
+                   dictionary=dictionary)
+
+    @property
+    def enabled(self):
+        return self.codec != "none"
+
+    def user_properties(self):
+        """
+        :return: list of (key, value) MQTT v5 user properties describing the encoding
+        """
+        properties = [(ENCODING_PROPERTY, self.codec)]
+        if self.dictionary_id is not None:
+            properties.append((DICTIONARY_PROPERTY, str(self.dictionary_id)))
+        return properties
+
+    def compress(self, payload):
+        """
+        :param payload: str or bytes
+        :return: compressed bytes, or the payload unchanged without a codec
+        """
+        if not self.enabled:
+            return payload
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._lock:
+            if self.codec == "zstd":
+                compressed = self._compressor.compress(payload)
+            elif self.dictionary:
+                compressor = zlib.compressobj(self.level, zdict=self.dictionary)
+                compressed = compressor.compress(payload) + compressor.flush()
+            else:
+                compressed = zlib.compress(payload, self.level)
+            self.raw_bytes += len(payload)
+            self.compressed_bytes += len(compressed)
+        return compressed
+
+    def decompress(self, payload, user_properties=None):
+        """
+        :param payload: bytes as received
+        :param user_properties: MQTT v5 user properties of the message, without them the codec is detected from
+            the zstd magic number or falls back to this compressor's codec
+        :return: decompressed bytes
+        """
+        properties = dict(user_properties or [])
+        codec = properties.get(ENCODING_PROPERTY)
+        if codec is None:
+            codec = "zstd" if payload[:4] == ZSTD_MAGIC else self.codec
+        if codec == "none":
+            return payload
+        sent_dictionary = properties.get(DICTIONARY_PROPERTY)
+        if sent_dictionary is not None and sent_dictionary != str(self.dictionary_id):
+            raise ValueError(f"Payload was compressed with dictionary {sent_dictionary}, "
+                             f"this client has {self.dictionary_id}")
+        with self._lock:
+            if codec == "zstd":
+                decompressor = self._decompressor or _import_zstd().ZstdDecompressor()
+                return decompressor.decompressobj().decompress(payload)
+            if self.dictionary:
+                decompressor = zlib.decompressobj(zdict=self.dictionary)
+                return decompressor.decompress(payload) + decompressor.flush()
+            return zlib.decompress(payload)
+
+    def get_stats(self):
+        """
+        :return: dict with raw and compressed byte counts and the compression ratio
+        """
+        return {
+            "codec": self.codec,
+            "raw_bytes": self.raw_bytes,
+            "compressed_bytes": self.compressed_bytes,
+            "ratio": self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0.0,
+        }
+
+
+def load_samples(paths):
+    """
+    Read training samples: every file is one sample, spool directories contribute every spooled payload.
+    """
+    from mqtt_logic.spool import read_spool_payloads, SEGMENT_PREFIX
+
+    samples = []
+    for path in paths:
+        if os.path.isdir(path) and any(name.startswith(SEGMENT_PREFIX) for name in os.listdir(path)):
+            samples.extend(read_spool_payloads(path))
+        elif os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                file_path = os.path.join(path, name)
+                if os.path.isfile(file_path):
+                    with open(file_path, "rb") as sample_file:
+                        samples.append(sample_file.read())
+        else:
+            with open(path, "rb") as sample_file:
+                samples.append(sample_file.read())
+    return samples
+
+
+def train_dictionary(samples, dict_size=16 * 1024):
+    """
+    Train a zstd dictionary, also usable as a zlib preset dictionary.
+    :param samples: list of payloads (bytes)
+    :param dict_size: dictionary size in bytes
+    :return: dictionary bytes
+    """
+    zstandard = _import_zstd()
+    return zstandard.train_dictionary(dict_size, samples).as_bytes()
+
+
+def main(argv):
+    if len(argv) < 3 or argv[0] != "train":
+        print("usage: python -m mqtt_logic.compression train <output.dict> <payload files or dirs>...")
+        return 1
+    samples = load_samples(argv[2:])
+    dictionary = train_dictionary(samples)
+    with open(argv[1], "wb") as dictionary_file:
+        dictionary_file.write(dictionary)
+    print(f"Trained a {len(dictionary)} byte dictionary from {len(samples)} samples into {argv[1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
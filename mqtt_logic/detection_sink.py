@@ -0,0 +1,291 @@
+"""
+Columnar recording of received detections for long captures on a collector box.
+
+`on_message` only queues the raw payload, a worker thread decompresses and decodes it and appends every
+detection as one row to preallocated NumPy columns. The columns are written to rolling compressed files
+once `flush_rows` rows are buffered or `flush_interval` seconds passed:
+    npz      np.savez_compressed, always available
+    parquet  needs pyarrow, zstd compressed
+
+Columns: received_at (f8, epoch s), timestamp (f8, package timestamp, NaN if unknown), package (i8, running
+package number), topic and source (i4 codes into the `topics` / `sources` arrays of the file), x1, y1, x2, y2
+and confidence (f4, NaN if missing), class_id and tracker_id (i4, -1 if missing).
+Load a npz file with `np.load(path)`, each column is one array.
+"""
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from queue import Queue, Empty, Full
+
+import numpy as np
+
+FILE_FORMATS = ("npz", "parquet")
+COLUMNS = (("received_at", np.float64), ("timestamp", np.float64), ("package", np.int64),
+           ("topic", np.int32), ("source", np.int32),
+           ("x1", np.float32), ("y1", np.float32), ("x2", np.float32), ("y2", np.float32),
+           ("confidence", np.float32), ("class_id", np.int32), ("tracker_id", np.int32))
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("sink_format 'parquet' needs the pyarrow package, pip install pyarrow") from e
+    return pyarrow
+
+
+class ColumnBuffer:
+    """
+    Fixed capacity NumPy columns, rows are appended a package at a time with slice assignments.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS}
+        self.size = 0
+        # categorical string columns, value -> code
+        self.topics = {}
+        self.sources = {}
+
+    def free(self):
+        return self.capacity - self.size
+
+    @staticmethod
+    def _code(categories, value):
+        return categories.setdefault(value, len(categories))
+
+    def append(self, received_at, package_number, topic, package, start=0, stop=None):
+        """
+        Append rows [start, stop) of one decoded package.
+        :param package: dict with source_id, timestamp, xyxy, confidence, class_id, tracker_id
+        """
+        xyxy = package["xyxy"]
+        stop = len(xyxy) if stop is None else stop
+        rows = slice(self.size, self.size + stop - start)
+        columns = self.columns
+        columns["received_at"][rows] = received_at
+        timestamp = package.get("timestamp")
+        columns["timestamp"][rows] = math.nan if timestamp is None else timestamp
+        columns["package"][rows] = package_number
+        columns["topic"][rows] = self._code(self.topics, topic)
+        columns["source"][rows] = self._code(self.sources, package.get("source_id") or "")
+        for index, name in enumerate(("x1", "y1", "x2", "y2")):
+            columns[name][rows] = xyxy[start:stop, index]
+        for name, missing in (("confidence", math.nan), ("class_id", -1), ("tracker_id", -1)):
+            values = package.get(name)
+            columns[name][rows] = missing if values is None else values[start:stop]
+        self.size = rows.stop
+
+    def take(self):
+        """
+        :return: dict of the filled columns plus the topics and sources arrays, the buffer is reset
+        """
+        data = {name: column[:self.size].copy() for name, column in self.columns.items()}
+        data["topics"] = np.array(list(self.topics), dtype=str)
+        data["sources"] = np.array(list(self.sources), dtype=str)
+        self.size = 0
+        self.topics = {}
+        self.sources = {}
+        return data
+
+
+def _as_array(values, dtype):
+    return None if values is None else np.asarray(values, dtype=dtype)
+
+
+def normalize_package(item):
+    """
+    :param item: decoded package, a wire format dict or a JSON dict (detections_to_dict or to_dict output)
+    :return: dict with source_id, timestamp and xyxy (n, 4), confidence, class_id, tracker_id arrays or None
+    """
+    detections = (item["detections"] or {}) if "detections" in item else item
+    source_id = item.get("source_id")
+    xyxy = _as_array(detections.get("xyxy"), np.float32)
+    xyxy = np.zeros((0, 4), dtype=np.float32) if xyxy is None else xyxy.reshape(-1, 4)
+    metadata = detections.get("metadata") or {}
+    timestamp = item.get("timestamp", metadata.get("timestamp"))
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp).timestamp()
+    return {"source_id": source_id,
+            "timestamp": timestamp,
+            "xyxy": xyxy,
+            "confidence": _as_array(detections.get("confidence"), np.float32),
+            "class_id": _as_array(detections.get("class_id"), np.int32),
+            "tracker_id": _as_array(detections.get("tracker_id"), np.int32)}
+
+
+class DetectionSink:
+    """
+    Decodes received payloads on a worker thread and writes the detections to rolling columnar files.
+    """
+
+    def __init__(self, directory, decode_fn, file_format="npz", flush_rows=100000, flush_interval=60.0,
+                 max_queue=10000, prefix="detections"):
+        """
+        :param directory: output directory, created if missing
+        :param decode_fn: callable(payload, user_properties) -> list of decoded packages, e.g. client.deserialize
+        :param file_format: 'npz' or 'parquet'
+        :param flush_rows: rows buffered before a file is written
+        :param flush_interval: seconds after which a non empty buffer is written
+        :param max_queue: payloads queued for decoding, more are counted as dropped
+        :param prefix: file name prefix
+        """
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"Unsupported sink format: {file_format}")
+        if file_format == "parquet":
+            _import_pyarrow()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.decode_fn = decode_fn
+        self.file_format = file_format
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+        self.queue = Queue(maxsize=max_queue)
+        self.buffer = ColumnBuffer(flush_rows)
+        self.running = threading.Event()
+        self.thread = None
+        self._opened_at = time.monotonic()
+        self._file_number = 0
+
+        # metrics
+        self.messages = 0
+        self.packages = 0
+        self.rows = 0
+        self.files = 0
+        self.bytes_written = 0
+        self.dropped = 0
+        self.decode_errors = 0
+        self.skipped = 0
+
+    @classmethod
+    def from_config(cls, config, decode_fn):
+        """
+        Build from sink_dir, sink_format, sink_flush_rows, sink_flush_interval and sink_max_queue in a client
+        config.
+        """
+        return cls(config.get("sink_dir"), decode_fn,
+                   file_format=config.get("sink_format", "npz"),
+                   flush_rows=config.get("sink_flush_rows", 100000),
+                   flush_interval=config.get("sink_flush_interval", 60.0),
+                   max_queue=config.get("sink_max_queue", 10000))
+
+    def start(self):
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, name="DetectionSink", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Decode what is still queued and write the last file.
+        """
+        self.running.clear()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self._drain()
+        self.flush()
+
+    def submit(self, payload, topic, user_properties=None):
+        """
+        Queue a received payload without blocking, called from paho's network thread.
+        """
+        try:
+            self.queue.put_nowait((time.time(), topic, payload, user_properties))
+        except Full:
+            self.dropped += 1
+
+    def _run(self):
+        while self.running.is_set():
+            try:
+                item = self.queue.get(timeout=0.2)
+            except Empty:
+                item = None
+            if item is not None:
+                self._record(*item)
+            if self.buffer.size and time.monotonic() - self._opened_at >= self.flush_interval:
+                self.flush()
+
+    def _drain(self):
+        while True:
+            try:
+                self._record(*self.queue.get_nowait())
+            except Empty:
+                return
+
+    def _record(self, received_at, topic, payload, user_properties):
+        self.messages += 1
+        try:
+            batch = self.decode_fn(payload, user_properties)
+        except Exception as e:
+            self.decode_errors += 1
+            print(f"DetectionSink: failed to decode a payload on {topic}: {e}")
+            return
+        if not isinstance(batch, list):
+            # e.g. window summaries, not detections
+            self.skipped += 1
+            return
+        for item in batch:
+            if not isinstance(item, dict):
+                self.skipped += 1
+                continue
+            package = normalize_package(item)
+            count, start = len(package["xyxy"]), 0
+            # a package larger than the free space is split over files
+            while start < count:
+                stop = min(count, start + self.buffer.free())
+                self.buffer.append(received_at, self.packages, topic, package, start, stop)
+                start = stop
+                if not self.buffer.free():
+                    self.flush()
+            self.packages += 1
+            self.rows += count
+
+    def _next_path(self):
+        self._file_number += 1
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.directory, f"{self.prefix}-{stamp}-{self._file_number:06d}.{self.file_format}")
+
+    def flush(self):
+        """
+        Write the buffered rows to a new file, written under a temporary name and renamed when complete.
+        """
+        self._opened_at = time.monotonic()
+        if not self.buffer.size:
+            return None
+        data = self.buffer.take()
+        path = self._next_path()
+        temporary_path = path + ".tmp"
+        if self.file_format == "npz":
+            with open(temporary_path, "wb") as output:
+                np.savez_compressed(output, **data)
+        else:
+            pyarrow = _import_pyarrow()
+            topics, sources = data.pop("topics"), data.pop("sources")
+            table = pyarrow.table(data)
+            table = table.replace_schema_metadata({"topics": "\n".join(topics), "sources": "\n".join(sources)})
+            pyarrow.parquet.write_table(table, temporary_path, compression="zstd")
+        os.replace(temporary_path, path)
+        self.files += 1
+        self.bytes_written += os.path.getsize(path)
+        return path
+
+    def get_stats(self):
+        """
+        :return: dict with message, package, row, file and drop counts and the queue depth
+        """
+        return {
+            "messages": self.messages,
+            "packages": self.packages,
+            "rows": self.rows,
+            "buffered_rows": self.buffer.size,
+            "files": self.files,
+            "bytes_written": self.bytes_written,
+            "queue_depth": self.queue.qsize(),
+            "dropped": self.dropped,
+            "decode_errors": self.decode_errors,
+            "skipped": self.skipped,
+        }
@@ -0,0 +1,228 @@
+"""
+Minimal in-process MQTT 3.1.1 / 5 broker for exercising the clients without mosquitto.
+
+Supports CONNECT, PUBLISH (QoS 0/1), SUBSCRIBE, UNSUBSCRIBE, PINGREQ and DISCONNECT. Published messages are
+recorded in `messages` and forwarded to matching subscribers with QoS 0, MQTT v5 publish properties are
+passed through to v5 subscribers. `go_offline` / `go_online` drop and restore the listener on the same port
+to simulate an uplink outage, `hold_acks` stops sending PUBACKs.
+"""
+import socket
+import socketserver
+import struct
+import threading
+
+from paho.mqtt.client import topic_matches_sub
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def encode_remaining_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def read_exactly(connection, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("client closed the connection")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def read_packet(connection):
+    """
+    :return: (packet type, flags, body)
+    """
+    first = read_exactly(connection, 1)[0]
+    multiplier, length = 1, 0
+    while True:
+        byte = read_exactly(connection, 1)[0]
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            break
+        multiplier *= 128
+    return first >> 4, first & 0x0F, read_exactly(connection, length)
+
+
+def decode_variable_int(data, offset):
+    """
+    :return: (value, offset after it)
+    """
+    multiplier, value = 1, 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            return value, offset
+        multiplier *= 128
+
+
+def build_packet(packet_type, flags, body):
+    return bytes([(packet_type << 4) | flags]) + encode_remaining_length(len(body)) + body
+
+
+class FakeBrokerHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        broker = self.server.broker
+        connection = self.request
+        broker.register(connection)
+        self.protocol = 4
+        try:
+            while True:
+                packet_type, flags, body = read_packet(connection)
+                if packet_type == CONNECT:
+                    (name_length,) = struct.unpack_from("!H", body, 0)
+                    self.protocol = body[2 + name_length]
+                    broker.set_protocol(connection, self.protocol)
+                    # v5 CONNACK carries an (empty) property block
+                    connack = bytes([0, 0, 0]) if self.protocol == 5 else bytes([0, 0])
+                    connection.sendall(build_packet(CONNACK, 0, connack))
+                elif packet_type == PUBLISH:
+                    self._handle_publish(broker, connection, flags, body, self.protocol)
+                elif packet_type == SUBSCRIBE:
+                    packet_id = body[:2]
+                    offset, granted = 2, bytearray()
+                    if self.protocol == 5:
+                        properties_length, offset = decode_variable_int(body, offset)
+                        offset += properties_length
+                    while offset < len(body):
+                        (length,) = struct.unpack_from("!H", body, offset)
+                        topic = body[offset + 2:offset + 2 + length].decode("utf-8")
+                        offset += 3 + length
+                        broker.subscribe(connection, topic)
+                        granted.append(0)
+                    properties = b"\x00" if self.protocol == 5 else b""
+                    connection.sendall(build_packet(SUBACK, 0, packet_id + properties + bytes(granted)))
+                elif packet_type == UNSUBSCRIBE:
+                    broker.unsubscribe(connection)
+                    properties = b"\x00" if self.protocol == 5 else b""
+                    connection.sendall(build_packet(UNSUBACK, 0, body[:2] + properties))
+                elif packet_type == PINGREQ:
+                    connection.sendall(build_packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT:
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            broker.unregister(connection)
+
+    @staticmethod
+    def _handle_publish(broker, connection, flags, body, protocol):
+        qos = (flags >> 1) & 0x03
+        (length,) = struct.unpack_from("!H", body, 0)
+        topic = body[2:2 + length].decode("utf-8")
+        offset = 2 + length
+        packet_id = None
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+        properties = b"\x00"
+        if protocol == 5:
+            properties_length, payload_offset = decode_variable_int(body, offset)
+            properties = body[offset:payload_offset + properties_length]
+            offset = payload_offset + properties_length
+        broker.deliver(topic, body[offset:], qos, dup=bool(flags & 0x08), properties=properties)
+        if qos == 1 and not broker.hold_acks.is_set():
+            connection.sendall(build_packet(PUBACK, 0, packet_id))
+
+
+class FakeBroker:
+    """
+    In-process MQTT broker, usage:
+        broker = FakeBroker().start()
+        client.connect("127.0.0.1", broker.port)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+        self.messages = []
+        self.hold_acks = threading.Event()
+        self._connections = set()
+        self._protocols = {}
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((self.host, self.port), FakeBrokerHandler)
+        self.server.daemon_threads = True
+        self.server.broker = self
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
+
+    def go_offline(self):
+        """Close the listener and every client connection, the port is kept for `go_online`."""
+        self.stop()
+
+    def go_online(self):
+        self.start()
+
+    def register(self, connection):
+        with self._lock:
+            self._connections.add(connection)
+
+    def set_protocol(self, connection, protocol):
+        with self._lock:
+            self._protocols[connection] = protocol
+
+    def unregister(self, connection):
+        with self._lock:
+            self._connections.discard(connection)
+            self._protocols.pop(connection, None)
+            self._subscriptions.pop(connection, None)
+
+    def subscribe(self, connection, topic):
+        with self._lock:
+            self._subscriptions.setdefault(connection, set()).add(topic)
+
+    def unsubscribe(self, connection):
+        with self._lock:
+            self._subscriptions.pop(connection, None)
+
+    def deliver(self, topic, payload, qos, dup=False, properties=b"\x00"):
+        """
+        Record a message and forward it to the matching subscribers.
+        :param properties: encoded v5 property block including its length, forwarded to v5 subscribers only
+        """
+        with self._lock:
+            self.messages.append((topic, payload, qos, dup))
+            subscribers = [(connection, self._protocols.get(connection, 4))
+                           for connection, topics in self._subscriptions.items()
+                           if any(topic_matches_sub(pattern, topic) for pattern in topics)]
+        encoded_topic = struct.pack("!H", len(topic.encode("utf-8"))) + topic.encode("utf-8")
+        for connection, protocol in subscribers:
+            body = encoded_topic + (properties if protocol == 5 else b"") + payload
+            try:
+                connection.sendall(build_packet(PUBLISH, 0, body))
+            except OSError:
+                pass
@@ -1,7 +1,40 @@
+from mqtt_logic.detection_sink import DetectionSink
 from mqtt_logic.mqtt_client_base import BaseMQTTClient
 
 
 class LoggingMQTTClient(BaseMQTTClient):
+    def __init__(self):
+        super().__init__()
+        # records to columnar files instead of printing, enabled with sink_dir in the client config
+        self.sink = None
+
+    def populate_with_config(self, config):
+        super().populate_with_config(config)
+        if config.get("sink_dir"):
+            self.sink = DetectionSink.from_config(config, self.deserialize)
+
+    def connect(self):
+        if self.sink:
+            self.sink.start()
+        super().connect()
+
+    def disconnect(self):
+        super().disconnect()
+        if self.sink:
+            self.sink.stop()
+
     def on_message(self, client, userdata, msg):
-        payload = msg.payload.decode('utf-8')
+        properties = getattr(msg, "properties", None)
+        user_properties = getattr(properties, "UserProperty", None) if properties else None
+        if self.sink:
+            # decoded on the sink's worker thread, paho's network thread only queues the payload
+            self.sink.submit(msg.payload, msg.topic, user_properties)
+            return
+        payload = self.deserialize(msg.payload, user_properties)
         print(f"[LOG] Topic: {msg.topic}, Message: {payload}")
+
+    def get_stats(self):
+        stats = super().get_stats()
+        if self.sink:
+            stats["sink"] = self.sink.get_stats()
+        return stats
@@ -0,0 +1,221 @@
+from collections import Counter
+from concurrent.futures import Future
+from queue import Queue, Empty, Full
+import threading
+import time
+
+from utils.metrics.histogram import Histogram
+
+BACKPRESSURE_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+
+def estimate_package_bytes(data_package):
+    """
+    Rough wire size of a data package, used for the byte limit without serializing twice.
+    """
+    detections = getattr(data_package, "detections", None)
+    size = 32 + (24 * len(detections) if detections is not None else 0)
+    encoded_frame = getattr(data_package, "encoded_frame", None)
+    return size + (len(encoded_frame) if encoded_frame else 0)
+
+
+def on_publish_failed(result, callback):
+    """
+    Call `callback(error)` once for a publish whose handle fails later, e.g. with PublishDroppedError when paho
+    drops the message or its ack times out.
+    :param result: what the publish function returned, a Future, a list of them (routed publishes) or None
+    """
+    handles = [handle for handle in (result if isinstance(result, (list, tuple)) else [result])
+               if isinstance(handle, Future)]
+    state = {"failed": False}
+
+    def done(future):
+        if future.cancelled() or future.exception() is None or state["failed"]:
+            return
+        state["failed"] = True
+        callback(future.exception())
+
+    for handle in handles:
+        handle.add_done_callback(done)
+
+
+class MqttBatcher:
+    """
+    Drains data packages from a queue into MQTT batches.
+
+    A batch is flushed as soon as it holds `max_items` packages, reaches `max_bytes`, or `max_delay_s` has
+    passed since its first package arrived, whichever comes first. Everything already waiting in the queue
+    is drained in one go. Full batches go to a publisher thread through a bounded queue of
+    `max_pending_batches`; when the broker can't keep up the backpressure policy decides what happens:
+    'block' stops draining the source queue (pushing back on the pipeline), 'drop_oldest' discards the
+    oldest pending batch and 'drop_newest' discards the batch that was just closed.
+    """
+
+    def __init__(self, source_queue, publish_fn, max_items=10, max_bytes=None, max_delay_s=5.0,
+                 backpressure="block", max_pending_batches=4, size_fn=estimate_package_bytes):
+        """
+        :param source_queue: queue the data packages are taken from, e.g. AppManager.detection_queue
+        :param publish_fn: callable(batch) publishing a list of data packages
+        :param max_items: packages per batch
+        :param max_bytes: estimated payload bytes per batch, None for no byte limit
+        :param max_delay_s: maximum time the first package of a batch waits before the batch is flushed
+        :param backpressure: 'block', 'drop_oldest' or 'drop_newest'
+        :param max_pending_batches: closed batches waiting for the publisher before backpressure applies
+        :param size_fn: callable(data_package) -> estimated bytes
+        """
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unsupported backpressure policy: {backpressure}")
+        self.source_queue = source_queue
+        self.publish_fn = publish_fn
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay_s
+        self.backpressure = backpressure
+        self.size_fn = size_fn
+        self.pending = Queue(maxsize=max_pending_batches)
+        self.running = threading.Event()
+        self.collector_thread = None
+        self.publisher_thread = None
+
+        # metrics
+        self._lock = threading.Lock()
+        self.flush_reasons = Counter()
+        self.batches = 0
+        self.items = 0
+        self.dropped_batches = 0
+        self.dropped_items = 0
+        self.publish_errors = 0
+        # packages of batches whose publish raised or whose publish handle failed later (those are in items
+        # too), dropped_items only counts backpressure drops
+        self.failed_items = 0
+        self.fill_ratio = Histogram(lowest=1e-3, highest=1.0, precision=0.01)
+        self.publish_latency = Histogram()
+
+    def start(self):
+        if self.collector_thread and self.collector_thread.is_alive():
+            return
+        self.running.set()
+        self.collector_thread = threading.Thread(target=self._collect_loop, daemon=True)
+        self.publisher_thread = threading.Thread(target=self._publish_loop, daemon=True)
+        self.collector_thread.start()
+        self.publisher_thread.start()
+
+    def stop(self):
+        """
+        Stop collecting, flush the open batch and wait for the pending batches to be published.
+        """
+        self.running.clear()
+        if self.collector_thread:
+            self.collector_thread.join()
+            self.collector_thread = None
+        if self.publisher_thread:
+            self.pending.put(None)
+            self.publisher_thread.join()
+            self.publisher_thread = None
+
+    def _collect_loop(self):
+        batch, batch_bytes, deadline = [], 0, None
+        while self.running.is_set():
+            timeout = 0.5 if deadline is None else max(deadline - time.monotonic(), 0.0)
+            try:
+                item = self.source_queue.get(timeout=timeout) if timeout > 0 else self.source_queue.get_nowait()
+            except Empty:
+                item = None
+            # take the first item plus everything else that is already waiting
+            while item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.max_delay
+                batch.append(item)
+                batch_bytes += self.size_fn(item)
+                reason = self._flush_reason(batch, batch_bytes)
+                if reason:
+                    self._close_batch(batch, reason)
+                    batch, batch_bytes, deadline = [], 0, None
+                try:
+                    item = self.source_queue.get_nowait()
+                except Empty:
+                    item = None
+            if batch and time.monotonic() >= deadline:
+                self._close_batch(batch, "deadline")
+                batch, batch_bytes, deadline = [], 0, None
+        if batch:
+            self._close_batch(batch, "stop")
+
+    def _flush_reason(self, batch, batch_bytes):
+        if len(batch) >= self.max_items:
+            return "size"
+        if self.max_bytes is not None and batch_bytes >= self.max_bytes:
+            return "bytes"
+        return None
+
+    def _close_batch(self, batch, reason):
+        with self._lock:
+            self.flush_reasons[reason] += 1
+        self.fill_ratio.record(len(batch) / self.max_items)
+        if self.backpressure == "block" or reason == "stop":
+            self.pending.put(batch)
+            return
+        try:
+            self.pending.put_nowait(batch)
+            return
+        except Full:
+            pass
+        if self.backpressure == "drop_newest":
+            self._record_drop(batch)
+            return
+        # drop_oldest, make room by discarding the batch that waited longest
+        try:
+            self._record_drop(self.pending.get_nowait())
+        except Empty:
+            pass
+        try:
+            self.pending.put_nowait(batch)
+        except Full:
+            self._record_drop(batch)
+
+    def _record_drop(self, batch):
+        with self._lock:
+            self.dropped_batches += 1
+            self.dropped_items += len(batch)
+
+    def _publish_loop(self):
+        while True:
+            batch = self.pending.get()
+            if batch is None:
+                break
+            started = time.monotonic()
+            try:
+                result = self.publish_fn(batch)
+            except Exception as e:
+                self._record_failure(len(batch))
+                print(f"MqttBatcher: publish failed: {e}")
+                continue
+            on_publish_failed(result, lambda error, size=len(batch): self._record_failure(size))
+            self.publish_latency.record(time.monotonic() - started)
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+
+    def _record_failure(self, size):
+        with self._lock:
+            self.publish_errors += 1
+            self.failed_items += size
+
+    def get_stats(self):
+        """
+        :return: dict with queue depths, batch fill ratio, flush reasons, drops and publish latency
+        """
+        with self._lock:
+            return {
+                "queue_depth": self.source_queue.qsize(),
+                "pending_batches": self.pending.qsize(),
+                "batches": self.batches,
+                "items": self.items,
+                "fill_ratio": self.fill_ratio.snapshot(),
+                "flush_reasons": dict(self.flush_reasons),
+                "dropped_batches": self.dropped_batches,
+                "dropped_items": self.dropped_items,
+                "publish_errors": self.publish_errors,
+                "failed_items": self.failed_items,
+                "publish_latency_s": self.publish_latency.snapshot(),
+            }
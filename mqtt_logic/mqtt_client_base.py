@@ -1,12 +1,41 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import Future
+import time
 import paho.mqtt.client as mqtt
-import json
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from mqtt_logic.compression import PayloadCompressor
+from mqtt_logic.publish_tracker import PublishTracker
+from mqtt_logic.spool import DiskSpool, SpoolForwarder
+from utils.factories.serializer_factory import SerializerFactory
+from utils.metrics.histogram import Histogram
+from utils.metrics.registry import stage_timer
+
+PUBLISH_TIME = stage_timer("publish")
 
 class BaseMQTTClient(ABC):
     def __init__(self):
         self.host = None
         self.port = None
         self.topic = None
+        self.payload_format = "json"
+        self.serializer = None
+        self.include_frame = False
+        self.qos = 0
+        # topic or topic filter -> QoS, overrides qos for matching topics
+        self.topic_qos = {}
+        self.max_inflight = 20
+        self.max_queued = 1000
+        self.tracker = PublishTracker()
+        # seconds from frame capture to publish of every data package this client publishes
+        self.package_age = Histogram()
+        self.protocol_version = 3
+        self.compressor = PayloadCompressor()
+        self.publish_properties = None
+        # store-and-forward, enabled with spool_dir in the client config
+        self.spool = None
+        self.forwarder = None
         self.client = mqtt.Client()
 
     def initialize(self, config):
@@ -20,19 +49,98 @@ class BaseMQTTClient(ABC):
         self.host = config.get("host")
         self.port = config.get("port")
         self.topic = config.get("topic")
+        # json, binary or msgpack, see mqtt_logic/serializers.py
+        self.payload_format = config.get("payload_format", self.payload_format)
+        serializers = SerializerFactory().serializers
+        if self.payload_format not in serializers:
+            raise ValueError(f"Unsupported payload format: {self.payload_format}")
+        self.include_frame = config.get("include_frame", self.include_frame)
+        self.serializer = serializers[self.payload_format](compact=config.get("compact_payload", False),
+                                                           include_frame=self.include_frame)
+        self.qos = config.get("qos", self.qos)
+        self.topic_qos = config.get("topic_qos") or {}
+        self.protocol_version = config.get("protocol_version", self.protocol_version)
+        if self.protocol_version == 5:
+            # v5 is needed for the user properties that mark the payload encoding
+            self.client = mqtt.Client(protocol=mqtt.MQTTv5)
+        # QoS 1/2 messages beyond the inflight window wait in paho's queue, beyond max_queued (inflight included)
+        # publishes are refused and counted as dropped
+        self.max_inflight = config.get("max_inflight", self.max_inflight)
+        self.max_queued = config.get("max_queued", self.max_queued)
+        self.client.max_inflight_messages_set(self.max_inflight)
+        self.client.max_queued_messages_set(self.max_queued)
+        self.tracker = PublishTracker(ack_timeout_s=config.get("ack_timeout", 60.0))
+        # zstd/zlib compression, see mqtt_logic/compression.py
+        self.compressor = PayloadCompressor.from_config(config)
+        self.publish_properties = self.create_publish_properties()
+        if config.get("spool_dir"):
+            self.create_spool(config)
 
-    def connect(self):
+    def create_spool(self, config):
+        """
+        Spool every payload to disk and publish it with QoS 1 from there, see mqtt_logic/spool.py.
+        spool_dir, spool_segment_bytes, spool_max_bytes, spool_fsync, replay_rate (payloads/s) and
+        max_inflight are read from the client config.
+        """
+        self.qos = 1
+        self.spool = DiskSpool(config.get("spool_dir"),
+                               segment_bytes=config.get("spool_segment_bytes", 4 * 1024 * 1024),
+                               max_bytes=config.get("spool_max_bytes", 256 * 1024 * 1024),
+                               fsync=config.get("spool_fsync", False)).open()
+        self.forwarder = SpoolForwarder(self.spool, self._publish_now,
+                                        replay_rate=config.get("replay_rate", 20.0),
+                                        max_inflight=self.max_inflight)
+        # bound paho's in-memory queue, the spool holds everything else
+        self.client.max_queued_messages_set(self.max_inflight)
+        if self.spool.recovered:
+            print(f"Recovered {self.spool.recovered} unsent payloads from {self.spool.directory}")
+
+    def create_publish_properties(self):
+        """
+        :return: MQTT v5 publish properties with the content encoding, None on MQTT 3.1.1 or without compression
+        """
+        if self.protocol_version != 5 or not self.compressor.enabled:
+            return None
+        properties = Properties(PacketTypes.PUBLISH)
+        properties.UserProperty = self.compressor.user_properties()
+        return properties
+
+    def attach_callbacks(self):
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message  # Attach subclass-specific `on_message`
-        self.client.connect(self.host, self.port, 60)
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.on_publish
 
-    def on_connect(self, client, userdata, flags, rc):
+    def connect(self):
+        self.attach_callbacks()
+        if self.forwarder is None:
+            self.client.connect(self.host, self.port, 60)
+            return
+        # with a spool the broker may be down at start up, paho keeps retrying in its loop thread
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.connect_async(self.host, self.port, 60)
+        self.forwarder.start()
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         if rc == 0:
             print(f"Connected to MQTT broker at {self.host}:{self.port}")
-            client.subscribe(self.topic)
+            client.subscribe(self.topic, qos=self.qos)
+            if self.forwarder:
+                self.forwarder.on_connect()
         else:
             print(f"Failed to connect, return code {rc}")
 
+    def on_disconnect(self, client, userdata, rc, properties=None):
+        if self.forwarder:
+            self.forwarder.on_disconnect()
+        if rc != 0:
+            print(f"Lost connection to MQTT broker, return code {rc}")
+
+    def on_publish(self, client, userdata, mid):
+        self.tracker.on_publish(mid)
+        if self.forwarder:
+            self.forwarder.on_publish(mid)
+
     @abstractmethod
     def on_message(self, client, userdata, msg):
         """
@@ -48,10 +156,97 @@ class BaseMQTTClient(ABC):
         self.client.loop_stop()
 
     def disconnect(self):
+        if self.forwarder:
+            self.forwarder.stop()
+            self.spool.close()
         self.client.disconnect()
         print("Disconnected from MQTT broker")
 
-    def publish(self, data):
-        payload = json.dumps(data)
-        self.client.publish(self.topic, payload)
-        #print(f"Published: {payload}")
\ No newline at end of file
+    def serialize(self, batch):
+        """
+        :param batch: list of data packages
+        :return: payload in this client's payload format
+        """
+        return self.serializer.serialize(batch)
+
+    def deserialize(self, payload, user_properties=None):
+        """
+        :param payload: payload as received, compressed or not
+        :param user_properties: MQTT v5 user properties of the message
+        :return: decoded batch
+        """
+        return self.serializer.deserialize(self.compressor.decompress(payload, user_properties))
+
+    def qos_for(self, topic):
+        """
+        :return: QoS of the topic, an exact topic_qos entry wins over a matching filter, qos otherwise
+        """
+        if topic in self.topic_qos:
+            return self.topic_qos[topic]
+        for pattern, qos in self.topic_qos.items():
+            if mqtt.topic_matches_sub(pattern, topic):
+                return qos
+        return self.qos
+
+    def publish(self, data, topic=None, qos=None):
+        """
+        Publish without blocking.
+        :param data: an already serialized payload (str or bytes) or a list of data packages
+        :param topic: topic to publish on, defaults to the configured topic. Spooled payloads always go to the
+            configured topic.
+        :param qos: QoS of this message, defaults to the QoS of the topic
+        :return: Future resolved with the mid once paho acks the message, failed with PublishDroppedError when it
+            is dropped. With a spool the future is resolved once the payload is on disk.
+        """
+        with PUBLISH_TIME.time():
+            return self._publish(data, topic, qos)
+
+    def _publish(self, data, topic, qos):
+        if isinstance(data, (str, bytes, bytearray)):
+            payload = data
+        else:
+            self.record_ages(data)
+            payload = self.serialize(data)
+        payload = self.compressor.compress(payload)
+        if self.spool is not None:
+            # written to disk first, the forwarder publishes it once the broker is reachable
+            self.spool.append(payload)
+            self.forwarder.notify()
+            future = Future()
+            future.set_result(None)
+            return future
+        topic = topic or self.topic
+        qos = self.qos_for(topic) if qos is None else qos
+        started = self.tracker.start()
+        info = self.client.publish(topic, payload, qos=qos, properties=self.publish_properties)
+        return self.tracker.track(info, qos, started)
+
+    def record_ages(self, batch):
+        """
+        Record how long ago the frames of a batch were captured, packages without a capture time are skipped.
+        """
+        now = time.time()
+        for item in batch:
+            capture_time = getattr(item, "capture_time", None)
+            if capture_time is not None:
+                self.package_age.record(now - capture_time)
+
+    def _publish_now(self, payload):
+        """
+        :return: mid of the QoS 1 publish, None if paho did not accept it
+        """
+        started = self.tracker.start()
+        info = self.client.publish(self.topic, payload, qos=1, properties=self.publish_properties)
+        # NO_CONN means paho queued the message and sends it after reconnecting, QUEUE_SIZE means it dropped it
+        self.tracker.track(info, 1, started)
+        return info.mid if info.rc in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN) else None
+
+    def get_stats(self):
+        """
+        :return: publish, package age, compression, spool and forwarder metrics
+        """
+        stats = {"publish": self.tracker.get_stats(), "package_age_s": self.package_age.snapshot(),
+                 "compression": self.compressor.get_stats()}
+        if self.forwarder:
+            stats["spool"] = self.forwarder.get_stats()
+        return stats
\ No newline at end of file
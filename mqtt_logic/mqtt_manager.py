@@ -1,10 +1,12 @@
+import json
+
 from app.base_classes.manager import BaseManager
 from utils.configs.config_base import Config
 from utils.factories.mqtt_client_factory import MqttClientFactory
-import threading
-from queue import Empty
-import time
-import json
+from mqtt_logic.mqtt_batcher import MqttBatcher
+from mqtt_logic.async_loop import AsyncioMqttLoop
+from mqtt_logic.mqtt_router import MqttRouter, RoutingRule, group_by_route
+from utils.data_package.frame_encoder import FrameEncoder
 
 from utils.configs.config_manager import ConfigManager
 
@@ -16,68 +18,141 @@ class MQTTManager(BaseManager):
         super().__init__()
         self.mqtt_client = None
         self.client = None
+        # every client by name, mqtt_client is the first one
+        self.mqtt_clients = {}
+        self.routes = []
+        self.router = None
+        self.max_route_queue = 100
+        # JPEG encoder shared by every client that sets include_frame, a package caches one encoded frame so the
+        # encoder settings are read from the MqttManager config, not per client
+        self.frame_encoder = None
+        # asyncio runtime, client name -> AsyncioMqttLoop driving the client instead of paho's loop thread
+        self.async_loops = {}
 
         self.is_connected = False
         self.config_manager = ConfigManager()
-        # Thread management
-        self._stop_event = threading.Event()
-        self.batching_thread = None
         self.client_factory = MqttClientFactory()
+        # batching, see mqtt_logic/mqtt_batcher.py
+        self.batcher = None
+        self.batch_size = 10
+        self.batch_interval = 5.0
+        self.max_batch_bytes = None
+        self.backpressure = "block"
+        self.max_pending_batches = 4
 
     def initialize(self, mqtt_config: Config, client_type):
-
-        config_path = mqtt_config.get('sender')
-        mqtt_config = self.config_manager.create_config_object(config_path=config_path)
-        # get the client type from the config
-
-        # create client class from config type
-        self.mqtt_client = self.client_factory.clients[client_type]()
-        # assign the class' client to the managers client for readability
+        self.batch_size = mqtt_config.get("batch_size", self.batch_size)
+        self.batch_interval = mqtt_config.get("batch_interval", self.batch_interval)
+        self.max_batch_bytes = mqtt_config.get("max_batch_bytes", self.max_batch_bytes)
+        self.backpressure = mqtt_config.get("backpressure", self.backpressure)
+        self.max_pending_batches = mqtt_config.get("max_pending_batches", self.max_pending_batches)
+
+        self.max_route_queue = mqtt_config.get("max_route_queue", self.max_route_queue)
+
+        # several clients with `clients`, otherwise the single `sender` client
+        client_entries = mqtt_config.get("clients") or [{"name": "sender", "config": mqtt_config.get('sender'),
+                                                         "type": client_type}]
+        for entry in client_entries:
+            self.mqtt_clients[entry["name"]] = self.create_client(entry["config"], entry.get("type"))
+        self.routes = [RoutingRule.from_dict(rule) for rule in mqtt_config.get("routes") or []]
+        if any(mqtt_client.include_frame for mqtt_client in self.mqtt_clients.values()):
+            # frames are JPEG encoded off the batching thread, see utils/data_package/frame_encoder.py
+            self.frame_encoder = FrameEncoder()
+            self.frame_encoder.populate_with_config(mqtt_config)
+
+        self.mqtt_client = next(iter(self.mqtt_clients.values()))
+        # assign the class' client to the managers client for readability, after initialize as the config
+        # may swap it for an MQTT v5 client
         self.client = self.mqtt_client.client
 
-        # initialize client
-        print('Loading', mqtt_config)
-        self.mqtt_client.initialize(mqtt_config)
+    def create_client(self, config_path, client_type=None):
+        """
+        Create and initialize a client from its YAML.
+        :param config_path: path to the client config
+        :param client_type: MqttSender or MqttLogger, defaults to the `type` of the client config
+        """
+        config_dict = self.config_manager.load_config(config_path)
+        client_config = self.config_manager.create_config_object(config_dict=config_dict)
+        # create client class from config type
+        mqtt_client = self.client_factory.clients[client_type or config_dict['type']]()
+        print('Loading', client_config)
+        mqtt_client.initialize(client_config)
+        return mqtt_client
 
     def run(self):
         """
-        Start the MQTT client connection and loop.
+        Start the connection and network loop of every MQTT client, each client runs its own paho loop thread.
         """
         try:
-            self.mqtt_client.connect()
-            self.mqtt_client.loop_start()
+            for mqtt_client in self.mqtt_clients.values():
+                mqtt_client.connect()
+                mqtt_client.loop_start()
             self.is_connected = True
-            print("MQTTManager: Started MQTT client.")
+            print(f"MQTTManager: Started {len(self.mqtt_clients)} MQTT client(s).")
         except Exception as e:
             print(f"MQTTManager: Failed to start MQTT client. Error: {e}")
             self.is_connected = False
 
 
+    async def run_async(self, loop):
+        """
+        Connect every MQTT client with its network loop driven by the asyncio event loop.
+        :param loop: the running event loop
+        """
+        for name, mqtt_client in self.mqtt_clients.items():
+            self.async_loops[name] = AsyncioMqttLoop(loop, mqtt_client)
+            await self.async_loops[name].connect()
+        self.is_connected = True
+        print(f"MQTTManager: Started {len(self.mqtt_clients)} MQTT client(s) on the event loop.")
+
+    async def stop_async(self):
+        for async_loop in self.async_loops.values():
+            await async_loop.disconnect()
+        self.async_loops = {}
+        self.is_connected = False
+        if self.frame_encoder:
+            self.frame_encoder.stop()
+        print("MQTTManager: Stopped MQTT clients.")
+
+    def publish_routed(self, batch):
+        """
+        Publish a batch with every client it is routed to, the synchronous counterpart of the MqttRouter used
+        by the asyncio runtime. Without several clients or routes this is `publish_batch`.
+        :return: list of publish handles
+        """
+        if len(self.mqtt_clients) == 1 and not self.routes:
+            return [self.publish_batch(batch)]
+        rules = self.routes or [RoutingRule(name) for name in self.mqtt_clients]
+        return [self.mqtt_clients[client].publish(packages, topic=topic)
+                for (client, topic), packages in group_by_route(rules, self.mqtt_clients, batch).items()]
+
     def stop(self):
         """
-        Stop the MQTT client connection and loop.
+        Stop the connection and loop of every MQTT client.
         """
         if self.is_connected:
-            self.mqtt_client.loop_stop()
-            self.mqtt_client.disconnect()
+            # disconnect first, paho's loop thread does not exit while messages wait for their ack
+            for mqtt_client in self.mqtt_clients.values():
+                mqtt_client.disconnect()
+                mqtt_client.loop_stop()
             self.is_connected = False
-            print("MQTTManager: Stopped MQTT client.")
+            if self.frame_encoder:
+                self.frame_encoder.stop()
+            print("MQTTManager: Stopped MQTT clients.")
 
     def publish_batch(self, batch):
         """
-        Serialize and publish an entire batch of data packages via MQTT as a single payload.
+        Serialize and publish an entire batch of data packages via MQTT as a single payload, in the payload
+        format of the client.
+        :return: publish handle of the client
+        :raises ConnectionError: if the client is not connected and has no spool, the batcher counts the batch as
+            failed
         """
-        if not self.is_connected:
-            print("MQTTManager: Cannot publish batch, MQTT client is not connected.")
-            return
+        if not self.is_connected and self.mqtt_client.spool is None:
+            raise ConnectionError("MQTT client is not connected")
 
-        try:
-            # Serialize the entire batch to a JSON string
-            batch_payload = json.dumps(batch)
-            self.mqtt_client.publish(batch_payload)
-            print(f"MQTTManager: Published batch with {len(batch)} items.")
-        except Exception as e:
-            print(f"MQTTManager: Failed to publish batch. Error: {e}")
+        # the client serializes the entire batch in its payload format, errors are counted by the batcher
+        return self.mqtt_client.publish(batch)
 
     def publish_data_package(self, data_package):
         """
@@ -89,61 +164,72 @@ class MQTTManager(BaseManager):
             return
 
         try:
-            # Ensure data_package is serialized
-            if not isinstance(data_package, dict):
-                data_package = data_package.to_dict()
-            payload = json.dumps(data_package)
+            payload = self.mqtt_client.serialize([data_package])
             self.mqtt_client.publish(payload)
             print(f"MQTTManager: Published single data package.")
         except Exception as e:
             print(f"MQTTManager: Failed to publish data package. Error: {e}")
 
+    def publish_summary(self, summary, topic=None):
+        """
+        Publish a window summary (see utils/data_package/window_aggregator.py) as JSON with the first client.
+        :param summary: summary dict
+        :param topic: topic to publish on, defaults to the client's topic. Spooled clients always use their topic.
+        :return: publish handle of the client, None if not connected
+        """
+        if not self.is_connected and self.mqtt_client.spool is None:
+            print("MQTTManager: Cannot publish summary, MQTT client is not connected.")
+            return None
+        return self.mqtt_client.publish(json.dumps(summary), topic=topic)
+
     def set_name(self):
         self.name = "MQTTManager"
 
-    def send_batch_data(self, batch_size=10, batch_interval=5, get_data_fn=None):
-        batch = []  # Initialize the batch
-        start_time = time.time()
-
-        while not self._stop_event.is_set():  # Check the stop event to exit the loop
-            try:
-
-                # Add detection data to the batch
-                data_package = get_data_fn()
-                assert isinstance(data_package, dict), "data package must be a dict "
-                batch.append(data_package)
-                # Check if batch is ready to be sent
-                if len(batch) >= batch_size or (time.time() - start_time) >= batch_interval:
-                    self.publish_batch(batch)
-                    print(f"Published batch of size: {len(batch)}")
-
-                    # Reset the batch and timer
-                    batch = []
-                    start_time = time.time()
-
-            except Empty:
-                print("Empty queue, waiting for inference...")
-
-            except Exception as e:
-                print(f"Error during inference batching: {e}")
-
-    def start_batching(self, batch_size=10, batch_interval=5, get_data_fn=None):
+    def start_batching(self, source_queue, batch_size=None, batch_interval=None):
         """
-        Start the batching and MQTT publishing logic in a separate thread.
+        Start draining `source_queue` into batches that are published from a separate thread.
+        :param source_queue: queue of data packages, e.g. AppManager.detection_queue
+        :param batch_size: packages per batch, defaults to the config value
+        :param batch_interval: seconds the first package of a batch waits at most, defaults to the config value
+
+        With several clients or routing rules the packages go through a MqttRouter, which batches every
+        (client, topic) route on its own threads.
         """
-        self._stop_event.clear()
-        self.batching_thread = threading.Thread(
-            target=self.send_batch_data,
-            args=(batch_size, batch_interval, get_data_fn),
-            daemon=True
-        )
-        self.batching_thread.start()
+        self.stop_batching()
+        batcher_options = dict(max_items=batch_size or self.batch_size,
+                               max_bytes=self.max_batch_bytes,
+                               max_delay_s=batch_interval or self.batch_interval,
+                               backpressure=self.backpressure,
+                               max_pending_batches=self.max_pending_batches)
+        if len(self.mqtt_clients) > 1 or self.routes:
+            self.router = MqttRouter(self.mqtt_clients, self.routes, max_queue=self.max_route_queue,
+                                     **batcher_options)
+            self.router.start(source_queue)
+            return
+        self.batcher = MqttBatcher(source_queue, self.publish_batch, **batcher_options)
+        self.batcher.start()
 
     def stop_batching(self):
         """
-        Stop the batching thread.
+        Stop the batcher or router, flushing what it already collected.
+        """
+        if self.batcher:
+            self.batcher.stop()
+            self.batcher = None
+        if self.router:
+            self.router.stop()
+            self.router = None
+
+    def get_stats(self):
+        """
+        :return: batcher and client metrics, with several clients the router and per client metrics
         """
-        self._stop_event.set()
-        if self.batching_thread:
-            self.batching_thread.join()
-            self.batching_thread = None
\ No newline at end of file
+        if len(self.mqtt_clients) > 1:
+            return {"router": self.router.get_stats() if self.router else {},
+                    "clients": {name: mqtt_client.get_stats() for name, mqtt_client in self.mqtt_clients.items()}}
+        stats = self.batcher.get_stats() if self.batcher else {}
+        if self.router:
+            stats["router"] = self.router.get_stats()
+        if self.mqtt_client:
+            stats.update(self.mqtt_client.get_stats())
+        return stats
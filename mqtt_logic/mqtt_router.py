@@ -0,0 +1,201 @@
+from queue import Queue, Empty, Full
+import threading
+
+from mqtt_logic.mqtt_batcher import MqttBatcher
+
+PAYLOAD_TYPES = ("any", "detections", "frames")
+
+
+class RoutingRule:
+    """
+    Decides which data packages go to one client (and topic).
+
+    A package matches when every filter that is set matches: `sources` (stream source ids), `classes`
+    (class ids or labels, any detection of the package counts) and `payload` ('detections' needs at least one
+    detection, 'frames' needs a frame that is being sent).
+    """
+
+    def __init__(self, client, topic=None, sources=None, classes=None, payload="any"):
+        """
+        :param client: name of the client the packages are published with
+        :param topic: topic to publish on, defaults to the client's topic
+        :param sources: list of source ids, None for all
+        :param classes: list of class ids or labels, None for all
+        :param payload: 'any', 'detections' or 'frames'
+        """
+        if payload not in PAYLOAD_TYPES:
+            raise ValueError(f"Unsupported route payload: {payload}")
+        self.client = client
+        self.topic = topic
+        self.sources = set(sources) if sources else None
+        self.class_ids = {value for value in classes or [] if isinstance(value, int)}
+        self.class_labels = {value for value in classes or [] if isinstance(value, str)}
+        self.payload = payload
+
+    @classmethod
+    def from_dict(cls, rule):
+        return cls(client=rule["client"], topic=rule.get("topic"), sources=rule.get("sources"),
+                   classes=rule.get("classes"), payload=rule.get("payload", "any"))
+
+    @staticmethod
+    def _labels(data_package):
+        """
+        :return: label of every detection, from supervision's class_name data or the package labels
+        """
+        detections = data_package.detections
+        if "class_name" in detections.data:
+            return [str(label) for label in detections.data["class_name"]]
+        labels = data_package.labels
+        if labels is None or detections.class_id is None:
+            return []
+        return [str(labels[int(class_id)]) for class_id in detections.class_id
+                if (int(class_id) in labels if isinstance(labels, dict) else int(class_id) < len(labels))]
+
+    def _matches_classes(self, data_package):
+        if not self.class_ids and not self.class_labels:
+            return True
+        detections = data_package.detections
+        if detections is None or len(detections) == 0:
+            return False
+        if self.class_ids and detections.class_id is not None \
+                and any(int(class_id) in self.class_ids for class_id in detections.class_id):
+            return True
+        return bool(self.class_labels) and any(label in self.class_labels for label in self._labels(data_package))
+
+    def matches(self, data_package):
+        if self.sources is not None and data_package.source_id not in self.sources:
+            return False
+        detections = data_package.detections
+        if self.payload == "detections" and (detections is None or len(detections) == 0):
+            return False
+        if self.payload == "frames" and (data_package.frame is None or not data_package.send_frame):
+            return False
+        return self._matches_classes(data_package)
+
+
+def route_targets(rules, clients, data_package):
+    """
+    :return: set of (client name, topic) the package is routed to, each at most once
+    """
+    return {(rule.client, rule.topic or clients[rule.client].topic) for rule in rules if rule.matches(data_package)}
+
+
+def group_by_route(rules, clients, batch):
+    """
+    :return: dict of (client name, topic) -> list of the batch's packages routed there, in batch order
+    """
+    groups = {}
+    for data_package in batch:
+        for key in route_targets(rules, clients, data_package):
+            groups.setdefault(key, []).append(data_package)
+    return groups
+
+
+class RouteWorker:
+    """
+    Queue and batcher for one (client, topic) pair. Each worker publishes from its own threads, so a slow
+    broker only backs up its own queue.
+    """
+
+    def __init__(self, client, topic, max_queue=100, **batcher_options):
+        self.client = client
+        self.topic = topic
+        self.queue = Queue(maxsize=max_queue)
+        self.batcher = MqttBatcher(self.queue, self.publish, **batcher_options)
+        self.routed = 0
+        self.dropped = 0
+
+    def publish(self, batch):
+        return self.client.publish(batch, topic=self.topic)
+
+    def offer(self, data_package):
+        """
+        Queue a package without blocking, a full queue drops it for this route only.
+        """
+        try:
+            self.queue.put_nowait(data_package)
+            self.routed += 1
+        except Full:
+            self.dropped += 1
+
+    def get_stats(self):
+        stats = self.batcher.get_stats()
+        stats.update({"routed": self.routed, "dropped_routing": self.dropped})
+        return stats
+
+
+class MqttRouter:
+    """
+    Fans data packages out to several MQTT clients by routing rules.
+
+    Packages are taken from one source queue and offered to the worker of every matching rule. Without
+    rules every package goes to every client.
+    """
+
+    def __init__(self, clients, rules=None, max_queue=100, **batcher_options):
+        """
+        :param clients: dict of client name -> BaseMQTTClient
+        :param rules: list of RoutingRule
+        :param max_queue: per route queue size before packages are dropped for that route
+        :param batcher_options: MqttBatcher options (max_items, max_bytes, max_delay_s, backpressure, ...)
+        """
+        self.clients = clients
+        self.rules = rules or [RoutingRule(name) for name in clients]
+        self.workers = {}
+        for rule in self.rules:
+            if rule.client not in clients:
+                raise ValueError(f"Route for unknown MQTT client: {rule.client}")
+            client = clients[rule.client]
+            topic = rule.topic or client.topic
+            if client.spool is not None and topic != client.topic:
+                raise ValueError(f"Client {rule.client} spools to disk, its routes can't override the topic")
+            key = (rule.client, topic)
+            if key not in self.workers:
+                self.workers[key] = RouteWorker(client, topic, max_queue=max_queue, **batcher_options)
+        self.source_queue = None
+        self.running = threading.Event()
+        self.thread = None
+        self.unrouted = 0
+
+    def route(self, data_package):
+        """
+        Offer a package to every route it matches, each (client, topic) gets it at most once.
+        """
+        targets = route_targets(self.rules, self.clients, data_package)
+        if not targets:
+            self.unrouted += 1
+        for key in targets:
+            self.workers[key].offer(data_package)
+
+    def start(self, source_queue):
+        self.source_queue = source_queue
+        for worker in self.workers.values():
+            worker.batcher.start()
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running.is_set():
+            try:
+                data_package = self.source_queue.get(timeout=0.5)
+            except Empty:
+                continue
+            self.route(data_package)
+
+    def stop(self):
+        self.running.clear()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        for worker in self.workers.values():
+            worker.batcher.stop()
+
+    def get_stats(self):
+        """
+        :return: dict with unrouted count and per route batcher stats, keyed 'client:topic'
+        """
+        return {
+            "unrouted": self.unrouted,
+            "routes": {f"{client}:{topic}": worker.get_stats() for (client, topic), worker in self.workers.items()},
+        }
@@ -0,0 +1,158 @@
+"""
+Future-like handles and publish-to-ack metrics for MQTT publishes.
+
+paho acknowledges a publish through `on_publish(mid)`: for QoS 0 once the packet is written to the socket,
+for QoS 1 on PUBACK and for QoS 2 on PUBCOMP. The tracker maps every mid to a Future, resolves it from the
+network thread and records the time from the publish call to that callback per QoS level.
+"""
+from concurrent.futures import Future
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from utils.metrics.histogram import Histogram
+
+# an ack only beats its `track` call by the time between `client.publish` returning and `track`, unmatched early
+# acks older than this are dropped so they can't resolve a later publish that reuses the mid
+EARLY_ACK_MAX_AGE_S = 5.0
+
+
+class PublishDroppedError(RuntimeError):
+    """A publish that paho refused (queue full, not connected without queueing) or that was never acked."""
+
+
+class PublishTracker:
+    """
+    Tracks the publishes of one client. `track` never blocks, paho's inflight window and queue limit bound the
+    memory and a refused publish only fails its handle and counts as dropped.
+    """
+
+    def __init__(self, ack_timeout_s=60.0):
+        """
+        :param ack_timeout_s: seconds after which a publish that was never acked fails its handle, e.g. QoS 0
+            messages paho discards when the connection drops
+        """
+        self.ack_timeout_s = ack_timeout_s
+        self._lock = threading.Lock()
+        # mid -> (future, qos, start time), insertion ordered so the oldest publish is first
+        self._pending = {}
+        # acks that arrived before `track` registered their mid, mid -> ack time
+        self._early_acks = {}
+        # mids that timed out, mid -> expiry time, their late acks are ignored. Kept for another ack_timeout_s or
+        # until paho hands the mid out again
+        self._expired = {}
+        self.latency = {qos: Histogram() for qos in (0, 1, 2)}
+
+        # metrics
+        self.published = 0
+        self.acked = 0
+        self.dropped = 0
+        self.timed_out = 0
+        self.late_acks = 0
+
+    @staticmethod
+    def start():
+        """
+        :return: start time to pass to `track`, taken right before `client.publish`
+        """
+        return time.perf_counter()
+
+    def track(self, info, qos, started):
+        """
+        :param info: MQTTMessageInfo returned by `client.publish`
+        :param qos: QoS the message was published with
+        :param started: value of `start()` taken before publishing
+        :return: Future resolved with the mid once acked, failed with PublishDroppedError if paho refused it
+        """
+        future = Future()
+        self._expire()
+        # NO_CONN means paho queued the message and sends it after reconnecting
+        if info.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+            with self._lock:
+                self.dropped += 1
+            future.set_exception(PublishDroppedError(f"publish refused: {mqtt.error_string(info.rc)}"))
+            return future
+        with self._lock:
+            self.published += 1
+            self._expired.pop(info.mid, None)
+            acked_at = self._early_acks.pop(info.mid, None)
+            if acked_at is None:
+                self._pending[info.mid] = (future, qos, started)
+                return future
+            self.acked += 1
+        self.latency[qos].record(acked_at - started)
+        future.set_result(info.mid)
+        return future
+
+    def on_publish(self, mid):
+        """
+        Called from `on_publish` on paho's network thread, resolves the handle outside the lock.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            entry = self._pending.pop(mid, None)
+            if entry is None:
+                if self._expired.pop(mid, None) is not None:
+                    # acked after its handle already failed
+                    self.late_acks += 1
+                else:
+                    self._early_acks[mid] = now
+                return
+            self.acked += 1
+        future, qos, started = entry
+        self.latency[qos].record(now - started)
+        future.set_result(mid)
+
+    def _expire(self):
+        """
+        Fail the handles of publishes older than ack_timeout_s, the oldest publish is checked first. Also ages out
+        the expired mids and unmatched early acks, both dicts are in time order.
+        """
+        now = time.perf_counter()
+        deadline = now - self.ack_timeout_s
+        expired = []
+        with self._lock:
+            while self._pending:
+                mid, (future, qos, started) = next(iter(self._pending.items()))
+                if started > deadline:
+                    break
+                del self._pending[mid]
+                self._expired[mid] = now
+                expired.append(future)
+            self.timed_out += len(expired)
+            self._prune(self._expired, deadline)
+            self._prune(self._early_acks, now - EARLY_ACK_MAX_AGE_S)
+        for future in expired:
+            future.set_exception(PublishDroppedError(f"publish not acked within {self.ack_timeout_s}s"))
+
+    @staticmethod
+    def _prune(times, oldest):
+        """
+        Remove the entries of a mid -> time dict that are older than `oldest`, the oldest entry is first.
+        """
+        while times:
+            mid, at = next(iter(times.items()))
+            if at > oldest:
+                break
+            del times[mid]
+
+    @property
+    def inflight(self):
+        return len(self._pending)
+
+    def get_stats(self):
+        """
+        :return: dict with publish, ack, drop and timeout counts, pending publishes and per QoS latency
+        """
+        self._expire()
+        return {
+            "published": self.published,
+            "acked": self.acked,
+            "dropped": self.dropped,
+            "timed_out": self.timed_out,
+            "late_acks": self.late_acks,
+            "inflight": self.inflight,
+            "ack_latency_s": {f"qos{qos}": histogram.snapshot()
+                              for qos, histogram in self.latency.items() if histogram.count},
+        }
@@ -0,0 +1,120 @@
+from abc import ABC, abstractmethod
+import json
+
+from mqtt_logic.wire_format import WIRE_VERSION, encode_package, decode_package, encode_batch, decode_batch
+
+
+def encode_data_package(item, compact=False, include_frame=False):
+    """
+    :param item: data package
+    :param compact: pack boxes, confidence and class ids as uint16
+    :param include_frame: append the package's JPEG frame, raw bytes without base64
+    :return: bytes of the encoded package
+    """
+    detections = getattr(item, "detections", None)
+    if detections is None:
+        raise TypeError(f"Binary payloads need data packages with detections, got {type(item).__name__}")
+    # uses the bytes cached by the FrameEncoder stage, encodes inline only if the package skipped it
+    frame = item.encode_frame_jpeg() if include_frame else None
+    # the capture time of the frame, the detections metadata timestamp for packages that were never stamped
+    return encode_package(detections, item.source_id, timestamp=getattr(item, "capture_time", None),
+                          compact=compact, frame=frame)
+
+
+class PayloadSerializer(ABC):
+    """
+    Turns a batch of data packages into an MQTT payload and back. Picked per client with `payload_format`
+    in the MQTT client YAML.
+    """
+
+    @abstractmethod
+    def serialize(self, batch):
+        """
+        :param batch: list of data packages
+        :return: str or bytes payload
+        """
+        pass
+
+    @abstractmethod
+    def deserialize(self, payload):
+        """
+        :param payload: payload received from the broker
+        :return: list of decoded packages
+        """
+        pass
+
+
+class JsonSerializer(PayloadSerializer):
+    """
+    The original format, a JSON list with the detections dict of every package. With include_frame every
+    item is the package's to_dict(), frame as base64 JPEG.
+    """
+
+    def __init__(self, compact=False, include_frame=False):
+        """
+        :param compact: unused, JSON is always sent in full
+        :param include_frame: send the base64 JPEG frame with the detections
+        """
+        self.compact = compact
+        self.include_frame = include_frame
+
+    def serialize(self, batch):
+        items = []
+        for item in batch:
+            if isinstance(item, dict):
+                items.append(item)
+            elif self.include_frame:
+                items.append(item.to_dict())
+            elif hasattr(item, "detections_to_dict"):
+                items.append(item.detections_to_dict())
+            else:
+                items.append(item.to_dict()["detections"])
+        return json.dumps(items)
+
+    def deserialize(self, payload):
+        if isinstance(payload, (bytes, bytearray)):
+            payload = payload.decode("utf-8")
+        return json.loads(payload)
+
+
+class BinarySerializer(PayloadSerializer):
+    """Length prefixed batch of packed packages, see mqtt_logic.wire_format."""
+
+    def __init__(self, compact=False, include_frame=False):
+        """
+        :param compact: pack boxes, confidence and class ids as uint16
+        :param include_frame: send the JPEG frame as raw bytes
+        """
+        self.compact = compact
+        self.include_frame = include_frame
+
+    def serialize(self, batch):
+        return encode_batch([encode_data_package(item, self.compact, self.include_frame) for item in batch])
+
+    def deserialize(self, payload):
+        return decode_batch(payload)
+
+
+class MsgpackSerializer(PayloadSerializer):
+    """Packed packages framed in a msgpack map, for consumers that already speak msgpack."""
+
+    def __init__(self, compact=False, include_frame=False):
+        """
+        :param compact: pack boxes, confidence and class ids as uint16
+        :param include_frame: send the JPEG frame as raw bytes
+        """
+        self.compact = compact
+        self.include_frame = include_frame
+        try:
+            import msgpack
+        except ImportError as e:
+            raise ImportError("payload_format 'msgpack' needs the msgpack package, pip install msgpack") from e
+        self.msgpack = msgpack
+
+    def serialize(self, batch):
+        packages = [encode_data_package(item, self.compact, self.include_frame) for item in batch]
+        return self.msgpack.packb({"v": WIRE_VERSION, "packages": packages}, use_bin_type=True)
+
+    def deserialize(self, payload):
+        frame = self.msgpack.unpackb(payload, raw=False)
+        return [decode_package(package)[0] for package in frame["packages"]]
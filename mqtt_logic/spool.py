@@ -0,0 +1,410 @@
+"""
+Disk-backed store-and-forward spool for MQTT payloads.
+
+Every serialized batch is appended to a segment file before it is published. Segments are rotated at
+`segment_bytes` and the spool never grows beyond `max_bytes`: the oldest segment is evicted first, acked or
+not. Records are published with QoS 1 and only count as delivered once the broker's PUBACK for their `mid`
+arrives; the highest contiguous delivered record id is kept in a cursor file. After a crash the spool
+replays every record after the cursor, so delivery is at-least-once.
+
+Record layout: magic b"SPL1", record id u64, payload length u32, crc32 u32, payload.
+"""
+from collections import OrderedDict, deque
+import os
+import struct
+import threading
+import time
+import zlib
+
+RECORD_MAGIC = b"SPL1"
+RECORD_HEADER = struct.Struct("<4sQII")
+CURSOR = struct.Struct("<Q")
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+CURSOR_FILE = "acked.cursor"
+
+
+class SpoolRecord:
+    """Location of one spooled payload."""
+
+    __slots__ = ("record_id", "segment", "offset", "length")
+
+    def __init__(self, record_id, segment, offset, length):
+        self.record_id = record_id
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+
+
+class DiskSpool:
+    """
+    Append-only, segment rotated on-disk queue of payloads with acknowledgement tracking.
+    """
+
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024, max_bytes=256 * 1024 * 1024, fsync=False):
+        """
+        :param directory: spool directory, created if missing
+        :param segment_bytes: size at which the active segment is closed and a new one started
+        :param max_bytes: total size of all segments, the oldest segments are evicted beyond it
+        :param fsync: fsync every append, survives power loss at the cost of a disk flush per batch
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        # segment number -> size in bytes, oldest first
+        self.segments = OrderedDict()
+        # records not acknowledged yet, oldest first
+        self.records = OrderedDict()
+        self._read_ids = deque()
+        self.acked_id = 0
+        self.next_id = 1
+        self._active = None
+        self._active_segment = None
+
+        # metrics
+        self.appended = 0
+        self.acked = 0
+        self.evicted = 0
+        self.recovered = 0
+        self.truncated_bytes = 0
+
+    def open(self):
+        """
+        Load the cursor and rebuild the index from the segments on disk, truncating a torn last record.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        cursor_path = os.path.join(self.directory, CURSOR_FILE)
+        if os.path.exists(cursor_path):
+            with open(cursor_path, "rb") as cursor_file:
+                data = cursor_file.read(CURSOR.size)
+            if len(data) == CURSOR.size:
+                (self.acked_id,) = CURSOR.unpack(data)
+        self.next_id = self.acked_id + 1
+
+        numbers = sorted(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                         for name in os.listdir(self.directory)
+                         if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+        for index, number in enumerate(numbers):
+            self._scan_segment(number, last=index == len(numbers) - 1)
+        self._active_segment = numbers[-1] if numbers else 0
+        self._delete_acked_segments()
+        self._read_ids = deque(self.records.keys())
+        self.recovered = len(self.records)
+        self._open_active(numbers[-1] if numbers else 0)
+        return self
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{number:012d}{SEGMENT_SUFFIX}")
+
+    @staticmethod
+    def _iter_records(path):
+        """
+        Yield (record id, payload offset, payload) for every intact record of a segment, stopping at the first
+        torn or corrupt one.
+        """
+        with open(path, "rb") as segment_file:
+            while True:
+                header = segment_file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                magic, record_id, length, crc = RECORD_HEADER.unpack(header)
+                payload = segment_file.read(length)
+                if magic != RECORD_MAGIC or len(payload) < length or zlib.crc32(payload) != crc:
+                    return
+                yield record_id, segment_file.tell() - length, payload
+
+    def _scan_segment(self, number, last):
+        path = self._segment_path(number)
+        valid_end = 0
+        for record_id, offset, payload in self._iter_records(path):
+            if record_id > self.acked_id:
+                self.records[record_id] = SpoolRecord(record_id, number, offset, len(payload))
+            self.next_id = max(self.next_id, record_id + 1)
+            valid_end = offset + len(payload)
+        size = os.path.getsize(path)
+        if valid_end < size:
+            self.truncated_bytes += size - valid_end
+            print(f"DiskSpool: dropping {size - valid_end} torn bytes at the end of {path}")
+            if last:
+                with open(path, "r+b") as segment_file:
+                    segment_file.truncate(valid_end)
+        self.segments[number] = valid_end
+
+    def _open_active(self, number):
+        if self._active:
+            self._active.close()
+        self._active_segment = number
+        self.segments.setdefault(number, 0)
+        self._active = open(self._segment_path(number), "ab")
+
+    def append(self, payload):
+        """
+        :param payload: bytes or str
+        :return: record id
+        """
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._lock:
+            if self.segments[self._active_segment] >= self.segment_bytes:
+                self._open_active(self._active_segment + 1)
+            record_id = self.next_id
+            self.next_id += 1
+            offset = self.segments[self._active_segment]
+            self._active.write(RECORD_HEADER.pack(RECORD_MAGIC, record_id, len(payload), zlib.crc32(payload)))
+            self._active.write(payload)
+            self._active.flush()
+            if self.fsync:
+                os.fsync(self._active.fileno())
+            self.segments[self._active_segment] = offset + RECORD_HEADER.size + len(payload)
+            self.records[record_id] = SpoolRecord(record_id, self._active_segment,
+                                                  offset + RECORD_HEADER.size, len(payload))
+            self._read_ids.append(record_id)
+            self.appended += 1
+            self._evict()
+        return record_id
+
+    def _evict(self):
+        """Delete the oldest segments while the spool is over max_bytes, never the active one."""
+        while sum(self.segments.values()) > self.max_bytes and len(self.segments) > 1:
+            number, _ = self.segments.popitem(last=False)
+            evicted = [record_id for record_id, record in self.records.items() if record.segment == number]
+            for record_id in evicted:
+                del self.records[record_id]
+            self.evicted += len(evicted)
+            evicted_ids = set(evicted)
+            self._read_ids = deque(record_id for record_id in self._read_ids if record_id not in evicted_ids)
+            os.remove(self._segment_path(number))
+            if evicted:
+                print(f"DiskSpool: evicted {len(evicted)} unsent records from segment {number}")
+            self._advance_cursor()
+
+    def next_unsent(self):
+        """
+        :return: (record id, payload) of the oldest record not handed out yet, or None
+        """
+        with self._lock:
+            while self._read_ids:
+                record_id = self._read_ids.popleft()
+                record = self.records.get(record_id)
+                if record is None:
+                    continue
+                if record.segment == self._active_segment:
+                    self._active.flush()
+                with open(self._segment_path(record.segment), "rb") as segment_file:
+                    segment_file.seek(record.offset)
+                    return record_id, segment_file.read(record.length)
+        return None
+
+    def has_unsent(self):
+        return bool(self._read_ids)
+
+    def requeue(self, record_id):
+        """Hand a record out again first, used when its publish was not accepted."""
+        with self._lock:
+            if record_id in self.records:
+                self._read_ids.appendleft(record_id)
+
+    def ack(self, record_id):
+        """
+        Mark a record delivered. The cursor only moves over contiguous delivered ids.
+        """
+        with self._lock:
+            if self.records.pop(record_id, None) is None:
+                return
+            self.acked += 1
+            self._advance_cursor()
+
+    def _advance_cursor(self):
+        oldest_pending = next(iter(self.records), self.next_id)
+        acked_id = oldest_pending - 1
+        if acked_id == self.acked_id:
+            return
+        self.acked_id = acked_id
+        cursor_path = os.path.join(self.directory, CURSOR_FILE)
+        temp_path = cursor_path + ".tmp"
+        with open(temp_path, "wb") as cursor_file:
+            cursor_file.write(CURSOR.pack(acked_id))
+        os.replace(temp_path, cursor_path)
+        self._delete_acked_segments()
+
+    def _delete_acked_segments(self):
+        """Remove closed segments that no longer hold unacknowledged records."""
+        oldest_pending = next(iter(self.records.values()), None)
+        for number in list(self.segments):
+            if number == self._active_segment:
+                break
+            if oldest_pending is not None and number >= oldest_pending.segment:
+                break
+            del self.segments[number]
+            os.remove(self._segment_path(number))
+
+    def close(self):
+        with self._lock:
+            if self._active:
+                self._active.close()
+                self._active = None
+
+    def get_stats(self):
+        """
+        :return: dict with pending record count, spool size and append/ack/evict counters
+        """
+        return {
+            "pending": len(self.records),
+            "unsent": len(self._read_ids),
+            "bytes": sum(self.segments.values()),
+            "segments": len(self.segments),
+            "appended": self.appended,
+            "acked": self.acked,
+            "evicted": self.evicted,
+            "recovered": self.recovered,
+            "truncated_bytes": self.truncated_bytes,
+        }
+
+
+def read_spool_payloads(directory):
+    """
+    Yield every intact payload in a spool directory, delivered or not, oldest first. Read-only, safe to run
+    against the spool of a running client. Used to collect compression training samples.
+    """
+    numbers = sorted(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+                     for name in os.listdir(directory)
+                     if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+    for number in numbers:
+        path = os.path.join(directory, f"{SEGMENT_PREFIX}{number:012d}{SEGMENT_SUFFIX}")
+        for _, _, payload in DiskSpool._iter_records(path):
+            yield payload
+
+
+# pause after paho refused a replayed publish, doubled per refusal in a row
+REFUSED_MIN_BACKOFF_S = 0.05
+REFUSED_MAX_BACKOFF_S = 2.0
+# acks for mids the forwarder has not registered are kept this long, acks of other publishes on the same
+# client never match and must not pile up
+EARLY_ACK_MAX_AGE_S = 5.0
+
+
+class SpoolForwarder:
+    """
+    Publishes spooled records while the client is connected, at most `replay_rate` records per second and
+    `max_inflight` records waiting for their PUBACK. Wire `on_connect`, `on_disconnect` and `on_publish` to the
+    paho callbacks.
+    """
+
+    def __init__(self, spool, publish_fn, replay_rate=20.0, max_inflight=10):
+        """
+        :param spool: DiskSpool
+        :param publish_fn: callable(payload) -> mid of the QoS 1 publish, None if it was not accepted
+        :param replay_rate: records per second
+        :param max_inflight: records published but not acknowledged
+        """
+        self.spool = spool
+        self.publish_fn = publish_fn
+        self.replay_interval = 1.0 / replay_rate if replay_rate else 0.0
+        self.max_inflight = max_inflight
+        self.connected = threading.Event()
+        self.wakeup = threading.Condition()
+        # paho calls on_publish from its network thread while holding its own locks, so the inflight map has
+        # its own lock that is never held around a publish call
+        self._inflight_lock = threading.Lock()
+        self.inflight = {}
+        # acks that arrived before the forwarder registered their mid, mid -> ack time, oldest first
+        self._early_acks = OrderedDict()
+        self.running = threading.Event()
+        self.thread = None
+        self.published = 0
+        # publishes paho refused while connected (its queue is full), retried after a growing pause
+        self.refused = 0
+        self._refused_backoff = 0.0
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.running.set()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        self.notify()
+        if self.thread:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def notify(self):
+        """Wake the forwarder, called after an append and from the paho callbacks."""
+        with self.wakeup:
+            self.wakeup.notify_all()
+
+    def on_connect(self):
+        with self._inflight_lock:
+            # acks from the previous session can not belong to a publish of this one
+            self._early_acks.clear()
+        self.connected.set()
+        self.notify()
+
+    def on_disconnect(self):
+        # paho resends the QoS 1 messages still waiting for a PUBACK once it reconnects, keep them inflight
+        self.connected.clear()
+
+    def on_publish(self, mid):
+        with self._inflight_lock:
+            record_id = self.inflight.pop(mid, None)
+            if record_id is None:
+                # the PUBACK beat the forwarder registering the mid
+                now = time.monotonic()
+                self._early_acks[mid] = now
+                self._early_acks.move_to_end(mid)
+                while next(iter(self._early_acks.values())) < now - EARLY_ACK_MAX_AGE_S:
+                    self._early_acks.popitem(last=False)
+        if record_id is not None:
+            self.spool.ack(record_id)
+        self.notify()
+
+    def _ready(self):
+        return (not self.running.is_set()) or (self.connected.is_set() and self.spool.has_unsent()
+                                                 and len(self.inflight) < self.max_inflight)
+
+    def _run(self):
+        last_publish = 0.0
+        while self.running.is_set():
+            with self.wakeup:
+                self.wakeup.wait_for(self._ready, timeout=1.0)
+            if not self.running.is_set() or not self._ready():
+                continue
+            wait = last_publish + self.replay_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            record = self.spool.next_unsent()
+            if record is None:
+                continue
+            record_id, payload = record
+            mid = self.publish_fn(payload)
+            if mid is None:
+                # not accepted, hand it out again first. A lost connection clears `connected` through
+                # on_disconnect, otherwise paho's queue is full and draining it takes a moment
+                self.spool.requeue(record_id)
+                self.refused += 1
+                self._refused_backoff = min(max(self._refused_backoff * 2, REFUSED_MIN_BACKOFF_S),
+                                            REFUSED_MAX_BACKOFF_S)
+                with self.wakeup:
+                    self.wakeup.wait_for(lambda: not self.running.is_set(), timeout=self._refused_backoff)
+                continue
+            self._refused_backoff = 0.0
+            with self._inflight_lock:
+                acked = self._early_acks.pop(mid, None) is not None
+                if not acked:
+                    self.inflight[mid] = record_id
+            if acked:
+                self.spool.ack(record_id)
+            last_publish = time.monotonic()
+            self.published += 1
+
+    def get_stats(self):
+        stats = self.spool.get_stats()
+        stats.update({"connected": self.connected.is_set(),
+                      "inflight": len(self.inflight),
+                      "published": self.published,
+                      "refused": self.refused})
+        return stats
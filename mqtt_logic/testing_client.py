@@ -1,10 +1,25 @@
 from mqtt_logic.mqtt_manager import MQTTManager
-from utils.mock_data_package import test_data_package
+from queue import Queue
+import numpy as np
+import supervision as sv
 import time
+
+from utils.configs.config_manager import ConfigManager
+from utils.data_package.yolo_det_data_package import YoloDetectionDataPackage
+
+
+def test_data_package():
+    detections = sv.Detections(xyxy=np.array([[10, 20, 110, 220]], dtype=np.float32),
+                               confidence=np.array([0.9], dtype=np.float32),
+                               class_id=np.array([0]))
+    return YoloDetectionDataPackage(detections=detections, source_id="test")
+
+
 def test_mqtt_manager():
-    config_file = "/assets/old_configs/mqtt_config.json"
+    config_file = "assets/configs/mqtt_manager.yaml"
+    mqtt_config = ConfigManager().create_config_object(config_path=config_file)
     mqtt_manager = MQTTManager()
-    mqtt_manager.initialize(config_file)
+    mqtt_manager.initialize(mqtt_config, client_type='MqttSender')
 
 
 
@@ -12,10 +27,14 @@ def test_mqtt_manager():
 
     # Start batching with dummy data
     print("\nStarting batching...")
-    mqtt_manager.start_batching(batch_size=5, batch_interval=3, get_data_fn=test_data_package)
+    detection_queue = Queue()
+    mqtt_manager.start_batching(detection_queue, batch_size=5, batch_interval=3)
 
     # Simulate the system running for a while
-    time.sleep(10)
+    for _ in range(20):
+        detection_queue.put(test_data_package())
+        time.sleep(0.5)
+    print(mqtt_manager.get_stats())
 
     # Stop batching and MQTTManager
     print("\nStopping batching...")
@@ -0,0 +1,47 @@
+from mqtt_logic.fake_broker import FakeBroker
+from mqtt_logic.sender_mqtt_client import SenderMQTTClient
+import tempfile
+import time
+
+
+def test_spool_outage(host=None, port=None):
+    """
+    Publish through the spool while the broker is down, then bring it back and check everything arrives.
+    Runs against the in-process FakeBroker, or a local mosquitto when host and port are given (the outage
+    is then up to you, e.g. `systemctl stop mosquitto`).
+    """
+    broker = None
+    if host is None:
+        broker = FakeBroker().start()
+        host, port = broker.host, broker.port
+        broker.go_offline()
+
+    config = {"host": host, "port": port, "topic": "test/spool",
+              "spool_dir": tempfile.mkdtemp(prefix="mqtt_spool_"), "replay_rate": 50}
+    client = SenderMQTTClient()
+    client.initialize(config)
+    client.connect()
+    client.loop_start()
+
+    print("Publishing 50 payloads while the broker is down...")
+    for index in range(50):
+        client.publish(f"payload {index}".encode("utf-8"))
+    time.sleep(1)
+    print(client.get_stats())
+
+    if broker:
+        print("Broker back online, replaying...")
+        broker.go_online()
+    time.sleep(5)
+    print(client.get_stats())
+    if broker:
+        print(f"Broker received {len(broker.messages)} messages.")
+
+    client.disconnect()
+    client.loop_stop()
+    if broker:
+        broker.stop()
+
+
+if __name__ == "__main__":
+    test_spool_outage()
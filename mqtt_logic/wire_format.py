@@ -0,0 +1,176 @@
+"""
+Versioned binary wire format for detection data packages.
+
+A package is a fixed little-endian header followed by the source id and the packed detection arrays:
+
+    header      magic b"OD", version u8, flags u8, count u32, timestamp f64 (epoch seconds, NaN if unknown),
+                source id length u16
+    source id   utf-8 bytes
+    xyxy        count * 4 float32
+    confidence  count float32          (FLAG_CONFIDENCE)
+    class_id    count int32            (FLAG_CLASS_ID)
+    tracker_id  count int32            (FLAG_TRACKER_ID)
+    frame       length u32 + JPEG bytes (FLAG_FRAME)
+
+With FLAG_COMPACT, xyxy is sent as whole pixels in uint16, confidence as uint16 scaled to [0, 65535] and
+class_id as uint16, halving the package size for a rounding error well below a pixel / 1e-4 confidence.
+
+A batch is a header (magic b"OB", version u8, reserved u8, count u32) followed by each package prefixed with
+its u32 length. Class labels are not sent, receivers map class_id to labels themselves.
+"""
+import math
+import struct
+from datetime import datetime
+
+import numpy as np
+
+WIRE_VERSION = 1
+PACKAGE_MAGIC = b"OD"
+BATCH_MAGIC = b"OB"
+
+PACKAGE_HEADER = struct.Struct("<2sBBIdH")
+BATCH_HEADER = struct.Struct("<2sBBI")
+LENGTH_PREFIX = struct.Struct("<I")
+
+FLAG_CONFIDENCE = 1
+FLAG_CLASS_ID = 2
+FLAG_TRACKER_ID = 4
+FLAG_COMPACT = 8
+FLAG_FRAME = 16
+
+_FLOAT32 = np.dtype("<f4")
+_INT32 = np.dtype("<i4")
+_UINT16 = np.dtype("<u2")
+_CONFIDENCE_SCALE = 65535.0
+
+
+class WireFormatError(ValueError):
+    """Raised when a payload is not a valid package or batch of this wire format version."""
+
+
+def _timestamp_to_epoch(timestamp):
+    if timestamp is None:
+        return math.nan
+    if isinstance(timestamp, str):
+        return datetime.fromisoformat(timestamp).timestamp()
+    return float(timestamp)
+
+
+def encode_package(detections, source_id=None, timestamp=None, compact=False, frame=None) -> bytes:
+    """
+    Pack the detections of one frame.
+    :param detections: sv.Detections
+    :param source_id: id of the stream source, sent as utf-8
+    :param timestamp: epoch seconds or ISO string, defaults to the 'timestamp' entry of the detections metadata
+    :param compact: send boxes, confidence and class ids as uint16
+    :param frame: encoded frame (JPEG bytes) sent raw after the arrays
+    :return: bytes
+    """
+    count = len(detections)
+    if timestamp is None:
+        timestamp = (getattr(detections, "metadata", None) or {}).get("timestamp")
+    source = b"" if source_id is None else str(source_id).encode("utf-8")
+
+    xyxy = np.asarray(detections.xyxy, dtype=np.float32).reshape(count, 4)
+    confidence, class_id, tracker_id = detections.confidence, detections.class_id, detections.tracker_id
+    flags = FLAG_COMPACT if compact else 0
+    if compact:
+        arrays = [np.rint(xyxy).clip(0, 65535).astype(_UINT16)]
+        if confidence is not None:
+            confidence = np.rint(np.asarray(confidence, dtype=np.float32).clip(0, 1) * _CONFIDENCE_SCALE)
+    else:
+        arrays = [xyxy.astype(_FLOAT32, copy=False)]
+    for flag, values, dtype in ((FLAG_CONFIDENCE, confidence, _UINT16 if compact else _FLOAT32),
+                                (FLAG_CLASS_ID, class_id, _UINT16 if compact else _INT32),
+                                (FLAG_TRACKER_ID, tracker_id, _INT32)):
+        if values is not None:
+            flags |= flag
+            arrays.append(np.asarray(values).astype(dtype, copy=False))
+
+    parts = [array.tobytes() for array in arrays]
+    if frame is not None:
+        flags |= FLAG_FRAME
+        parts += [LENGTH_PREFIX.pack(len(frame)), frame]
+
+    header = PACKAGE_HEADER.pack(PACKAGE_MAGIC, WIRE_VERSION, flags, count,
+                                 _timestamp_to_epoch(timestamp), len(source))
+    return b"".join([header, source] + parts)
+
+
+def decode_package(buffer, offset=0):
+    """
+    Unpack one package.
+    :param buffer: bytes-like payload
+    :param offset: position of the package in `buffer`
+    :return: (dict with source_id, timestamp, xyxy, confidence, class_id, tracker_id, frame (JPEG bytes),
+        offset after the package).
+        Arrays are read-only views into `buffer` (float32/int32 copies for compact packages), missing arrays
+        are None.
+    """
+    magic, version, flags, count, timestamp, source_length = PACKAGE_HEADER.unpack_from(buffer, offset)
+    if magic != PACKAGE_MAGIC:
+        raise WireFormatError(f"Not a detection package, magic {magic!r}")
+    if version != WIRE_VERSION:
+        raise WireFormatError(f"Unsupported wire format version {version}, expected {WIRE_VERSION}")
+    offset += PACKAGE_HEADER.size
+    source_id = bytes(buffer[offset:offset + source_length]).decode("utf-8") if source_length else None
+    offset += source_length
+
+    compact = bool(flags & FLAG_COMPACT)
+    xyxy = np.frombuffer(buffer, dtype=_UINT16 if compact else _FLOAT32, count=count * 4, offset=offset)
+    offset += xyxy.nbytes
+    package = {"source_id": source_id,
+               "timestamp": None if math.isnan(timestamp) else timestamp,
+               "xyxy": xyxy.reshape(count, 4).astype(np.float32) if compact else xyxy.reshape(count, 4)}
+    for flag, name, dtype in ((FLAG_CONFIDENCE, "confidence", _UINT16 if compact else _FLOAT32),
+                              (FLAG_CLASS_ID, "class_id", _UINT16 if compact else _INT32),
+                              (FLAG_TRACKER_ID, "tracker_id", _INT32)):
+        package[name] = None
+        if flags & flag:
+            package[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+            offset += package[name].nbytes
+    package["frame"] = None
+    if flags & FLAG_FRAME:
+        (frame_length,) = LENGTH_PREFIX.unpack_from(buffer, offset)
+        offset += LENGTH_PREFIX.size
+        package["frame"] = bytes(buffer[offset:offset + frame_length])
+        offset += frame_length
+    if compact:
+        if package["confidence"] is not None:
+            package["confidence"] = package["confidence"] / np.float32(_CONFIDENCE_SCALE)
+        if package["class_id"] is not None:
+            package["class_id"] = package["class_id"].astype(np.int32)
+    return package, offset
+
+
+def encode_batch(packages) -> bytes:
+    """
+    :param packages: list of encoded packages (bytes)
+    :return: bytes of the length prefixed batch
+    """
+    parts = [BATCH_HEADER.pack(BATCH_MAGIC, WIRE_VERSION, 0, len(packages))]
+    for package in packages:
+        parts.append(LENGTH_PREFIX.pack(len(package)))
+        parts.append(package)
+    return b"".join(parts)
+
+
+def decode_batch(payload):
+    """
+    :param payload: bytes of a batch made by `encode_batch`
+    :return: list of decoded package dicts
+    """
+    magic, version, _, count = BATCH_HEADER.unpack_from(payload, 0)
+    if magic != BATCH_MAGIC:
+        raise WireFormatError(f"Not a detection batch, magic {magic!r}")
+    if version != WIRE_VERSION:
+        raise WireFormatError(f"Unsupported wire format version {version}, expected {WIRE_VERSION}")
+    offset = BATCH_HEADER.size
+    packages = []
+    for _ in range(count):
+        (length,) = LENGTH_PREFIX.unpack_from(payload, offset)
+        offset += LENGTH_PREFIX.size
+        package, _ = decode_package(payload, offset)
+        packages.append(package)
+        offset += length
+    return packages
@@ -0,0 +1,277 @@
+"""
+asyncio runtime for the staged pipeline, selected with `runtime: asyncio` in the app manager YAML.
+
+Same stages and stage settings as pipeline/engine.py, but the queues between the stages are asyncio.Queues
+and the workers are coroutines. Blocking stages (preprocess, infer, postprocess, annotate, encode) run in a
+thread pool through run_in_executor; cheap stages run inline on the loop. Nothing polls: capture waits on
+an event that the capture threads set, stages wait on their queues and the MQTT batcher waits on its queue.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from pipeline.engine import OVERFLOW_POLICIES, is_stale
+from pipeline.stage import SourceStage
+from utils.metrics.histogram import Histogram
+
+
+class AsyncFrameReady:
+    """
+    Stand-in for the threading.Event the stream sources set on every new frame, wakes the event loop instead.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+
+    def set(self):
+        # called from the capture threads
+        self.loop.call_soon_threadsafe(self.event.set)
+
+    def clear(self):
+        self.event.clear()
+
+    async def wait(self):
+        await self.event.wait()
+
+
+class AsyncStageRunner:
+    """
+    asyncio.Queue, worker coroutines and counters of one stage, the asyncio counterpart of StageRunner.
+    """
+
+    def __init__(self, name, stage, executor, workers=1, queue_size=8, overflow="block", ordered=True,
+                 max_age=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unsupported overflow policy for stage {name}: {overflow}")
+        self.name = name
+        self.stage = stage
+        self.executor = executor
+        self.is_source = isinstance(stage, SourceStage)
+        self.workers = 1 if self.is_source else max(int(workers), 1)
+        self.queue_size = max(int(queue_size), 1)
+        self.overflow = overflow
+        self.ordered = ordered and self.workers > 1
+        self.max_age = max_age
+        self.downstream = None
+        self.queue = None
+        self.tasks = []
+        self._next_in = 0
+        self._busy = 0
+        self._done = {}
+        self._next_out = 0
+        self._emit_lock = None
+
+        # metrics
+        self.received = 0
+        self.processed = 0
+        self.filtered = 0
+        self.errors = 0
+        self.dropped = 0
+        self.stale = 0
+        self.service_time = Histogram()
+        self.started_at = None
+
+    @staticmethod
+    def _discard(item):
+        release = getattr(item, "release", None)
+        if release is not None:
+            release()
+
+    async def put(self, item):
+        """
+        Offer an item to this stage's queue according to the overflow policy.
+        """
+        if self.queue.full():
+            if self.overflow == "drop_newest":
+                self.dropped += 1
+                self._discard(item)
+                return False
+            if self.overflow == "drop_oldest":
+                sequence, oldest = self.queue.get_nowait()
+                self.dropped += 1
+                self._discard(oldest)
+                if self.ordered:
+                    self._done[sequence] = None
+        sequence = self._next_in
+        self._next_in += 1
+        await self.queue.put((sequence, item))
+        self.received += 1
+        return True
+
+    def start(self, loop):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._emit_lock = asyncio.Lock()
+        self.stage.start()
+        self.started_at = time.monotonic()
+        target = self._produce_loop if self.is_source else self._work_loop
+        self.tasks = [loop.create_task(target()) for _ in range(self.workers)]
+
+    def idle(self):
+        return self.queue.empty() and not self._busy
+
+    def queue_depth(self):
+        return self.queue.qsize() if self.queue else 0
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        while not self.queue.empty():
+            self._discard(self.queue.get_nowait()[1])
+        self.stage.stop()
+
+    async def _call(self, function, *args):
+        if getattr(self.stage, "blocking", True):
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        return function(*args)
+
+    async def _produce_loop(self):
+        produce_async = getattr(self.stage, "produce_async", None)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = await produce_async() if produce_async else await self._call(self.stage.produce)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"Pipeline stage {self.name} failed: {e}")
+                await asyncio.sleep(0.1)
+                continue
+            if item is None:
+                continue
+            self.service_time.record(time.perf_counter() - start)
+            self.received += 1
+            self.processed += 1
+            await self._hand_on(item)
+
+    async def _work_loop(self):
+        process_async = getattr(self.stage, "process_async", None)
+        while True:
+            sequence, item = await self.queue.get()
+            self._busy += 1
+            if is_stale(item, self.max_age):
+                self._discard(item)
+                output = None
+                self.stale += 1
+            else:
+                output = await self._process(item, process_async)
+            if self.ordered:
+                self._done[sequence] = output
+                await self._emit_ready()
+            elif output is not None:
+                await self._hand_on(output)
+            self._busy -= 1
+
+    async def _process(self, item, process_async):
+        start = time.perf_counter()
+        try:
+            output = await process_async(item) if process_async else await self._call(self.stage.process, item)
+        except asyncio.CancelledError:
+            self._discard(item)
+            raise
+        except Exception as e:
+            print(f"Pipeline stage {self.name} failed: {e}")
+            output = None
+            self.errors += 1
+        self.service_time.record(time.perf_counter() - start)
+        self.processed += 1
+        self.filtered += output is None and self.downstream is not None
+        if output is None:
+            self._discard(item)
+        return output
+
+    async def _emit_ready(self):
+        async with self._emit_lock:
+            while self._next_out in self._done:
+                output = self._done.pop(self._next_out)
+                self._next_out += 1
+                if output is not None:
+                    await self._hand_on(output)
+
+    async def _hand_on(self, item):
+        if self.downstream is not None:
+            await self.downstream.put(item)
+
+    def get_stats(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth(),
+            "queue_size": self.queue_size,
+            "received": self.received,
+            "processed": self.processed,
+            "filtered": self.filtered,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "stale": self.stale,
+            "throughput_per_s": self.processed / elapsed if elapsed else 0.0,
+            "service_time_s": self.service_time.snapshot(),
+        }
+
+
+class AsyncPipelineEngine:
+    """
+    Builds the stages declared in the config and runs them on an asyncio event loop.
+    """
+
+    def __init__(self, app_manager, stage_configs, executor_workers=None, stage_factory=None):
+        """
+        :param app_manager: AppManager the stages work with
+        :param stage_configs: list of dicts with name and optional workers, queue_size, overflow, ordered, max_age
+        :param executor_workers: threads for the blocking stages, defaults to the sum of their workers
+        :param stage_factory: StageFactory, defaults to utils.factories.stage_factory.StageFactory
+        """
+        if stage_factory is None:
+            from utils.factories.stage_factory import StageFactory
+            stage_factory = StageFactory()
+        if app_manager.model_manager.async_enabled:
+            raise ValueError("The pipeline runs inference in its infer stage, scale its workers instead of "
+                             "setting replicas or max_batch in the ModelManager config.")
+        if executor_workers is None:
+            executor_workers = sum(max(int(stage_config.get("workers", 1)), 1) for stage_config in stage_configs)
+        self.executor = ThreadPoolExecutor(max_workers=max(executor_workers, 1), thread_name_prefix="PipelineStage")
+        self.runners = []
+        for stage_config in stage_configs:
+            name = stage_config["name"]
+            if name not in stage_factory.stages:
+                raise ValueError(f"Unsupported pipeline stage: {name}")
+            self.runners.append(AsyncStageRunner(name, stage_factory.stages[name](app_manager), self.executor,
+                                                 workers=stage_config.get("workers", 1),
+                                                 queue_size=stage_config.get("queue_size", 8),
+                                                 overflow=stage_config.get("overflow", "block"),
+                                                 ordered=stage_config.get("ordered", True),
+                                                 max_age=stage_config.get("max_age")))
+        if not self.runners or not self.runners[0].is_source:
+            raise ValueError("The first pipeline stage must be a source stage, e.g. capture")
+        if any(runner.is_source for runner in self.runners[1:]):
+            raise ValueError("Only the first pipeline stage can be a source stage")
+        for runner, downstream in zip(self.runners, self.runners[1:]):
+            runner.downstream = downstream
+
+    def start(self, loop):
+        """
+        :param loop: the running event loop
+        """
+        source_stage = self.runners[0].stage
+        if hasattr(source_stage, "frame_ready"):
+            source_stage.frame_ready = AsyncFrameReady(loop)
+        for runner in reversed(self.runners):
+            runner.start(loop)
+
+    async def stop(self, drain_timeout=2.0):
+        """
+        Stop the source, let queued items run through for up to `drain_timeout` seconds, then stop every stage.
+        """
+        await self.runners[0].stop()
+        deadline = time.monotonic() + drain_timeout
+        for runner in self.runners[1:]:
+            while not runner.idle() and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            await runner.stop()
+        self.executor.shutdown(wait=True)
+
+    def get_stats(self):
+        return {runner.name: runner.get_stats() for runner in self.runners}
@@ -0,0 +1,319 @@
+"""
+Staged pipeline: capture -> preprocess -> infer -> postprocess -> annotate -> filter -> encode -> publish.
+
+Every stage has its own bounded input queue and worker threads, so stages overlap and the bottleneck stage can
+get more workers without scaling the rest. Stages and their settings come from the `pipeline` section of the
+app manager YAML:
+    pipeline:
+      stages:
+        - {name: capture}
+        - {name: preprocess, workers: 2, queue_size: 8}
+        - {name: infer, queue_size: 4, overflow: drop_oldest}
+        ...
+overflow decides what happens when a stage's queue is full: block (push back on the previous stage),
+drop_oldest or drop_newest. Stages with several workers hand their items on in input order unless
+`ordered: false`. `max_age` (seconds since capture) drops frames that are already stale when the stage gets
+to them, put it on the expensive stages (infer, encode) so they don't spend time on frames nobody wants.
+"""
+from collections import deque
+import threading
+import time
+
+from pipeline.stage import SourceStage
+from utils.metrics.histogram import Histogram
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest")
+# used by the asyncio runtime when the config declares no stages
+DEFAULT_STAGES = [{"name": "capture"}, {"name": "preprocess"}, {"name": "infer"}, {"name": "postprocess"},
+                  {"name": "filter"}, {"name": "encode"}, {"name": "publish"}]
+
+
+def is_stale(item, max_age, now=None):
+    """
+    :return: True if the item was captured more than `max_age` seconds ago, False without a deadline or
+        capture time
+    """
+    if max_age is None:
+        return False
+    age = item.age(now)
+    return age is not None and age > max_age
+
+
+class StageRunner:
+    """
+    Input queue, worker threads and counters of one stage.
+    """
+
+    def __init__(self, name, stage, workers=1, queue_size=8, overflow="block", ordered=True, max_age=None):
+        """
+        :param name: stage name used in the stats
+        :param stage: PipelineStage
+        :param workers: worker threads, source stages always run on one
+        :param queue_size: input queue size
+        :param overflow: 'block', 'drop_oldest' or 'drop_newest' when the input queue is full
+        :param ordered: hand items on in input order when several workers finish out of order
+        :param max_age: items captured more than this many seconds ago are dropped before `process`, None keeps
+            every item
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unsupported overflow policy for stage {name}: {overflow}")
+        self.name = name
+        self.stage = stage
+        self.is_source = isinstance(stage, SourceStage)
+        self.workers = 1 if self.is_source else max(int(workers), 1)
+        self.queue_size = max(int(queue_size), 1)
+        self.overflow = overflow
+        self.ordered = ordered and self.workers > 1
+        self.max_age = max_age
+        self.downstream = None
+        self.running = threading.Event()
+        self.threads = []
+
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._next_in = 0
+        self._busy = 0
+        # ordered hand-off, sequence number -> output (None for dropped items)
+        self._done = {}
+        self._next_out = 0
+        self._done_lock = threading.Lock()
+        self._emit_lock = threading.Lock()
+
+        # metrics
+        self.received = 0
+        self.processed = 0
+        self.filtered = 0
+        self.errors = 0
+        self.dropped = 0
+        self.stale = 0
+        self.service_time = Histogram()
+        self.started_at = None
+
+    def put(self, item):
+        """
+        Offer an item to this stage's queue, called by the previous stage.
+        :return: False if the item was dropped
+        """
+        with self._lock:
+            if len(self._queue) >= self.queue_size:
+                if self.overflow == "drop_newest":
+                    self.dropped += 1
+                    self._discard(item)
+                    return False
+                if self.overflow == "drop_oldest":
+                    sequence, oldest = self._queue.popleft()
+                    self.dropped += 1
+                    self._discard(oldest)
+                    self._complete(sequence, None)
+                while len(self._queue) >= self.queue_size and self.running.is_set():
+                    self._not_full.wait(timeout=0.1)
+                if not self.running.is_set():
+                    self._discard(item)
+                    return False
+            self._queue.append((self._next_in, item))
+            self._next_in += 1
+            self.received += 1
+            self._not_empty.notify()
+        return True
+
+    def start(self):
+        self.stage.start()
+        self.running.set()
+        self.started_at = time.monotonic()
+        target = self._produce_loop if self.is_source else self._work_loop
+        self.threads = [threading.Thread(target=target, name=f"Stage-{self.name}-{index}", daemon=True)
+                        for index in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def idle(self):
+        with self._lock:
+            return not self._queue and not self._busy
+
+    def queue_depth(self):
+        return len(self._queue)
+
+    def stop(self):
+        self.running.clear()
+        with self._lock:
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.stage.stop()
+
+    def _produce_loop(self):
+        while self.running.is_set():
+            start = time.perf_counter()
+            try:
+                item = self.stage.produce()
+            except Exception as e:
+                self.errors += 1
+                print(f"Pipeline stage {self.name} failed: {e}")
+                time.sleep(0.1)
+                continue
+            if item is None:
+                continue
+            self.service_time.record(time.perf_counter() - start)
+            self.received += 1
+            self.processed += 1
+            self._hand_on(item)
+
+    def _work_loop(self):
+        while True:
+            with self._lock:
+                while not self._queue and self.running.is_set():
+                    self._not_empty.wait(timeout=0.1)
+                if not self.running.is_set():
+                    # items still queued after the drain timeout are discarded
+                    while self._queue:
+                        self._discard(self._queue.popleft()[1])
+                    return
+                sequence, item = self._queue.popleft()
+                self._busy += 1
+                self._not_full.notify()
+            if is_stale(item, self.max_age):
+                self._discard(item)
+                output = None
+                with self._lock:
+                    self.stale += 1
+            else:
+                output = self._process(item)
+            if self.ordered:
+                self._complete(sequence, output)
+                self._emit_ready()
+            elif output is not None:
+                self._hand_on(output)
+            with self._lock:
+                self._busy -= 1
+
+    def _process(self, item):
+        start = time.perf_counter()
+        try:
+            output = self.stage.process(item)
+        except Exception as e:
+            print(f"Pipeline stage {self.name} failed: {e}")
+            output = None
+            with self._lock:
+                self.errors += 1
+        if output is None:
+            self._discard(item)
+        self.service_time.record(time.perf_counter() - start)
+        with self._lock:
+            self.processed += 1
+            # the last stage consumes its items, only earlier stages filter
+            self.filtered += output is None and self.downstream is not None
+        return output
+
+    @staticmethod
+    def _discard(item):
+        release = getattr(item, "release", None)
+        if release is not None:
+            release()
+
+    def _complete(self, sequence, output):
+        if self.ordered:
+            with self._done_lock:
+                self._done[sequence] = output
+
+    def _emit_ready(self):
+        """
+        Hand on finished items in input order, one emitter at a time so the order survives the hand-off.
+        """
+        with self._emit_lock:
+            while True:
+                with self._done_lock:
+                    ready = []
+                    while self._next_out in self._done:
+                        ready.append(self._done.pop(self._next_out))
+                        self._next_out += 1
+                if not ready:
+                    return
+                for output in ready:
+                    if output is not None:
+                        self._hand_on(output)
+
+    def _hand_on(self, item):
+        if self.downstream is not None:
+            self.downstream.put(item)
+
+    def get_stats(self):
+        """
+        :return: dict with queue depth, item counts, throughput and service time of the stage
+        """
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth(),
+            "queue_size": self.queue_size,
+            "received": self.received,
+            "processed": self.processed,
+            "filtered": self.filtered,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "stale": self.stale,
+            "throughput_per_s": self.processed / elapsed if elapsed else 0.0,
+            "service_time_s": self.service_time.snapshot(),
+        }
+
+
+class PipelineEngine:
+    """
+    Builds the stages declared in the config and runs them as a chain of StageRunners.
+    """
+
+    def __init__(self, app_manager, stage_configs, stage_factory=None):
+        """
+        :param app_manager: AppManager the stages work with
+        :param stage_configs: list of dicts with name and optional workers, queue_size, overflow, ordered, max_age
+        :param stage_factory: StageFactory, defaults to utils.factories.stage_factory.StageFactory
+        """
+        if stage_factory is None:
+            from utils.factories.stage_factory import StageFactory
+            stage_factory = StageFactory()
+        if app_manager.model_manager.async_enabled:
+            raise ValueError("The pipeline runs inference in its infer stage, scale its workers instead of "
+                             "setting replicas or max_batch in the ModelManager config.")
+        self.runners = []
+        for stage_config in stage_configs:
+            name = stage_config["name"]
+            if name not in stage_factory.stages:
+                raise ValueError(f"Unsupported pipeline stage: {name}")
+            self.runners.append(StageRunner(name, stage_factory.stages[name](app_manager),
+                                            workers=stage_config.get("workers", 1),
+                                            queue_size=stage_config.get("queue_size", 8),
+                                            overflow=stage_config.get("overflow", "block"),
+                                            ordered=stage_config.get("ordered", True),
+                                            max_age=stage_config.get("max_age")))
+        if not self.runners or not self.runners[0].is_source:
+            raise ValueError("The first pipeline stage must be a source stage, e.g. capture")
+        if any(runner.is_source for runner in self.runners[1:]):
+            raise ValueError("Only the first pipeline stage can be a source stage")
+        for runner, downstream in zip(self.runners, self.runners[1:]):
+            runner.downstream = downstream
+
+    def start(self):
+        # consumers first so nothing is offered to a stopped stage
+        for runner in reversed(self.runners):
+            runner.start()
+
+    def stop(self, drain_timeout=2.0):
+        """
+        Stop the source, let the queued items run through for up to `drain_timeout` seconds, then stop every
+        stage in order.
+        """
+        self.runners[0].stop()
+        deadline = time.monotonic() + drain_timeout
+        for runner in self.runners[1:]:
+            while not runner.idle() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            runner.stop()
+
+    def get_stats(self):
+        """
+        :return: dict of stage name -> stage stats, in pipeline order
+        """
+        return {runner.name: runner.get_stats() for runner in self.runners}
@@ -0,0 +1,88 @@
+from abc import ABC, abstractmethod
+import time
+
+
+class PipelineItem:
+    """
+    Work item handed from stage to stage. Stages fill in the fields they produce.
+    """
+    __slots__ = ("stream_source", "captured", "frame", "source_id", "seq", "capture_time", "model_input",
+                 "preprocess_params", "result", "data_package")
+
+    def __init__(self, stream_source=None, captured=None, frame=None, source_id=None, seq=None, capture_time=None):
+        self.stream_source = stream_source
+        self.captured = captured
+        self.frame = frame
+        self.source_id = source_id
+        self.seq = seq
+        self.capture_time = capture_time
+        self.model_input = None
+        self.preprocess_params = None
+        self.result = None
+        self.data_package = None
+
+    def age(self, now=None):
+        """
+        :return: seconds since the frame was captured, None if the capture time is unknown
+        """
+        if self.capture_time is None:
+            return None
+        return (time.time() if now is None else now) - self.capture_time
+
+    def release(self):
+        """
+        Give the captured frame back to its source, needed for shared memory sources when an item is dropped
+        before the postprocess stage released it.
+        """
+        if self.captured is not None:
+            self.stream_source.release(self.captured, self.data_package)
+            self.captured = None
+
+
+class PipelineStage(ABC):
+    """
+    One step of the pipeline. `process` is called from the stage's worker threads, a stage with more than one
+    worker must be thread safe.
+
+    In the asyncio runtime `process` runs in a thread pool, unless `blocking` is False (then it runs on the
+    event loop) or the stage defines a `process_async` coroutine.
+    """
+    blocking = True
+
+    def __init__(self, app_manager):
+        """
+        :param app_manager: AppManager whose managers the stage works with
+        """
+        self.app_manager = app_manager
+
+    def start(self):
+        """Called once before the workers start."""
+        pass
+
+    def stop(self):
+        """Called once after the workers stopped."""
+        pass
+
+    @abstractmethod
+    def process(self, item):
+        """
+        :param item: PipelineItem from the previous stage
+        :return: the item for the next stage, None to drop it
+        """
+        pass
+
+
+class SourceStage(PipelineStage):
+    """
+    First stage of the pipeline, produces items instead of processing them. Runs on a single thread.
+    """
+
+    @abstractmethod
+    def produce(self):
+        """
+        :return: a new PipelineItem, None if nothing is available yet (should wait briefly before returning)
+        """
+        pass
+
+    def process(self, item):
+        return item
@@ -0,0 +1,163 @@
+from pipeline.stage import PipelineItem, PipelineStage, SourceStage
+from utils.metrics.registry import stage_timer
+
+# same histograms as ModelManager.run
+PREPROCESS_TIME = stage_timer("preprocess")
+PREDICT_TIME = stage_timer("predict")
+
+
+class CaptureStage(SourceStage):
+    """
+    Picks the next source with the StreamManager's scheduler and takes its newest captured frame.
+    """
+
+    def __init__(self, app_manager):
+        super().__init__(app_manager)
+        # set by the sources on every new frame, the asyncio runtime swaps in an AsyncFrameReady
+        self.frame_ready = app_manager.stream_manager.frame_ready
+
+    def start(self):
+        stream_manager = self.app_manager.stream_manager
+        stream_manager.running = True
+        for stream_source in stream_manager.sources:
+            stream_source.start(self.frame_ready)
+
+    def stop(self):
+        for stream_source in self.app_manager.stream_manager.sources:
+            stream_source.stop()
+
+    def _take_frame(self):
+        """
+        :return: PipelineItem of the scheduled source's frame, None if no source has one
+        """
+        stream_manager = self.app_manager.stream_manager
+        self.frame_ready.clear()
+        stream_source = stream_manager.scheduler.select(stream_manager.sources)
+        if stream_source is None:
+            return None
+        captured = stream_source.get_frame()
+        if captured is None:
+            return None
+        return PipelineItem(stream_source, captured, captured.frame, stream_source.source_id,
+                            seq=captured.seq, capture_time=captured.timestamp)
+
+    def produce(self):
+        item = self._take_frame()
+        if item is None:
+            self.frame_ready.wait(timeout=0.5)
+        return item
+
+    async def produce_async(self):
+        """
+        asyncio runtime, sleeps until a source signals a new frame instead of polling.
+        """
+        while True:
+            item = self._take_frame()
+            if item is not None:
+                return item
+            await self.frame_ready.wait()
+
+
+class PreprocessStage(PipelineStage):
+    """
+    Preprocesses one frame. Items wait in the infer queue, so an input tensor the preprocessor reuses is copied,
+    otherwise every queued item would point at the newest frame.
+    """
+
+    def process(self, item):
+        model_manager = self.app_manager.model_manager
+        preprocessor = model_manager.preprocessor
+        with PREPROCESS_TIME.time():
+            model_input, item.preprocess_params = model_manager.split_preprocessed(
+                preprocessor.preprocess_image(item.frame))
+            item.model_input = model_input.copy() if preprocessor.reuses_buffers else model_input
+        return item
+
+
+class InferStage(PipelineStage):
+    """
+    Runs the model on one preprocessed frame. Only give it several workers if the model backend is thread safe.
+    """
+
+    def process(self, item):
+        with PREDICT_TIME.time():
+            item.result = self.app_manager.model_manager.model.predict(item.model_input)[0]
+        item.model_input = None
+        return item
+
+
+class PostprocessStage(PipelineStage):
+    """
+    Turns the model output into a data package and gives the captured frame back to its source.
+    """
+
+    def process(self, item):
+        data_package = self.app_manager.model_manager.create_data_package(
+            item.frame, item.result, item.preprocess_params, item.source_id, item.capture_time)
+        data_package.stamp(item.seq, item.capture_time)
+        item.data_package = data_package
+        item.release()
+        item.result = None
+        return item
+
+
+class AnnotateStage(PipelineStage):
+    """
+    Renders the annotated frame ahead of time, otherwise the package renders it when it is first asked for.
+    """
+
+    def process(self, item):
+        if item.data_package.annotator is not None:
+            item.data_package.get_annotated_frame()
+        return item
+
+
+class FilterStage(PipelineStage):
+    """
+    Feeds the window aggregator and applies the detection change filter, run it with a single worker so both
+    see the frames of a source in order.
+    """
+    blocking = False
+
+    def process(self, item):
+        app_manager = self.app_manager
+        if app_manager.aggregator is not None:
+            app_manager._publish_summaries(app_manager.aggregator.add(item.data_package, now=item.capture_time))
+        if not app_manager.publish_packages:
+            return None
+        if app_manager.change_filter is not None and not app_manager.change_filter.should_publish(item.data_package):
+            return None
+        return item
+
+
+class EncodeStage(PipelineStage):
+    """
+    JPEG encodes the frame with the MqttManager's FrameEncoder settings, passes packages through if no client
+    sends frames.
+    """
+
+    def process(self, item):
+        frame_encoder = self.app_manager.mqtt_manager.frame_encoder
+        if frame_encoder is None:
+            return item
+        if frame_encoder.sample(item.data_package):
+            frame_encoder.encode(item.data_package)
+        return item
+
+
+class PublishStage(PipelineStage):
+    """
+    Hands the package to the MQTT batcher, which serializes and publishes from its own threads (or executor in
+    the asyncio runtime).
+    """
+
+    def process(self, item):
+        self.app_manager.detection_queue.put(item.data_package)
+        return None
+
+    async def process_async(self, item):
+        """
+        asyncio runtime, hands the package to the AsyncMqttBatcher.
+        """
+        await self.app_manager.async_batcher.put(item.data_package)
+        return None
@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+import types
+
+import numpy as np
+
+from model_logic.yolo.preprocessing.letterbox_preprocessor import LetterboxPreprocessor
+from pipeline.stage import PipelineItem
+from pipeline.stages import InferStage, PreprocessStage
+
+
+class EchoModel:
+    """Returns the mean of its input so the test can tell which frame it was run on."""
+
+    def predict(self, model_input):
+        return [float(np.asarray(model_input).mean())]
+
+
+def make_app_manager():
+    preprocessor = LetterboxPreprocessor()
+    preprocessor.initialize((64, 64))
+    model_manager = types.SimpleNamespace(
+        preprocessor=preprocessor, model=EchoModel(),
+        split_preprocessed=lambda preprocessed: preprocessed if isinstance(preprocessed, tuple)
+        else (preprocessed, None))
+    return types.SimpleNamespace(model_manager=model_manager)
+
+
+def test_preprocess_keeps_frames_apart():
+    """
+    Two different frames go through preprocess before either reaches infer, like items waiting in the infer
+    queue, and each inference must still see its own frame. Then the same with two preprocess workers.
+    """
+    app_manager = make_app_manager()
+    preprocess, infer = PreprocessStage(app_manager), InferStage(app_manager)
+    dark = np.full((48, 64, 3), 10, dtype=np.uint8)
+    bright = np.full((48, 64, 3), 240, dtype=np.uint8)
+
+    items = [preprocess.process(PipelineItem(frame=frame)) for frame in (dark, bright)]
+    results = [infer.process(item).result for item in items]
+    assert results[0] < results[1], f"inference ran on the wrong frame: {results}"
+
+    frames = [dark, bright] * 50
+    with ThreadPoolExecutor(max_workers=2) as workers:
+        items = list(workers.map(lambda frame: preprocess.process(PipelineItem(frame=frame)), frames))
+    results = [infer.process(item).result for item in items]
+    assert all(result < 0.5 for result in results[0::2]) and all(result > 0.5 for result in results[1::2]), \
+        "preprocess workers overwrote each other's input"
+    print("Preprocess -> infer keeps every frame's input apart.")
+
+
+if __name__ == "__main__":
+    test_preprocess_keeps_frames_apart()
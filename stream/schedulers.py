@@ -0,0 +1,56 @@
+class RoundRobinScheduler:
+    """
+    Hands out frames from each source in turn, skipping sources that have nothing queued.
+    """
+
+    def __init__(self):
+        self._next_index = 0
+
+    def select(self, sources):
+        """
+        Pick the next source to take a frame from.
+        :param sources: list of StreamSource objects.
+        :return: StreamSource with a queued frame or None if all queues are empty.
+        """
+        count = len(sources)
+        for offset in range(count):
+            index = (self._next_index + offset) % count
+            if sources[index].has_frame():
+                self._next_index = index + 1
+                return sources[index]
+        return None
+
+
+class WeightedFairScheduler:
+    """
+    Start-time fair queueing over the sources. Every frame taken from a source advances that source's
+    virtual finish time by 1 / weight, and the backlogged source with the smallest start time is served
+    next. Sources that were idle restart at the current virtual time so they can't build up credit and
+    burst ahead of the others.
+    """
+
+    def __init__(self):
+        self.virtual_time = 0.0
+        self._finish_times = {}
+
+    def select(self, sources):
+        """
+        Pick the next source to take a frame from.
+        :param sources: list of StreamSource objects.
+        :return: StreamSource with a queued frame or None if all queues are empty.
+        """
+        selected = None
+        selected_start = None
+        for source in sources:
+            if not source.has_frame():
+                continue
+            start = max(self._finish_times.get(source.source_id, 0.0), self.virtual_time)
+            if selected is None or start < selected_start:
+                selected = source
+                selected_start = start
+
+        if selected is None:
+            return None
+        self.virtual_time = selected_start
+        self._finish_times[selected.source_id] = selected_start + 1.0 / max(selected.weight, 1e-6)
+        return selected
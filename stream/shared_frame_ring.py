@@ -0,0 +1,207 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+# Slot states
+SLOT_FREE = 0
+SLOT_WRITING = 1
+SLOT_READY = 2
+SLOT_READING = 3
+
+# Per slot header. Padded to 64 bytes so every header sits on its own cache line.
+SLOT_HEADER_DTYPE = np.dtype([
+    ("state", "<i4"),
+    ("source_id", "<i4"),
+    ("seq", "<i8"),
+    ("order", "<i8"),
+    ("timestamp", "<f8"),
+    ("height", "<i4"),
+    ("width", "<i4"),
+    ("channels", "<i4"),
+    ("nbytes", "<i8"),
+    ("_pad", "V12"),
+])
+HEADER_ALIGN = 64
+# Ring wide counters stored in front of the slot headers so both processes see them
+RING_COUNTERS = ("written", "overwritten", "rejected")
+
+
+class RingFrame:
+    """
+    A frame held in a ring slot. `frame` is a NumPy view into shared memory and is only valid until
+    `release` is called.
+    """
+
+    def __init__(self, ring, slot, frame, source_id, seq, timestamp):
+        self.ring = ring
+        self.slot = slot
+        self.frame = frame
+        self.source_id = source_id
+        self.seq = seq
+        self.timestamp = timestamp
+
+    def release(self):
+        """Hand the slot back to the writer."""
+        if self.slot is not None:
+            self.ring.release(self.slot)
+            self.slot = None
+
+
+class SharedFrameRing:
+    """
+    Fixed-size ring of frame slots in `multiprocessing.shared_memory`.
+
+    The memory block holds a few ring counters and one header per slot, followed by the slot data areas.
+    A capture process writes decoded frames into free slots and the inference side reads them back as
+    NumPy views, so frames cross the process boundary without pickling or copying. Slot state changes are guarded by a
+    `multiprocessing.Lock`, the frame copy itself happens outside the lock.
+
+    When every slot holds an unread frame the writer overwrites the oldest one (latest frame wins) unless
+    `write` is called with `overwrite=False`.
+    """
+
+    def __init__(self, slots=4, max_frame_bytes=1920 * 1080 * 3, lock=None, name=None, create=True):
+        """
+        :param slots: Number of frame slots.
+        :param max_frame_bytes: Size of each slot's data area, frames larger than this are rejected.
+        :param lock: multiprocessing.Lock shared between writer and reader.
+        :param name: Name of an existing shared memory block to attach to (create=False).
+        :param create: Create a new shared memory block instead of attaching to `name`.
+        """
+        if lock is None:
+            raise ValueError("SharedFrameRing needs a multiprocessing.Lock shared by all processes.")
+        self.slots = slots
+        self.max_frame_bytes = max_frame_bytes
+        self.lock = lock
+        self.is_owner = create
+
+        header_bytes = HEADER_ALIGN + slots * SLOT_HEADER_DTYPE.itemsize
+        self.data_offset = -(-header_bytes // HEADER_ALIGN) * HEADER_ALIGN
+        total_bytes = self.data_offset + slots * max_frame_bytes
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=total_bytes if create else 0)
+        self.name = self.shm.name
+
+        self.counters = np.ndarray((len(RING_COUNTERS),), dtype="<i8", buffer=self.shm.buf)
+        self.headers = np.ndarray((slots,), dtype=SLOT_HEADER_DTYPE, buffer=self.shm.buf, offset=HEADER_ALIGN)
+        self.data = np.ndarray((slots, max_frame_bytes), dtype=np.uint8, buffer=self.shm.buf,
+                               offset=self.data_offset)
+        if create:
+            self.counters[:] = 0
+            self.headers[:] = np.zeros(slots, dtype=SLOT_HEADER_DTYPE)
+
+    @classmethod
+    def attach(cls, name, slots, max_frame_bytes, lock):
+        """
+        Attach to a ring created by another process.
+        """
+        return cls(slots=slots, max_frame_bytes=max_frame_bytes, lock=lock, name=name, create=False)
+
+    def _claim_write_slot(self, overwrite):
+        """
+        Pick a slot to write into: a free slot if there is one, else the oldest unread frame.
+        Must be called with the lock held.
+        :return: slot index or None
+        """
+        states = self.headers["state"]
+        free = np.flatnonzero(states == SLOT_FREE)
+        if free.size:
+            return int(free[0])
+        if not overwrite:
+            return None
+        ready = np.flatnonzero(states == SLOT_READY)
+        if not ready.size:
+            return None
+        self.counters[1] += 1
+        return int(ready[np.argmin(self.headers["order"][ready])])
+
+    def write(self, frame: np.ndarray, source_id=0, seq=0, timestamp=0.0, overwrite=True):
+        """
+        Copy a frame into the ring.
+        :param frame: uint8 frame of shape (h, w) or (h, w, c).
+        :param source_id: integer id of the source.
+        :param seq: sequence number of the frame.
+        :param timestamp: capture time of the frame.
+        :param overwrite: Overwrite the oldest unread frame when the ring is full.
+        :return: True if the frame was written, False if it was dropped.
+        """
+        if frame.dtype != np.uint8 or frame.nbytes > self.max_frame_bytes:
+            with self.lock:
+                self.counters[2] += 1
+            return False
+
+        with self.lock:
+            slot = self._claim_write_slot(overwrite)
+            if slot is None:
+                return False
+            self.headers["state"][slot] = SLOT_WRITING
+
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        np.copyto(self.data[slot, :frame.nbytes].reshape(frame.shape), frame)
+
+        with self.lock:
+            self.counters[0] += 1
+            header = self.headers[slot]
+            header["source_id"] = source_id
+            header["seq"] = seq
+            header["order"] = self.counters[0]
+            header["timestamp"] = timestamp
+            header["height"] = height
+            header["width"] = width
+            header["channels"] = channels
+            header["nbytes"] = frame.nbytes
+            header["state"] = SLOT_READY
+        return True
+
+    def has_frame(self):
+        return bool(np.any(self.headers["state"] == SLOT_READY))
+
+    def acquire(self):
+        """
+        Take the oldest unread frame out of the ring.
+        :return: RingFrame whose `frame` is a view into shared memory, or None if no frame is ready.
+        """
+        with self.lock:
+            ready = np.flatnonzero(self.headers["state"] == SLOT_READY)
+            if not ready.size:
+                return None
+            slot = int(ready[np.argmin(self.headers["order"][ready])])
+            self.headers["state"][slot] = SLOT_READING
+            header = self.headers[slot].copy()
+
+        height, width, channels = int(header["height"]), int(header["width"]), int(header["channels"])
+        shape = (height, width) if channels == 1 else (height, width, channels)
+        frame = self.data[slot, :int(header["nbytes"])].reshape(shape)
+        return RingFrame(self, slot, frame, int(header["source_id"]), int(header["seq"]),
+                         float(header["timestamp"]))
+
+    def get_stats(self):
+        """
+        :return: dict with written, overwritten and rejected frame counters.
+        """
+        return {name: int(value) for name, value in zip(RING_COUNTERS, self.counters)}
+
+    def release(self, slot):
+        """
+        Mark a slot taken with `acquire` as free again.
+        """
+        with self.lock:
+            self.headers["state"][slot] = SLOT_FREE
+
+    def close(self):
+        """
+        Detach from the shared memory. The owner also unlinks the block.
+        """
+        # Views must be dropped before the buffer can be closed
+        self.counters = None
+        self.headers = None
+        self.data = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # a RingFrame view is still alive, the mapping is released when it is garbage collected
+            pass
+        if self.is_owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,158 @@
+import multiprocessing
+import threading
+import time
+
+import numpy as np
+
+from stream.shared_frame_ring import SharedFrameRing
+from stream.stream_source import StreamSource
+from utils.factories.stream_factory import StreamFactory
+
+
+def capture_process_main(ring_name, slots, max_frame_bytes, lock, frames_written, stop_event,
+                         stream_type, source, source_index, latest_frame):
+    """
+    Entry point of a capture process. Reads frames from the stream and writes them into the shared ring.
+    Live sources overwrite the oldest unread frame, file sources wait for a free slot.
+    """
+    ring = SharedFrameRing.attach(ring_name, slots, max_frame_bytes, lock)
+    stream = StreamFactory().streams[stream_type](source)
+    seq = 0
+    try:
+        while not stop_event.is_set():
+            try:
+                stream.open()
+                break
+            except ValueError as e:
+                print(f"Capture process {source_index}: failed to open stream: {e}")
+                time.sleep(2)
+
+        while not stop_event.is_set():
+            frame = stream.read_frame()
+            if frame is None:
+                time.sleep(0.01)
+                continue
+            seq += 1
+            timestamp = time.time()
+            while not ring.write(frame, source_index, seq, timestamp, overwrite=latest_frame):
+                if latest_frame or stop_event.is_set():
+                    break
+                time.sleep(0.005)
+            frames_written.set()
+            if stream.is_image:
+                # a static image only needs to be delivered at the rate it's consumed
+                time.sleep(0.01)
+    finally:
+        stream.close()
+        ring.close()
+
+
+class SharedMemoryStreamSource(StreamSource):
+    """
+    StreamSource that captures in a separate process and hands frames over through a SharedFrameRing.
+
+    Frames returned by `get_frame` are views into shared memory and stay valid until `release` is called,
+    so capture, JPEG encoding and MQTT publishing no longer compete with inference for the GIL.
+    """
+
+    def __init__(self, source_id, stream_type, source, source_index, weight=1.0, slots=4,
+                 max_frame_bytes=1920 * 1080 * 3, latest_frame=True):
+        """
+        :param source_id: Identifier attached to every data package produced from this source.
+        :param stream_type: Type of stream (e.g., 'http', 'camera', 'file'), created in the capture process.
+        :param source: The source of the stream.
+        :param source_index: Integer id written into the ring slot headers.
+        :param weight: Scheduling weight, only used by the weighted fair scheduler.
+        :param slots: Number of frame slots in the ring.
+        :param max_frame_bytes: Size of a slot, must fit the largest decoded frame.
+        :param latest_frame: Overwrite unread frames instead of waiting for the consumer.
+        """
+        super().__init__(source_id, stream=None, weight=weight, queue_size=1, latest_frame=latest_frame)
+        self.stream_type = stream_type
+        self.source = source
+        self.source_index = source_index
+        self.slots = slots
+        self.max_frame_bytes = max_frame_bytes
+        self.ring = None
+        self.process = None
+        self.lock = multiprocessing.Lock()
+        self.frames_written = multiprocessing.Event()
+        self.stop_event = multiprocessing.Event()
+        self.notify_thread = None
+
+    def start(self, frame_ready: threading.Event):
+        """
+        Create the ring and start the capture process.
+        :param frame_ready: Event set whenever a new frame is written, shared between all sources.
+        """
+        self.frame_ready = frame_ready
+        self.running.set()
+        self.stop_event.clear()
+        self.ring = SharedFrameRing(slots=self.slots, max_frame_bytes=self.max_frame_bytes, lock=self.lock)
+        self.process = multiprocessing.Process(
+            target=capture_process_main,
+            args=(self.ring.name, self.slots, self.max_frame_bytes, self.lock, self.frames_written,
+                  self.stop_event, self.stream_type, self.source, self.source_index, self.latest_frame),
+            daemon=True)
+        self.process.start()
+        # Forward the cross process event to the manager's thread event
+        self.notify_thread = threading.Thread(target=self._notify_loop, daemon=True)
+        self.notify_thread.start()
+
+    def _notify_loop(self):
+        while self.running.is_set():
+            if self.frames_written.wait(timeout=0.5):
+                self.frames_written.clear()
+                self.frame_ready.set()
+
+    def has_frame(self):
+        return self.ring is not None and self.ring.has_frame()
+
+    def get_frame(self):
+        """
+        :return: RingFrame holding the oldest unread frame, or None if the ring is empty.
+        """
+        if self.ring is None:
+            return None
+        ring_frame = self.ring.acquire()
+        if ring_frame is not None:
+            self.scheduled += 1
+        return ring_frame
+
+    def release(self, captured, data_package=None):
+        """
+        Give the slot back to the capture process. If the data package still points into the slot its
+        frame is copied out first, this is the only copy a frame goes through in multi-process mode.
+        """
+        if data_package is not None and isinstance(data_package.frame, np.ndarray) \
+                and np.may_share_memory(data_package.frame, captured.frame):
+            data_package.frame = data_package.frame.copy()
+        captured.release()
+
+    def stop(self):
+        """Stop the capture process and free the shared memory."""
+        self.running.clear()
+        self.stop_event.set()
+        if self.process is not None:
+            self.process.join(timeout=3)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+        if self.notify_thread and self.notify_thread.is_alive():
+            self.notify_thread.join(timeout=1)
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def get_stats(self):
+        """
+        :return: dict with ring counters and the number of frames scheduled from this source.
+        """
+        stats = {"scheduled": self.scheduled}
+        if self.ring is not None:
+            ring_stats = self.ring.get_stats()
+            stats.update({
+                "captured": ring_stats["written"],
+                "dropped": ring_stats["overwritten"] + ring_stats["rejected"],
+            })
+        return stats
@@ -1,101 +1,249 @@
 from queue import Queue, Full, Empty
+import threading
 from app.base_classes.manager import BaseManager
 from model_logic.base_classes.model_manager import ModelManager
-from stream.stream_types.file_stream import FileStream
-from stream.stream_types.http_stream import HTTPStream
-from stream.stream_types.camera_stream import CameraStream
+from model_logic.inference.replica_pool import ResultReorderer
+from stream.stream_source import StreamSource
+from stream.shared_memory_source import SharedMemoryStreamSource
 import time
 import cv2
 
 from utils.data_package.data_package_base import DataPackage
 from utils.data_package.yolo_det_data_package import YoloDetectionDataPackage
+from utils.factories.scheduler_factory import SchedulerFactory
+from utils.factories.stream_factory import StreamFactory
 
 
 class StreamManager(BaseManager):
     """
-    A class for handling real-time video streaming from a given stream source.
+    A class for handling real-time video streaming from one or more stream sources.
 
-    This class uses a `current_stream` object to capture video frames and process them in real time.
-    It manages the stream in a separate thread and stores frames in a queue for further processing.
+    Every source captures frames on its own thread into a small per-source queue. The manager's run loop
+    uses a scheduler (round robin or weighted fair) to pick which source feeds the shared model next,
+    tags the resulting data package with the source id and stores it in a queue for further processing.
     """
 
     def __init__(self):
         """
-        Initializes the StreamHandler with a given stream source.
-
-        Parameters:
-        - current_stream: An object that handles the stream operations (e.g., open, read, close).
+        Initializes the StreamManager. Sources are created from the config in `initialize`.
         """
         super().__init__()
-        self.current_stream = None
-        self.stream_type = None
-        self.source = None
+        self.sources = []
+        self.scheduler = None
+        self.scheduler_factory = SchedulerFactory()
+        self.stream_factory = StreamFactory()
+        self.frame_ready = threading.Event()
         self.running = False
         self.output_queue = Queue(maxsize=10)
+        self.dropped_output = 0
+        self.dropped_out_of_order = 0
+        # frames older than max_frame_age seconds are dropped before inference, None keeps every frame
+        self.max_frame_age = None
+        self.dropped_stale = 0
+        # what put_output drops when the output queue is full, the new package or the oldest queued one
+        self.output_overflow = "drop_newest"
+        # multi-process mode, capture runs in separate processes and hands frames over in shared memory
+        self.multiprocess = False
+        self.ring_slots = 4
+        self.max_frame_bytes = 1920 * 1080 * 3
 
     def initialize(self, config):
         """
-        pass in the params for the stream manager object
-        :param stream_type: Type of stream (e.g., 'http', 'camera', 'file').
-        :param source: The source of the stream.
-        :param model_manager: The model to use for processing.
+        pass in the params for the stream manager object. Either a single `stream_type`/`source` pair or a
+        list of `sources`, each with `stream_type`, `source` and optional `id`, `weight`, `queue_size`
+        and `latest_frame`.
+        :param config: StreamManagerConfig or dict
         """
+        for stream_source in self.sources:
+            stream_source.stop()
         self.populate_with_config(config)
 
-        if self.current_stream:
-            self.current_stream.close()
-
-        if self.stream_type == "http":
-            self.current_stream = HTTPStream(self.source)
-        elif self.stream_type == "camera":
-            self.current_stream = CameraStream(self.source)
-        elif self.stream_type == "file":
-            self.current_stream = FileStream(self.source)
-        else:
-            raise ValueError(f"Unsupported stream type: {self.stream_type}")
-
     def populate_with_config(self, config: dict):
         """
         Initialize StreamManager using a configuration dictionary.
-        :param config: Configuration dictionary containing 'stream_type' and 'source'.
-        :param model_manager: The model manager for processing frames.
+        :param config: Configuration dictionary containing 'sources' or 'stream_type' and 'source'.
+        """
+        source_configs = config.get("sources")
+        if not source_configs:
+            # single source config
+            source_configs = [{"stream_type": config.get("stream_type"),
+                               "source": config.get("source"),
+                               "latest_frame": config.get("latest_frame")}]
+
+        self.multiprocess = config.get("multiprocess", False)
+        self.ring_slots = config.get("ring_slots", self.ring_slots)
+        self.max_frame_bytes = config.get("max_frame_bytes", self.max_frame_bytes)
+        self.max_frame_age = config.get("max_frame_age", self.max_frame_age)
+        self.output_overflow = config.get("output_overflow", self.output_overflow)
+        if self.output_overflow not in ("drop_newest", "drop_oldest"):
+            raise ValueError(f"Unsupported output_overflow: {self.output_overflow}")
+        self.sources = [self.create_source(index, source_config)
+                        for index, source_config in enumerate(source_configs)]
+
+        scheduler_type = config.get("scheduler", "round_robin")
+        if scheduler_type not in self.scheduler_factory.schedulers:
+            raise ValueError(f"Unsupported scheduler type: {scheduler_type}")
+        self.scheduler = self.scheduler_factory.schedulers[scheduler_type]()
+
+    def create_source(self, index, source_config: dict) -> StreamSource:
         """
-        self.stream_type = config.get("stream_type")
-        self.source = config.get("source")
+        Create a StreamSource from a single source config.
+        :param index: Position of the source in the config, used as id if none is given.
+        :param source_config: dict with 'stream_type', 'source' and optional 'id', 'weight', 'queue_size',
+            'latest_frame'.
+        """
+        stream_type = source_config.get("stream_type")
+        source = source_config.get("source")
+        # Live sources read through the background grabber so inference always gets the freshest frame.
+        # Files are read frame by frame by default so no frames are skipped.
+        latest_frame = source_config.get("latest_frame")
+        if latest_frame is None:
+            latest_frame = stream_type != "file"
+        if stream_type not in self.stream_factory.streams:
+            raise ValueError(f"Unsupported stream type: {stream_type}")
+
+        if self.multiprocess:
+            return SharedMemoryStreamSource(source_id=source_config.get("id", str(index)),
+                                            stream_type=stream_type,
+                                            source=source,
+                                            source_index=index,
+                                            weight=source_config.get("weight", 1.0),
+                                            slots=self.ring_slots,
+                                            max_frame_bytes=self.max_frame_bytes,
+                                            latest_frame=latest_frame)
+
+        stream = self.create_stream(stream_type, source)
+        return StreamSource(source_id=source_config.get("id", str(index)),
+                            stream=stream,
+                            weight=source_config.get("weight", 1.0),
+                            queue_size=source_config.get("queue_size", 1),
+                            latest_frame=latest_frame)
 
+    def create_stream(self, stream_type, source):
+        """
+        :param stream_type: Type of stream (e.g., 'http', 'camera', 'file').
+        :param source: The source of the stream.
+        """
+        if stream_type not in self.stream_factory.streams:
+            raise ValueError(f"Unsupported stream type: {stream_type}")
+        return self.stream_factory.streams[stream_type](source)
 
     def run(self, inference_model: ModelManager=None):
         """
-        Captures video frames and stores them in a queue.
+        Schedules frames from all sources into the model and stores the data packages in a queue.
+        When the model manager batches or runs replicas, frames are submitted asynchronously and the results
+        are reassembled in submission order.
         """
-        self.current_stream.open()  # Open the stream source
         self.running = True
+        for stream_source in self.sources:
+            stream_source.start(self.frame_ready)
+        batching = inference_model is not None and inference_model.async_enabled
+        pending = ResultReorderer(inference_model.reorder_window if batching else None)
+        max_pending = inference_model.max_in_flight if batching else 0
+
         while self.running:
-            if not self.current_stream.cap.isOpened():
-                print("Stream disconnected, attempting to reconnect.")
-                try:
-                    self.current_stream.cap.open()
-                except ConnectionError as e:
-                    print(f"Reconnection failed: {e}")
-                    time.sleep(2)
-                    continue
-
-            frame = self.current_stream.read_frame()
-            if frame is None:
-                print("Frame read failed, skipping frame.")
-                time.sleep(0.1)
+            # cleared before collecting, a result finishing in between sets it again and is not waited for
+            self.frame_ready.clear()
+            if batching:
+                self._collect_batched(pending, block=len(pending) >= max_pending)
+            stream_source = self.scheduler.select(self.sources)
+            if stream_source is None:
+                self.frame_ready.wait(timeout=0.5)
+                continue
+
+            captured = stream_source.get_frame()
+            if captured is None:
+                continue
+            if self.is_stale(captured):
+                # past its deadline, not worth an inference
+                self.dropped_stale += 1
+                stream_source.release(captured)
+                continue
+            if batching:
+                future = inference_model.submit(captured.frame, source_id=stream_source.source_id,
+                                                timestamp=captured.timestamp)
+                # wake the loop up as soon as the result is ready
+                future.add_done_callback(lambda _: self.frame_ready.set())
+                pending.push(future, (stream_source, captured))
                 continue
+
             if inference_model:
-                data_package = inference_model.run(frame)
+                data_package = inference_model.run(captured.frame, source_id=stream_source.source_id,
+                                                   timestamp=captured.timestamp)
             else:
-                data_package = YoloDetectionDataPackage(frame)
-            # Push frame into the output queue
+                data_package = YoloDetectionDataPackage(captured.frame, source_id=stream_source.source_id)
+            data_package.stamp(captured.seq, captured.timestamp)
+            stream_source.release(captured, data_package)
+            self.put_output(data_package)
+
+        # results still in flight are published and their shared memory frames released before the sources stop
+        while pending:
+            self._collect_batched(pending, block=True)
+        for stream_source in self.sources:
+            stream_source.stop()  # Close the stream sources when streaming stops
+
+    def _collect_batched(self, pending, block=False):
+        """
+        Move finished results to the output queue, keeping submission order.
+        :param pending: ResultReorderer holding (stream source, captured frame) per submitted frame
+        :param block: wait for the oldest result, used when too many frames are in flight
+        """
+        for future, (stream_source, captured), skipped in pending.pop_ready(block=block):
+            if skipped:
+                self.dropped_out_of_order += 1
+                # too far out of order, release the frame once the late result shows up and drop it
+                future.add_done_callback(lambda _, s=stream_source, c=captured: s.release(c))
+                continue
+            try:
+                data_package = future.result()
+            except Exception as e:
+                print(f"StreamManager: inference failed: {e}")
+                data_package = None
+            if data_package is not None:
+                data_package.stamp(captured.seq, captured.timestamp)
+            stream_source.release(captured, data_package)
+            self.put_output(data_package)
+
+    def is_stale(self, captured, now=None):
+        """
+        :param captured: CapturedFrame or RingFrame
+        :return: True if the frame is older than max_frame_age
+        """
+        if self.max_frame_age is None:
+            return False
+        return (time.time() if now is None else now) - captured.timestamp > self.max_frame_age
+
+    def put_output(self, data_package):
+        """
+        Push a data package into the output queue. When the queue is full either the package is dropped or,
+        with output_overflow drop_oldest, the oldest queued package makes room for it.
+        """
+        if data_package is None:
+            return
+        while True:
             try:
                 self.output_queue.put_nowait(data_package)
+                return
             except Full:
-                print("Output queue is full, dropping frame.")
+                self.dropped_output += 1
+                if self.output_overflow == "drop_newest":
+                    print("Output queue is full, dropping frame.")
+                    return
+            try:
+                self.output_queue.get_nowait()
+            except Empty:
+                pass
 
-        self.current_stream.close()  # Close the stream source when streaming stops
+    def get_stats(self):
+        """
+        :return: dict with per source capture/drop counters and the output queue drop counter.
+        """
+        return {
+            "sources": {stream_source.source_id: stream_source.get_stats() for stream_source in self.sources},
+            "dropped_output": self.dropped_output,
+            "dropped_out_of_order": self.dropped_out_of_order,
+            "dropped_stale": self.dropped_stale,
+        }
 
     def display_stream(self, annotated_frame=None):
         """
@@ -111,7 +259,7 @@ class StreamManager(BaseManager):
                 # Use the test frame if provided
                 data = annotated_frame if annotated_frame is not None else self.output_queue.get(timeout=1)
                 if isinstance(data, DataPackage):
-                    frame = data.frame
+                    data = data.get_annotated_frame()
 
                 # Display the frame (annotated or raw)
                 cv2.imshow("Stream Window", data)
@@ -0,0 +1,150 @@
+from queue import Queue, Full, Empty
+import threading
+import time
+
+from stream.stream_types.stream_base import CapturedFrame
+
+
+class StreamSource:
+    """
+    One capture source of the StreamManager.
+
+    Each source reads frames on its own thread into a small bounded queue. Live sources drop the oldest
+    queued frame when the queue is full so a fast camera can only ever fill its own queue and never
+    delay the other sources. File sources block instead so no frames are lost.
+    """
+
+    def __init__(self, source_id, stream, weight=1.0, queue_size=1, latest_frame=True):
+        """
+        :param source_id: Identifier attached to every data package produced from this source.
+        :param stream: Stream object (camera, http or file).
+        :param weight: Scheduling weight, only used by the weighted fair scheduler.
+        :param queue_size: Number of frames buffered for this source.
+        :param latest_frame: Read through the stream's background grabber.
+        """
+        self.source_id = source_id
+        self.stream = stream
+        self.weight = float(weight)
+        self.latest_frame = latest_frame
+        self.frames = Queue(maxsize=queue_size)
+        self.running = threading.Event()
+        self.capture_thread = None
+        self.frame_ready = None
+        self._seq = 0
+
+        # counters
+        self.captured = 0
+        self.scheduled = 0
+        self.dropped = 0
+
+    def start(self, frame_ready: threading.Event):
+        """
+        Start the capture thread.
+        :param frame_ready: Event set whenever a new frame is queued, shared between all sources.
+        """
+        self.frame_ready = frame_ready
+        self.running.set()
+        self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.capture_thread.start()
+
+    def _capture_loop(self):
+        """
+        Capture thread logic. Opens the stream and keeps the source queue filled.
+        """
+        while self.running.is_set():
+            try:
+                self.stream.open()
+                if self.latest_frame:
+                    self.stream.start_grabber()
+                break
+            except ValueError as e:
+                print(f"StreamSource {self.source_id}: failed to open stream: {e}")
+                time.sleep(2)
+
+        while self.running.is_set():
+            captured = self.read()
+            if captured is None:
+                continue
+            self.captured += 1
+            self._enqueue(captured)
+
+        self.stream.close()
+
+    def read(self):
+        """
+        Read the next frame from the stream.
+        :return: CapturedFrame or None if no frame was available.
+        """
+        if self.latest_frame:
+            return self.stream.read_latest(timeout=1.0)
+        frame = self.stream.read_frame()
+        if frame is None:
+            time.sleep(0.1)
+            return None
+        self._seq += 1
+        return CapturedFrame(frame, self._seq, time.time())
+
+    def _enqueue(self, captured):
+        """
+        Queue a frame. Live sources replace the oldest queued frame, file sources wait for space.
+        """
+        if not self.latest_frame:
+            while self.running.is_set():
+                try:
+                    self.frames.put(captured, timeout=0.5)
+                    break
+                except Full:
+                    continue
+        else:
+            while True:
+                try:
+                    self.frames.put_nowait(captured)
+                    break
+                except Full:
+                    try:
+                        self.frames.get_nowait()
+                        self.dropped += 1
+                    except Empty:
+                        pass
+        self.frame_ready.set()
+
+    def has_frame(self):
+        return not self.frames.empty()
+
+    def get_frame(self):
+        """
+        :return: The oldest queued CapturedFrame or None if the queue is empty.
+        """
+        try:
+            captured = self.frames.get_nowait()
+        except Empty:
+            return None
+        self.scheduled += 1
+        return captured
+
+    def release(self, captured, data_package=None):
+        """
+        Called once the frame has been processed. Frames from a thread source are plain arrays, nothing to do.
+        """
+        pass
+
+    def stop(self):
+        """Stop the capture thread, the stream is closed by the thread on exit."""
+        self.running.clear()
+        if self.capture_thread and self.capture_thread.is_alive():
+            self.capture_thread.join(timeout=3)
+        self.capture_thread = None
+
+    def get_stats(self):
+        """
+        :return: dict with capture, scheduling and drop counters for this source.
+        """
+        stats = {
+            "captured": self.captured,
+            "scheduled": self.scheduled,
+            "dropped": self.dropped,
+            "queue_depth": self.frames.qsize(),
+        }
+        if self.latest_frame:
+            stats["grabber"] = self.stream.grabber_stats()
+        return stats
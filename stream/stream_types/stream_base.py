@@ -1,5 +1,76 @@
 import cv2
 import os
+import threading
+import time
+from collections import namedtuple
+
+from utils.metrics.registry import stage_timer
+
+# A frame together with the sequence number and capture time the grabber assigned to it
+CapturedFrame = namedtuple("CapturedFrame", ["frame", "seq", "timestamp"])
+READ_FRAME_TIME = stage_timer("read_frame")
+
+
+class LatestFrameSlot:
+    """
+    Single "latest frame wins" slot shared between the grabber thread and the consumer.
+
+    The grabber overwrites the slot with every frame it reads, so a slow consumer always picks up
+    the freshest frame instead of whatever OpenCV has buffered. Frames that are overwritten before
+    they are consumed are counted as skipped.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._latest = None
+        self._last_consumed_seq = 0
+        self.seq = 0
+        self.grabbed = 0
+        self.consumed = 0
+        self.skipped = 0
+
+    def put(self, frame, timestamp):
+        """
+        Store a newly grabbed frame, replacing any frame that has not been consumed yet.
+        :param frame: The decoded frame.
+        :param timestamp: Capture time of the frame (time.time()).
+        """
+        with self._condition:
+            if self._latest is not None and self._latest.seq > self._last_consumed_seq:
+                self.skipped += 1
+            self.seq += 1
+            self.grabbed += 1
+            self._latest = CapturedFrame(frame, self.seq, timestamp)
+            self._condition.notify_all()
+
+    def get(self, timeout=None):
+        """
+        Wait for a frame newer than the last one consumed.
+        :param timeout: Seconds to wait for a new frame, None waits forever.
+        :return: CapturedFrame or None if no new frame arrived within the timeout.
+        """
+        with self._condition:
+            has_new = self._condition.wait_for(
+                lambda: self._latest is not None and self._latest.seq > self._last_consumed_seq,
+                timeout=timeout)
+            if not has_new:
+                return None
+            self._last_consumed_seq = self._latest.seq
+            self.consumed += 1
+            return self._latest
+
+    def wake(self):
+        """Wake up any consumer blocked in `get` (used when the grabber stops)."""
+        with self._condition:
+            self._condition.notify_all()
+
+    def stats(self):
+        """
+        :return: dict with grabbed, consumed and skipped frame counters.
+        """
+        with self._condition:
+            return {"grabbed": self.grabbed, "consumed": self.consumed, "skipped": self.skipped}
+
 
 class Stream:
     def __init__(self, source):
@@ -12,6 +83,10 @@ class Stream:
         self.is_image = False
         self.image_frame = None
         self.is_opened = True
+        # Background grabber state
+        self.frame_slot = LatestFrameSlot()
+        self.grabber_thread = None
+        self.grabber_running = threading.Event()
 
     def open(self):
         """Open the video stream or load the image."""
@@ -38,13 +113,72 @@ class Stream:
             return self.image_frame  # Return the static image
         if self.cap is None:
             raise RuntimeError("Stream is not open. Call `open()` first.")
-        ret, frame = self.cap.read()
+        with READ_FRAME_TIME.time():
+            ret, frame = self.cap.read()
         if not ret:
             return None
         return frame
 
+    def start_grabber(self):
+        """
+        Start a background thread that keeps reading from the capture and stores the newest frame
+        in `frame_slot`. Static images don't need a grabber, `read_latest` serves them directly.
+        """
+        if self.is_image:
+            return
+        if self.cap is None:
+            raise RuntimeError("Stream is not open. Call `open()` first.")
+        if self.grabber_thread and self.grabber_thread.is_alive():
+            return
+        self.grabber_running.set()
+        self.grabber_thread = threading.Thread(target=self._grab_loop, daemon=True)
+        self.grabber_thread.start()
+
+    def _grab_loop(self):
+        """
+        Grabber thread logic. Reads as fast as the source delivers so OpenCV's buffer never fills up.
+        """
+        while self.grabber_running.is_set():
+            if self.cap is None or not self.cap.isOpened():
+                time.sleep(0.1)
+                continue
+            frame = self.read_frame()
+            if frame is None:
+                # End of file or dropped connection, back off instead of spinning
+                time.sleep(0.01)
+                continue
+            self.frame_slot.put(frame, time.time())
+
+    def read_latest(self, timeout=1.0):
+        """
+        Return the freshest frame produced by the grabber.
+        :param timeout: Seconds to wait for a frame newer than the last one returned.
+        :return: CapturedFrame or None if no new frame arrived in time.
+        """
+        if self.is_image:
+            self.frame_slot.put(self.image_frame, time.time())
+            return self.frame_slot.get(timeout=0)
+        if not self.grabber_running.is_set():
+            raise RuntimeError("Grabber is not running. Call `start_grabber()` first.")
+        return self.frame_slot.get(timeout=timeout)
+
+    def grabber_stats(self):
+        """
+        :return: dict with grabbed, consumed and skipped frame counters.
+        """
+        return self.frame_slot.stats()
+
+    def stop_grabber(self):
+        """Stop the grabber thread and wait for it to exit."""
+        self.grabber_running.clear()
+        self.frame_slot.wake()
+        if self.grabber_thread and self.grabber_thread.is_alive():
+            self.grabber_thread.join(timeout=2)
+        self.grabber_thread = None
+
     def close(self):
         """Close the video stream."""
+        self.stop_grabber()
         if self.cap:
             self.cap.release()
             self.cap = None
@@ -21,6 +21,20 @@ class StreamManagerConfig(Config):
         super().__init__(**kwargs)
         self.required_keys = ["source", "stream_type"]
 
+    def check_required_params(self):
+        """
+        A list of `sources` replaces the single `source`/`stream_type` pair.
+        """
+        sources = self.get("sources")
+        if sources is None:
+            return super().check_required_params()
+        if not isinstance(sources, list):
+            raise ValueError("'sources' must be a list")
+        for source in sources:
+            missing_keys = [key for key in self.required_keys if key not in source]
+            if missing_keys:
+                raise ValueError(f"Missing required parameters in 'sources': {', '.join(missing_keys)}")
+
 class ModelManagerConfig(Config):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -30,6 +44,11 @@ class YoloNCNNConfig(Config):
         super().__init__(**kwargs)
         self.required_keys = ["model_path", "confidence_threshold", "class_labels",
                                 "type", "preprocessor", "postprocessor", 'task']
+class YoloNCNNNativeConfig(Config):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.required_keys = ["model_path", "confidence_threshold", "class_labels",
+                              "type", "preprocessor", "postprocessor"]
 class MqttClientConfig(Config):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
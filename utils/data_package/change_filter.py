@@ -0,0 +1,166 @@
+import threading
+import time
+
+import numpy as np
+import supervision as sv
+
+REASONS = ("first", "class_count", "new_object", "confidence", "heartbeat")
+
+
+class DetectionChangeFilter:
+    """
+    Lets a data package through only when its detections changed meaningfully since the previous frame of the
+    same source, everything else is suppressed before it is encoded or batched.
+
+    Rules, a package passes when any enabled rule fires:
+        class_count: the number of detections of some class changed
+        new_object: a detection has no match in the previous frame, by tracker id when the tracker sets one,
+            otherwise by box IoU below new_object_iou against every previous box of its class
+        confidence: a matched detection crossed confidence_threshold (either way), a new detection is at or
+            above it or a lost detection was at or above it
+        heartbeat: nothing passed for the source for heartbeat_interval seconds
+    Comparisons are vectorized over all detections of the frame.
+    """
+
+    def __init__(self, on_class_count_change=True, on_new_object=True, new_object_iou=0.3,
+                 confidence_threshold=None, heartbeat_interval=30.0):
+        """
+        :param on_class_count_change: pass when the per class detection counts change
+        :param on_new_object: pass when an object enters
+        :param new_object_iou: IoU below which an untracked box counts as a new object
+        :param confidence_threshold: pass when a confidence crosses it, None to disable
+        :param heartbeat_interval: seconds after which a package passes regardless, None to disable
+        """
+        self.on_class_count_change = on_class_count_change
+        self.on_new_object = on_new_object
+        self.new_object_iou = new_object_iou
+        self.confidence_threshold = confidence_threshold
+        self.heartbeat_interval = heartbeat_interval
+        # source id -> (previous detections, time the source last passed)
+        self._previous = {}
+        self._lock = threading.Lock()
+
+        # metrics
+        self.passed = 0
+        self.suppressed = 0
+        self.reasons = dict.fromkeys(REASONS, 0)
+
+    def populate_with_config(self, config):
+        """
+        Read on_class_count_change, on_new_object, new_object_iou, confidence_threshold and heartbeat_interval
+        from the `change_filter` section of the app manager config.
+        """
+        self.on_class_count_change = config.get("on_class_count_change", self.on_class_count_change)
+        self.on_new_object = config.get("on_new_object", self.on_new_object)
+        self.new_object_iou = config.get("new_object_iou", self.new_object_iou)
+        self.confidence_threshold = config.get("confidence_threshold", self.confidence_threshold)
+        self.heartbeat_interval = config.get("heartbeat_interval", self.heartbeat_interval)
+
+    @staticmethod
+    def _as_detections(detections):
+        return sv.Detections.empty() if detections is None else detections
+
+    @staticmethod
+    def _class_ids(detections):
+        if detections.class_id is None:
+            return np.zeros(len(detections), dtype=np.int64)
+        return detections.class_id.astype(np.int64, copy=False)
+
+    def _class_counts_changed(self, current, previous):
+        current_ids, previous_ids = self._class_ids(current), self._class_ids(previous)
+        if len(current_ids) != len(previous_ids):
+            return True
+        if not len(current_ids):
+            return False
+        size = int(max(current_ids.max(), previous_ids.max())) + 1
+        return bool(np.any(np.bincount(current_ids, minlength=size) != np.bincount(previous_ids, minlength=size)))
+
+    def _match(self, current, previous):
+        """
+        :return: index of the matching previous detection for every current detection, -1 for new objects
+        """
+        matches = np.full(len(current), -1, dtype=np.int64)
+        if not len(current) or not len(previous):
+            return matches
+        if current.tracker_id is not None and previous.tracker_id is not None:
+            same = current.tracker_id[:, None] == previous.tracker_id[None, :]
+        else:
+            iou = sv.box_iou_batch(current.xyxy, previous.xyxy)
+            same = (iou >= self.new_object_iou) \
+                & (self._class_ids(current)[:, None] == self._class_ids(previous)[None, :])
+            # best overlapping previous box of the same class
+            iou = np.where(same, iou, -1.0)
+            same = same & (iou == iou.max(axis=1, keepdims=True))
+        found = same.any(axis=1)
+        matches[found] = same[found].argmax(axis=1)
+        return matches
+
+    def _confidence_crossed(self, current, previous, matches):
+        if current.confidence is None or (len(previous) and previous.confidence is None):
+            return False
+        above = current.confidence >= self.confidence_threshold
+        matched = matches >= 0
+        previous_above = previous.confidence >= self.confidence_threshold if len(previous) else np.zeros(0, bool)
+        # matched detections that crossed, new ones above it and lost ones that were above it
+        if np.any(above[matched] != previous_above[matches[matched]]) or np.any(above[~matched]):
+            return True
+        lost = np.ones(len(previous), dtype=bool)
+        lost[matches[matched]] = False
+        return bool(np.any(previous_above[lost]))
+
+    def check(self, data_package, now=None):
+        """
+        Compare the package with the previous frame of its source and remember it as the new previous frame.
+        :param data_package: data package with sv.Detections
+        :param now: time in seconds, defaults to time.monotonic()
+        :return: reason the package passes ('first', 'class_count', 'new_object', 'confidence', 'heartbeat'),
+            None if it is suppressed
+        """
+        now = time.monotonic() if now is None else now
+        current = self._as_detections(data_package.detections)
+        with self._lock:
+            previous, last_passed = self._previous.get(data_package.source_id, (None, None))
+            reason = self._reason(current, previous, last_passed, now)
+            self._previous[data_package.source_id] = (current, now if reason else last_passed)
+            if reason:
+                self.passed += 1
+                self.reasons[reason] += 1
+            else:
+                self.suppressed += 1
+        return reason
+
+    def _reason(self, current, previous, last_passed, now):
+        if previous is None:
+            return "first"
+        if self.on_class_count_change and self._class_counts_changed(current, previous):
+            return "class_count"
+        matches = None
+        if self.on_new_object:
+            matches = self._match(current, previous)
+            if np.any(matches < 0):
+                return "new_object"
+        if self.confidence_threshold is not None:
+            matches = self._match(current, previous) if matches is None else matches
+            if self._confidence_crossed(current, previous, matches):
+                return "confidence"
+        if self.heartbeat_interval is not None and now - last_passed >= self.heartbeat_interval:
+            return "heartbeat"
+        return None
+
+    def should_publish(self, data_package):
+        """
+        :return: True if the package passes the filter
+        """
+        return self.check(data_package) is not None
+
+    def get_stats(self):
+        """
+        :return: dict with passed and suppressed counts, the suppression ratio and the pass reasons
+        """
+        total = self.passed + self.suppressed
+        return {
+            "passed": self.passed,
+            "suppressed": self.suppressed,
+            "suppression_ratio": self.suppressed / total if total else 0.0,
+            "reasons": dict(self.reasons),
+        }
@@ -1,18 +1,40 @@
 import numpy as np
 import cv2
 import base64
+import time
+
+from utils.metrics.registry import stage_timer
+
+ANNOTATE_TIME = stage_timer("annotate")
+ENCODE_JPEG_TIME = stage_timer("encode_jpeg")
+ENCODE_BASE64_TIME = stage_timer("encode_base64")
 
 class DataPackage:
-    def __init__(self, frame=None, detections=None):
+    def __init__(self, frame=None, detections=None, source_id=None, annotator=None, labels=None):
         """
         Initialize a generic DataPackage.
 
         Args:
-            frame (Any, optional): The frame data. Defaults to None.
+            frame (Any, optional): The raw frame data, never drawn on. Defaults to None.
             detections (Any, optional): The detections data. Defaults to None.
+            source_id (str, optional): Id of the stream source the frame came from. Defaults to None.
+            annotator (FrameAnnotatorBase, optional): Annotator used to render the annotated frame on
+                demand. Defaults to None, in which case the annotated frame is the raw frame.
+            labels (Any, optional): Labels passed to the annotator. Defaults to None.
         """
         self.frame = frame
         self.detections = detections
+        self.source_id = source_id
+        self.annotator = annotator
+        self.labels = labels
+        self._annotated_frame = None
+        # JPEG bytes of the frame, cached by encode_frame_jpeg or filled in by a FrameEncoder
+        self.encoded_frame = None
+        # set to False by a FrameEncoder when sampling decided this frame is not sent
+        self.send_frame = True
+        # sequence number and capture time (time.time()) of the source frame, see `stamp`
+        self.seq = None
+        self.capture_time = None
 
     @staticmethod
     def empty():
@@ -33,6 +55,54 @@ class DataPackage:
         """
         return self.frame is None and self.detections is None
 
+    def get_annotated_frame(self):
+        """
+        Render the detections onto a copy of the frame the first time it is asked for.
+
+        Returns:
+            np.ndarray: The annotated frame, or the raw frame if there is no annotator or nothing to draw.
+        """
+        if self._annotated_frame is None:
+            if self.annotator is None or self.frame is None or self.detections is None \
+                    or len(self.detections) == 0:
+                return self.frame
+            # annotators draw in place, keep the raw frame untouched
+            with ANNOTATE_TIME.time():
+                self._annotated_frame = self.annotator.annotate_frame(scene=self.frame.copy(),
+                                                                      detections=self.detections,
+                                                                      labels=self.labels)
+        return self._annotated_frame
+
+    def stamp(self, seq, capture_time):
+        """
+        Attach the sequence number and capture time the grabber gave the frame this package was made from.
+
+        Args:
+            seq (int): Per source sequence number of the frame.
+            capture_time (float): Capture time of the frame (time.time()).
+        """
+        self.seq = seq
+        self.capture_time = capture_time
+
+    def age(self, now=None):
+        """
+        Seconds since the frame was captured.
+
+        Args:
+            now (float, optional): Current time.time(). Defaults to None, reading the clock.
+
+        Returns:
+            float: Age of the package, or None if it was never stamped.
+        """
+        if self.capture_time is None:
+            return None
+        return (time.time() if now is None else now) - self.capture_time
+
+    @property
+    def is_annotated(self):
+        """True once the annotated frame has been rendered."""
+        return self._annotated_frame is not None
+
     def to_dict(self):
         """
         Convert the DataPackage to a dictionary format.
@@ -43,23 +113,56 @@ class DataPackage:
         return {
             "frame": self.frame,
             "detections": self.detections,
+            "source_id": self.source_id,
+            "seq": self.seq,
+            "capture_time": self.capture_time,
         }
 
-    def encode_frame_to_base64(self):
+    def encode_frame_jpeg(self, quality=95, scale=1.0, annotated=True):
         """
-        Encodes the frame to a Base64 string if it is a numpy array.
+        Encodes the frame to JPEG once and caches the bytes, later calls return the cached bytes.
+
+        Args:
+            quality (int, optional): JPEG quality 0-100. Defaults to 95 (the OpenCV default).
+            scale (float, optional): Downscale factor applied before encoding. Defaults to 1.0.
+            annotated (bool, optional): Encode the annotated frame instead of the raw one. Defaults to True.
 
         Returns:
-            str: Base64 encoded string of the frame, or None if no frame.
+            bytes: JPEG bytes, or None if there is no frame or it is not sent.
         """
-        if self.frame is None:
+        if self.encoded_frame is not None or not self.send_frame:
+            return self.encoded_frame
+        frame = self.get_annotated_frame() if annotated else self.frame
+        if frame is None:
             return None
 
-        if not isinstance(self.frame, np.ndarray):
+        if not isinstance(frame, np.ndarray):
             raise TypeError("Frame must be a numpy array.")
 
-        _, buffer = cv2.imencode('.jpg', self.frame)
-        return base64.b64encode(buffer).decode('utf-8')
+        with ENCODE_JPEG_TIME.time():
+            if scale != 1.0:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        if not ok:
+            raise ValueError("JPEG encoding failed.")
+        self.encoded_frame = buffer.tobytes()
+        return self.encoded_frame
+
+    def encode_frame_to_base64(self, annotated=True):
+        """
+        Encodes the frame to a Base64 string if it is a numpy array, reusing cached JPEG bytes.
+
+        Args:
+            annotated (bool, optional): Encode the annotated frame instead of the raw one. Defaults to True.
+
+        Returns:
+            str: Base64 encoded string of the frame, or None if no frame.
+        """
+        with ENCODE_BASE64_TIME.time():
+            encoded = self.encode_frame_jpeg(annotated=annotated)
+            if encoded is None:
+                return None
+            return base64.b64encode(encoded).decode('utf-8')
 
     def __repr__(self):
-        return f"DataPackage(frame={self.frame}, detections={self.detections})"
+        return f"DataPackage(frame={self.frame}, detections={self.detections}, source_id={self.source_id})"
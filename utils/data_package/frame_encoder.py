@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+
+class FrameEncoder:
+    """
+    JPEG encodes data package frames in a thread pool so the batching thread only ships cached bytes.
+
+    cv2.imencode releases the GIL, so a couple of workers encode in parallel with inference. Packages that
+    are sampled out (every_n, only_on_detections) get `send_frame = False` and are sent without a frame.
+    """
+
+    def __init__(self, quality=80, scale=1.0, every_n=1, only_on_detections=False, annotated=True, workers=2):
+        """
+        :param quality: JPEG quality 0-100
+        :param scale: downscale factor applied before encoding, 0.5 halves width and height
+        :param every_n: encode every Nth frame per source
+        :param only_on_detections: skip frames without detections
+        :param annotated: encode the annotated frame instead of the raw one
+        :param workers: encoding threads
+        """
+        self.quality = quality
+        self.scale = scale
+        self.every_n = max(int(every_n), 1)
+        self.only_on_detections = only_on_detections
+        self.annotated = annotated
+        self.workers = workers
+        self.executor = None
+        self._frame_counts = {}
+        self._lock = threading.Lock()
+        self.encoded = 0
+        self.skipped = 0
+        self.encoded_bytes = 0
+
+    def populate_with_config(self, config):
+        """
+        Read the encoder options from the MqttManager config: jpeg_quality, frame_scale, frame_every_n,
+        frame_only_on_detections, frame_annotated and frame_encoder_workers.
+        """
+        self.quality = config.get("jpeg_quality", self.quality)
+        self.scale = config.get("frame_scale", self.scale)
+        self.every_n = max(int(config.get("frame_every_n", self.every_n)), 1)
+        self.only_on_detections = config.get("frame_only_on_detections", self.only_on_detections)
+        self.annotated = config.get("frame_annotated", self.annotated)
+        self.workers = config.get("frame_encoder_workers", self.workers)
+
+    def start(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="FrameEncoder")
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def should_encode(self, data_package):
+        """
+        Apply the sampling rules, called in submission order so every_n counts frames per source.
+        """
+        if data_package.frame is None:
+            return False
+        if self.only_on_detections and (data_package.detections is None or len(data_package.detections) == 0):
+            return False
+        with self._lock:
+            count = self._frame_counts.get(data_package.source_id, 0)
+            self._frame_counts[data_package.source_id] = count + 1
+        return count % self.every_n == 0
+
+    def encode(self, data_package):
+        """
+        Encode the package's frame into `data_package.encoded_frame`.
+        :return: the data package
+        """
+        encoded = data_package.encode_frame_jpeg(quality=self.quality, scale=self.scale,
+                                                 annotated=self.annotated)
+        with self._lock:
+            self.encoded += 1
+            self.encoded_bytes += len(encoded) if encoded else 0
+        return data_package
+
+    def submit(self, data_package):
+        """
+        Queue a package for encoding.
+        :return: Future resolving to the data package once its frame is encoded or sampled out
+        """
+        self.start()
+        self.sample(data_package)
+        return self.executor.submit(self._encode_if_sent, data_package)
+
+    def sample(self, data_package):
+        """
+        Apply the sampling rules, packages that are sampled out get `send_frame = False`.
+        :return: True if the frame should be encoded
+        """
+        if self.should_encode(data_package):
+            return True
+        data_package.send_frame = False
+        with self._lock:
+            self.skipped += 1
+        return False
+
+    def _encode_if_sent(self, data_package):
+        return self.encode(data_package) if data_package.send_frame else data_package
+
+    def get_stats(self):
+        """
+        :return: dict with encoded and skipped frame counts and the mean encoded size
+        """
+        with self._lock:
+            return {
+                "encoded": self.encoded,
+                "skipped": self.skipped,
+                "mean_bytes": self.encoded_bytes / self.encoded if self.encoded else 0.0,
+            }
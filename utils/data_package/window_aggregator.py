@@ -0,0 +1,202 @@
+import threading
+import time
+
+import numpy as np
+
+
+class WindowAccumulator:
+    """
+    Per class accumulators of one source, kept in a ring of panes. A pane covers `slide` seconds and a window
+    is the last `panes` panes, so a tumbling window is a single pane and a sliding window sums overlapping
+    panes. Every array is allocated once with shape (panes, num_classes) and indexed by class_id.
+    """
+
+    def __init__(self, num_classes, panes):
+        self.num_classes = num_classes
+        self.panes = panes
+        self.frames = np.zeros(panes, dtype=np.int64)
+        self.counts = np.zeros((panes, num_classes), dtype=np.int64)
+        self.frames_present = np.zeros((panes, num_classes), dtype=np.int64)
+        self.max_counts = np.zeros((panes, num_classes), dtype=np.int64)
+        self.confidence_sum = np.zeros((panes, num_classes), dtype=np.float64)
+        self.confidence_max = np.zeros((panes, num_classes), dtype=np.float64)
+        # index of the pane being filled, in pane units since the epoch
+        self.pane = None
+
+    def reset_pane(self, slot):
+        self.frames[slot] = 0
+        self.counts[slot] = 0
+        self.frames_present[slot] = 0
+        self.max_counts[slot] = 0
+        self.confidence_sum[slot] = 0.0
+        self.confidence_max[slot] = 0.0
+
+    def add(self, class_ids, confidence):
+        """
+        Add the detections of one frame to the current pane.
+        :param class_ids: int array of class ids, ids outside [0, num_classes) are ignored
+        :param confidence: float array of confidences or None
+        """
+        slot = self.pane % self.panes
+        self.frames[slot] += 1
+        valid = (class_ids >= 0) & (class_ids < self.num_classes)
+        class_ids = class_ids[valid]
+        if not len(class_ids):
+            return
+        frame_counts = np.bincount(class_ids, minlength=self.num_classes)
+        self.counts[slot] += frame_counts
+        self.frames_present[slot] += frame_counts > 0
+        np.maximum(self.max_counts[slot], frame_counts, out=self.max_counts[slot])
+        if confidence is not None:
+            confidence = confidence[valid]
+            self.confidence_sum[slot] += np.bincount(class_ids, weights=confidence, minlength=self.num_classes)
+            np.maximum.at(self.confidence_max[slot], class_ids, confidence)
+
+    def summary(self):
+        """
+        :return: (frames, counts, frames_present, max_counts, confidence_sum, confidence_max) over the window
+        """
+        return (int(self.frames.sum()), self.counts.sum(axis=0), self.frames_present.sum(axis=0),
+                self.max_counts.max(axis=0), self.confidence_sum.sum(axis=0), self.confidence_max.max(axis=0))
+
+
+class WindowAggregator:
+    """
+    Aggregates the detections of every frame into per source, per class summaries over tumbling or sliding time
+    windows, so one compact message per window replaces the per frame messages.
+
+    A summary holds for every class seen in the window the number of detections, the most detections in one
+    frame, the mean and max confidence and the occupancy (fraction of frames the class was present in).
+    Summaries are returned by `add` and `advance` once their window closes.
+    """
+
+    def __init__(self, window=10.0, slide=None, num_classes=80, labels=None):
+        """
+        :param window: window length in seconds
+        :param slide: seconds between sliding windows, None for tumbling windows. Must divide the window.
+        :param num_classes: size of the class accumulators, higher class ids are ignored
+        :param labels: class labels (list or dict by class id) used as keys in the summaries
+        """
+        self.set_windows(window, slide)
+        self.num_classes = num_classes
+        self.labels = labels
+        self._sources = {}
+        self._lock = threading.Lock()
+
+        # metrics
+        self.frames = 0
+        self.summaries = 0
+        # frames captured before their window was closed, counted in the open pane instead
+        self.late_frames = 0
+
+    def set_windows(self, window, slide=None):
+        self.window = float(window)
+        self.slide = float(slide) if slide else self.window
+        panes = self.window / self.slide
+        if panes < 1 or abs(panes - round(panes)) > 1e-9:
+            raise ValueError(f"slide {self.slide} must divide the window {self.window}")
+        self.panes = int(round(panes))
+
+    def populate_with_config(self, config):
+        """
+        Read window, slide and num_classes from the `aggregation` section of the app manager config, before
+        the first frame is added.
+        """
+        self.set_windows(config.get("window", self.window), config.get("slide"))
+        self.num_classes = config.get("num_classes", self.num_classes)
+
+    def _label(self, class_id):
+        if self.labels is None:
+            return str(class_id)
+        if isinstance(self.labels, dict):
+            return str(self.labels.get(class_id, class_id))
+        return str(self.labels[class_id]) if class_id < len(self.labels) else str(class_id)
+
+    def _summary(self, source_id, accumulator, pane):
+        frames, counts, frames_present, max_counts, confidence_sum, confidence_max = accumulator.summary()
+        if not frames:
+            return None
+        window_end = (pane + 1) * self.slide
+        present = np.flatnonzero(counts)
+        mean_confidence = confidence_sum[present] / counts[present]
+        return {
+            "source_id": source_id,
+            "window_start": window_end - self.window,
+            "window_end": window_end,
+            "frames": frames,
+            "classes": {
+                self._label(int(class_id)): {
+                    "count": int(counts[class_id]),
+                    "max_count": int(max_counts[class_id]),
+                    "mean_confidence": round(float(mean), 4),
+                    "max_confidence": round(float(confidence_max[class_id]), 4),
+                    "occupancy": round(float(frames_present[class_id]) / frames, 4),
+                }
+                for class_id, mean in zip(present, mean_confidence)
+            },
+        }
+
+    def _advance_source(self, source_id, accumulator, pane, summaries):
+        """
+        Close every pane before `pane`, a window summary is emitted for each closed pane whose window has frames.
+        """
+        if accumulator.pane is None:
+            accumulator.pane = pane
+            return
+        if pane <= accumulator.pane:
+            # late frame or clock step back, the pane being filled stays open
+            return
+        # after `panes` empty panes the ring is empty, nothing further to emit
+        last = min(pane, accumulator.pane + self.panes)
+        while accumulator.pane < last:
+            summary = self._summary(source_id, accumulator, accumulator.pane)
+            if summary is not None:
+                summaries.append(summary)
+            accumulator.pane += 1
+            accumulator.reset_pane(accumulator.pane % self.panes)
+        accumulator.pane = pane
+
+    def add(self, data_package, now=None):
+        """
+        :param data_package: data package with sv.Detections
+        :param now: epoch seconds of the frame, its capture time, defaults to time.time(). A frame whose pane
+            was already closed is counted in the open pane
+        :return: list of summaries of the windows that closed before this frame
+        """
+        now = time.time() if now is None else now
+        pane = int(now // self.slide)
+        detections = data_package.detections
+        summaries = []
+        with self._lock:
+            accumulator = self._sources.get(data_package.source_id)
+            if accumulator is None:
+                accumulator = self._sources[data_package.source_id] = WindowAccumulator(self.num_classes, self.panes)
+            self.late_frames += pane < accumulator.pane if accumulator.pane is not None else 0
+            self._advance_source(data_package.source_id, accumulator, pane, summaries)
+            if detections is None or detections.class_id is None:
+                class_ids, confidence = np.zeros(0, dtype=np.int64), None
+            else:
+                class_ids, confidence = detections.class_id.astype(np.int64, copy=False), detections.confidence
+            accumulator.add(class_ids, confidence)
+            self.frames += 1
+            self.summaries += len(summaries)
+        return summaries
+
+    def advance(self, now=None):
+        """
+        Close the windows that ended by `now` for every source, call it periodically so summaries go out when
+        no frames arrive.
+        :return: list of summaries
+        """
+        now = time.time() if now is None else now
+        pane = int(now // self.slide)
+        summaries = []
+        with self._lock:
+            for source_id, accumulator in self._sources.items():
+                self._advance_source(source_id, accumulator, pane, summaries)
+            self.summaries += len(summaries)
+        return summaries
+
+    def get_stats(self):
+        return {"frames": self.frames, "summaries": self.summaries, "late_frames": self.late_frames,
+                "sources": len(self._sources)}
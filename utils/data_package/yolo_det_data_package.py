@@ -1,16 +1,25 @@
 from utils.data_package.data_package_base import DataPackage
 import numpy as np
 import supervision as sv
+
+from utils.metrics.registry import stage_timer
+
+TO_DICT_TIME = stage_timer("to_dict")
+
 class YoloDetectionDataPackage(DataPackage):
-    def __init__(self, frame=None, detections=None):
+    def __init__(self, frame=None, detections=None, source_id=None, annotator=None, labels=None):
         """
         Initialize a YOLO-specific DataPackage.
 
         Args:
             frame (Any, optional): The frame data. Defaults to None.
             detections (sv.Detections, optional): The YOLO detections object. Defaults to None.
+            source_id (str, optional): Id of the stream source the frame came from. Defaults to None.
+            annotator (FrameAnnotatorBase, optional): Annotator used to render the annotated frame on
+                demand. Defaults to None.
+            labels (Any, optional): Labels passed to the annotator. Defaults to None.
         """
-        super().__init__(frame, detections)
+        super().__init__(frame, detections, source_id, annotator, labels)
 
     def to_dict(self):
         """
@@ -19,23 +28,38 @@ class YoloDetectionDataPackage(DataPackage):
         Returns:
             dict: A dictionary with frame and YOLO detection attributes.
         """
+        if self.detections is not None and isinstance(self.detections, sv.Detections):
+            with TO_DICT_TIME.time():
+                return {
+                    "frame": self.encode_frame_to_base64(),
+                    "detections": self.detections_to_dict(),
+                    "source_id": self.source_id,
+                    "seq": self.seq,
+                    "capture_time": self.capture_time,
+                }
+        return super().to_dict()
+
+    def detections_to_dict(self):
+        """
+        Convert only the detections to a JSON serializable dictionary, without encoding the frame.
+
+        Returns:
+            dict: xyxy, mask, confidence, class_id, tracker_id and metadata as lists, or None without detections.
+        """
         def serialize_array(array):
             """Converts a NumPy array to a list for JSON serialization."""
             return array.tolist() if isinstance(array, np.ndarray) else None
 
-        if self.detections is not None and isinstance(self.detections, sv.Detections):
-            return {
-                "frame": self.encode_frame_to_base64(),
-                "detections": {
-                    "xyxy": serialize_array(self.detections.xyxy),
-                    "mask": serialize_array(self.detections.mask) if hasattr(self.detections, "mask") else None,
-                    "confidence": serialize_array(self.detections.confidence) if hasattr(self.detections, "confidence") else None,
-                    "class_id": serialize_array(self.detections.class_id) if hasattr(self.detections, "class_id") else None,
-                    "tracker_id": serialize_array(self.detections.tracker_id) if hasattr(self.detections, "tracker_id") else None,
-                    "metadata": {
-                        key: serialize_array(value) if isinstance(value, np.ndarray) else value
-                        for key, value in getattr(self.detections, "metadata", {}).items()
-                    } if hasattr(self.detections, "metadata") else {}
-                }
-            }
-        return super().to_dict()
+        if self.detections is None or not isinstance(self.detections, sv.Detections):
+            return None
+        return {
+            "xyxy": serialize_array(self.detections.xyxy),
+            "mask": serialize_array(self.detections.mask) if hasattr(self.detections, "mask") else None,
+            "confidence": serialize_array(self.detections.confidence) if hasattr(self.detections, "confidence") else None,
+            "class_id": serialize_array(self.detections.class_id) if hasattr(self.detections, "class_id") else None,
+            "tracker_id": serialize_array(self.detections.tracker_id) if hasattr(self.detections, "tracker_id") else None,
+            "metadata": {
+                key: serialize_array(value) if isinstance(value, np.ndarray) else value
+                for key, value in getattr(self.detections, "metadata", {}).items()
+            } if hasattr(self.detections, "metadata") else {}
+        }
@@ -14,6 +14,7 @@ class ConfigFactory:
             "ModelManager": ModelManagerConfig,
             "MqttManager": MqttManagerConfig,
             "YoloNCNNModel": YoloNCNNConfig,
+            "YoloNCNNNativeModel": YoloNCNNNativeConfig,
             "MqttSender": MqttClientConfig,
             "MqttLogger": MqttClientConfig
         }
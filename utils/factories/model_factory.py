@@ -1,9 +1,17 @@
 from model_logic.yolo.model.yolo_model import YOLOModel
 from model_logic.yolo.model.yolo_ncnn_model import YoloNcnnModel
 
+
+def _yolo_ncnn_native_model():
+    # imported when a model config asks for it, the ncnn package is optional
+    from model_logic.yolo.model.yolo_ncnn_native_model import YoloNcnnNativeModel
+    return YoloNcnnNativeModel()
+
+
 class ModelFactory:
     def __init__(self):
         self.models ={
             'YoloModel': YOLOModel,
             'YoloNCNNModel': YoloNcnnModel,
-        }
\ No newline at end of file
+            'YoloNCNNNativeModel': _yolo_ncnn_native_model,
+        }
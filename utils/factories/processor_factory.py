@@ -1,10 +1,24 @@
-from model_logic.yolo.postprocessing.yolo_ncnn_postprocessor import YoloNcnnPostprocessor
-from model_logic.yolo.preprocessing.yolo_ncnn_preprocessor import YoloNcnnPreprocessor
+from model_logic.yolo.preprocessing.letterbox_preprocessor import LetterboxPreprocessor
+from model_logic.yolo.postprocessing.yolo_raw_postprocessor import YoloRawPostprocessor
+
+
+def _yolo_ncnn_preprocessor():
+    # the ultralytics processors are imported only when a model config asks for them, the other processors
+    # work without their modules
+    from model_logic.yolo.preprocessing.yolo_ncnn_preprocessor import YoloNcnnPreprocessor
+    return YoloNcnnPreprocessor()
+
+
+def _yolo_ncnn_postprocessor():
+    from model_logic.yolo.postprocessing.yolo_ncnn_postprocessor import YoloNcnnPostprocessor
+    return YoloNcnnPostprocessor()
 
 
 class ProcessorFactory:
     def __init__(self):
         self.processors = {
-            "YoloNcnnPreprocessor" : YoloNcnnPreprocessor,
-            "YoloNcnnPostprocessor": YoloNcnnPostprocessor,
-        }
\ No newline at end of file
+            "YoloNcnnPreprocessor" : _yolo_ncnn_preprocessor,
+            "YoloNcnnPostprocessor": _yolo_ncnn_postprocessor,
+            "LetterboxPreprocessor": LetterboxPreprocessor,
+            "YoloRawPostprocessor": YoloRawPostprocessor,
+        }
@@ -0,0 +1,9 @@
+from stream.schedulers import RoundRobinScheduler, WeightedFairScheduler
+
+
+class SchedulerFactory:
+    def __init__(self):
+        self.schedulers = {
+            'round_robin': RoundRobinScheduler,
+            'weighted_fair': WeightedFairScheduler,
+        }
@@ -0,0 +1,10 @@
+from mqtt_logic.serializers import JsonSerializer, BinarySerializer, MsgpackSerializer
+
+
+class SerializerFactory:
+    def __init__(self):
+        self.serializers = {
+            'json': JsonSerializer,
+            'binary': BinarySerializer,
+            'msgpack': MsgpackSerializer
+        }
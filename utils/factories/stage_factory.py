@@ -0,0 +1,16 @@
+from pipeline.stages import CaptureStage, PreprocessStage, InferStage, PostprocessStage, AnnotateStage, \
+    FilterStage, EncodeStage, PublishStage
+
+
+class StageFactory:
+    def __init__(self):
+        self.stages = {
+            'capture': CaptureStage,
+            'preprocess': PreprocessStage,
+            'infer': InferStage,
+            'postprocess': PostprocessStage,
+            'annotate': AnnotateStage,
+            'filter': FilterStage,
+            'encode': EncodeStage,
+            'publish': PublishStage,
+        }
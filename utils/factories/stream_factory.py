@@ -0,0 +1,12 @@
+from stream.stream_types.camera_stream import CameraStream
+from stream.stream_types.file_stream import FileStream
+from stream.stream_types.http_stream import HTTPStream
+
+
+class StreamFactory:
+    def __init__(self):
+        self.streams = {
+            'http': HTTPStream,
+            'camera': CameraStream,
+            'file': FileStream,
+        }
@@ -0,0 +1,98 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+from utils.metrics.registry import REGISTRY
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes every few seconds would flood the output
+        pass
+
+
+class MetricsServer:
+    """
+    Serves the registry on http://host:port/metrics for Prometheus to scrape. Runs on its own daemon thread,
+    nothing is computed between scrapes.
+    """
+
+    def __init__(self, registry=REGISTRY, host="127.0.0.1", port=9108):
+        """
+        :param registry: MetricsRegistry to serve
+        :param host: interface to listen on, localhost by default
+        :param port: port to listen on, 0 picks a free one
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.registry = self.registry
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True)
+        self.thread.start()
+        print(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.server = None
+
+
+class StatsPublisher:
+    """
+    Publishes a stats snapshot every `interval` seconds, e.g. as JSON on an MQTT stats topic.
+    """
+
+    def __init__(self, snapshot_fn, publish_fn, interval=10.0):
+        """
+        :param snapshot_fn: callable() -> stats dict
+        :param publish_fn: callable(stats dict)
+        :param interval: seconds between two snapshots
+        """
+        self.snapshot_fn = snapshot_fn
+        self.publish_fn = publish_fn
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name="StatsPublisher", daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.publish_fn(self.snapshot_fn())
+            except Exception as e:
+                print(f"StatsPublisher: failed to publish stats: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
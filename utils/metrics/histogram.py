@@ -0,0 +1,182 @@
+import math
+import threading
+import time
+
+
+class Histogram:
+    """
+    Log-linear bucketed histogram in the spirit of HDR histograms.
+
+    Bucket boundaries grow geometrically by `1 + precision`, so every recorded value lands in a bucket whose
+    width is at most `precision` of the value. Memory is fixed at creation time and recording is a single
+    log and an increment under a lock, cheap enough for per-frame hot paths.
+    """
+
+    def __init__(self, lowest=1e-6, highest=100.0, precision=0.05):
+        """
+        :param lowest: smallest value tracked with full precision, smaller values go in the first bucket
+        :param highest: largest value tracked, larger values go in the last bucket
+        :param precision: relative bucket width
+        """
+        self.lowest = lowest
+        self.highest = highest
+        self._log_base = math.log1p(precision)
+        self._bucket_count = int(math.ceil(math.log(highest / lowest) / self._log_base)) + 2
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * self._bucket_count
+            self.count = 0
+            self.total = 0.0
+            self.min = None
+            self.max = None
+
+    def _bucket_index(self, value):
+        if value <= self.lowest:
+            return 0
+        if value >= self.highest:
+            return self._bucket_count - 1
+        return int(math.log(value / self.lowest) / self._log_base) + 1
+
+    def _bucket_value(self, index):
+        """Upper bound of a bucket, used as the reported value for percentiles."""
+        if index == 0:
+            return self.lowest
+        return min(self.lowest * math.exp(index * self._log_base), self.highest)
+
+    def record(self, value):
+        """
+        Record a single value.
+        """
+        index = self._bucket_index(value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        """
+        :param percent: percentile in [0, 100]
+        :return: value at the percentile or None if nothing was recorded
+        """
+        with self._lock:
+            if self.count == 0:
+                return None
+            target = max(1, int(math.ceil(self.count * percent / 100.0)))
+            seen = 0
+            for index, bucket_count in enumerate(self.counts):
+                seen += bucket_count
+                if seen >= target:
+                    return min(self._bucket_value(index), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def merge(self, other):
+        """
+        Add the values recorded in another histogram with the same lowest, highest and precision.
+        """
+        with other._lock:
+            counts, count, total, low, high = list(other.counts), other.count, other.total, other.min, other.max
+        with self._lock:
+            for index, bucket_count in enumerate(counts):
+                if bucket_count:
+                    self.counts[index] += bucket_count
+            self.count += count
+            self.total += total
+            if low is not None and (self.min is None or low < self.min):
+                self.min = low
+            if high is not None and (self.max is None or high > self.max):
+                self.max = high
+
+    def snapshot(self):
+        """
+        :return: dict with count, mean, min, max, p50, p95 and p99
+        """
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class _Timing:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.record(time.perf_counter() - self.start)
+        return False
+
+
+class ShardedHistogram:
+    """
+    Histogram for hot paths recorded from many threads. Every thread records into its own shard, so the lock a
+    record takes is never contended; the shards are only merged when the histogram is read.
+    """
+
+    def __init__(self, lowest=1e-6, highest=100.0, precision=0.05):
+        self._params = (lowest, highest, precision)
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _new_shard(self):
+        shard = Histogram(*self._params)
+        with self._shards_lock:
+            self._shards.append(shard)
+        self._local.shard = shard
+        return shard
+
+    def record(self, value):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._new_shard()
+        shard.record(value)
+
+    def time(self):
+        """
+        Context manager recording the time spent in its block with the monotonic perf_counter clock.
+        """
+        return _Timing(self)
+
+    def merged(self):
+        """
+        :return: Histogram holding the values of every shard
+        """
+        merged = Histogram(*self._params)
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            merged.merge(shard)
+        return merged
+
+    def reset(self):
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            shard.reset()
+
+    def snapshot(self):
+        """
+        :return: dict with count, mean, min, max, p50, p95 and p99 over all threads
+        """
+        return self.merged().snapshot()
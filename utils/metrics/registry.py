@@ -0,0 +1,169 @@
+"""
+Process wide metrics registry, rendered in the Prometheus text format by utils.metrics.exporter.
+
+Three kinds of metrics:
+    histogram - ShardedHistogram, exported as a Prometheus summary (quantiles, _sum and _count)
+    counter   - Counter incremented by the code that owns it
+    callback  - gauge or counter whose value is read from a function when the metrics are collected, used for
+                queue depths and for the drop counters the components already keep
+Metrics are keyed by name and labels, asking for the same histogram or counter twice returns the same object.
+"""
+import threading
+
+from utils.metrics.histogram import ShardedHistogram
+
+# quantiles exported for every histogram
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Counter:
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    return repr(float(value))
+
+
+class MetricsRegistry:
+
+    def __init__(self, prefix="objectdetect_"):
+        """
+        :param prefix: prepended to every metric name in the Prometheus output
+        """
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        # name -> (kind, help), the first registration of a name sets both
+        self._families = {}
+        # name -> {labels tuple: metric}
+        self._metrics = {}
+
+    def _get(self, name, kind, help_text, labels, create):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family_kind, _ = self._families.setdefault(name, (kind, help_text))
+            if family_kind != kind:
+                raise ValueError(f"Metric {name} is already registered as a {family_kind}")
+            metrics = self._metrics.setdefault(name, {})
+            if key not in metrics or kind in ("gauge_callback", "counter_callback"):
+                metrics[key] = create()
+            return metrics[key]
+
+    def histogram(self, name, help_text="", **labels):
+        """
+        :return: ShardedHistogram for the name and labels
+        """
+        return self._get(name, "summary", help_text, labels, ShardedHistogram)
+
+    def counter(self, name, help_text="", **labels):
+        """
+        :return: Counter for the name and labels
+        """
+        return self._get(name, "counter", help_text, labels, Counter)
+
+    def callback(self, name, function, kind="gauge", help_text="", **labels):
+        """
+        Register a function read at collection time, registering the same name and labels again replaces it.
+        :param function: callable() -> number
+        :param kind: 'gauge' or 'counter'
+        """
+        if kind not in ("gauge", "counter"):
+            raise ValueError(f"Unsupported callback metric kind: {kind}")
+        self._get(name, f"{kind}_callback", help_text, labels, lambda: function)
+
+    def unregister(self, name):
+        with self._lock:
+            self._families.pop(name, None)
+            self._metrics.pop(name, None)
+
+    def reset(self):
+        """
+        Zero every histogram and counter, e.g. between two benchmark runs. Callbacks read state owned elsewhere
+        and are left alone.
+        """
+        for _, kind, _, metrics in self._items():
+            for _, metric in metrics:
+                if kind == "summary":
+                    metric.reset()
+                elif kind == "counter":
+                    with metric._lock:
+                        metric.value = 0
+
+    def _items(self):
+        with self._lock:
+            return [(name, kind, help_text, list(self._metrics.get(name, {}).items()))
+                    for name, (kind, help_text) in self._families.items()]
+
+    @staticmethod
+    def _read(kind, metric):
+        if kind == "counter":
+            return metric.value
+        try:
+            return metric()
+        except Exception:
+            # a component that is stopped or not started yet
+            return None
+
+    def render_prometheus(self):
+        """
+        :return: all metrics in the Prometheus text exposition format (version 0.0.4)
+        """
+        lines = []
+        for name, kind, help_text, metrics in self._items():
+            full_name = self.prefix + name
+            prometheus_kind = kind.replace("_callback", "")
+            if help_text:
+                lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {prometheus_kind}")
+            for key, metric in metrics:
+                labels = dict(key)
+                if kind != "summary":
+                    lines.append(f"{full_name}{_format_labels(labels)} {_format_value(self._read(kind, metric))}")
+                    continue
+                histogram = metric.merged()
+                for quantile in QUANTILES:
+                    quantile_labels = dict(labels, quantile=str(quantile))
+                    lines.append(f"{full_name}{_format_labels(quantile_labels)} "
+                                 f"{_format_value(histogram.percentile(quantile * 100))}")
+                lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_value(histogram.total)}")
+                lines.append(f"{full_name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        :return: dict of name -> {label values joined with ',' -> value or histogram snapshot}, JSON serializable
+        """
+        snapshot = {}
+        for name, kind, _, metrics in self._items():
+            family = snapshot[name] = {}
+            for key, metric in metrics:
+                label = ",".join(str(value) for _, value in key)
+                family[label] = metric.snapshot() if kind == "summary" else self._read(kind, metric)
+        return snapshot
+
+
+REGISTRY = MetricsRegistry()
+
+
+def stage_timer(stage):
+    """
+    Latency histogram of a hot path stage, record with `with STAGE_TIMER.time():`.
+    :param stage: stage label, e.g. 'preprocess'
+    """
+    return REGISTRY.histogram("stage_seconds", "Time spent per call of a processing stage", stage=stage)